@@ -0,0 +1,97 @@
+import hashlib
+import json
+import logging
+import os
+
+import cv2
+import numpy as np
+from ultralytics.utils.plotting import Annotator, colors
+
+from image_cache import MemoryLRUCache, DiskLRUCache
+from image_decode import decode_image
+from metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+ANNOTATED_LINE_WIDTH = 5
+ANNOTATED_JPEG_QUALITY = 90
+
+
+def render_annotations(image_bgr: np.ndarray, detections: list, line_width: int = ANNOTATED_LINE_WIDTH,
+                       scale: float = 1.0) -> np.ndarray:
+    # Draws detections the same way result.plot(conf=True, labels=True, boxes=True) did,
+    # but from our detection dicts, so human edits (bbox, defect_type) show up in the overlay.
+    # scale maps stored (full-resolution) boxes onto a resized image_bgr.
+    annotator = Annotator(
+        np.ascontiguousarray(image_bgr).copy(),
+        line_width=max(1, round(line_width * scale)),
+        example=[det["defect_type"] for det in detections] or "abc",
+    )
+    # ultralytics draws the lowest-confidence box first
+    for det in reversed(detections):
+        box = [v * scale for v in det["bbox"]]
+        label = f"{det['defect_type']} {det['confidence'] / (10**10):.2f}"
+        annotator.box_label(box, label, color=colors(det["defect_id"], True))
+    return annotator.result()
+
+
+class AnnotatedImageService:
+    """Renders annotated views on request from the current detections, behind memory and disk LRU caches."""
+
+    def __init__(self, source_dir: str, cache_dir: str,
+                 memory_bytes: int = 128 * 1024 * 1024, disk_bytes: int = 1024 * 1024 * 1024):
+        self.source_dir = source_dir
+        self.memory_cache = MemoryLRUCache(memory_bytes)
+        self.disk_cache = DiskLRUCache(cache_dir, disk_bytes)
+
+    def cache_key(self, image_name: str, detections: list, size: int = None) -> str:
+        # Covers everything that affects the pixels: source file, the drawn fields of every
+        # detection and the output size. Any edit on this image produces a new key.
+        source_path = os.path.join(self.source_dir, image_name)
+        st = os.stat(source_path)
+        drawn = [(det["defect_id"], det["defect_type"], det["confidence"], det["bbox"]) for det in detections]
+        raw = f"{image_name}|{st.st_size}|{st.st_mtime_ns}|{json.dumps(drawn)}|{size}|{ANNOTATED_LINE_WIDTH}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get_annotated(self, image_name: str, detections: list, size: int = None, key: str = None) -> bytes:
+        # Returns JPEG bytes; size (if given) is the max side of the returned image
+        key = key or self.cache_key(image_name, detections, size)
+
+        data = self.memory_cache.get(key)
+        if data is not None:
+            return data
+
+        data = self.disk_cache.get(key)
+        if data is None:
+            data = self._render(image_name, detections, size)
+            self.disk_cache.put(key, data)
+        self.memory_cache.put(key, data)
+        return data
+
+    def _render(self, image_name: str, detections: list, size: int = None) -> bytes:
+        source_path = os.path.join(self.source_dir, image_name)
+        if not os.path.isfile(source_path):
+            raise FileNotFoundError(f"Source image not found: {source_path}")
+        # Boxes are in the raw sensor frame, so EXIF rotation must not be applied (cv2.imread would)
+        image_bgr = decode_image(source_path).bgr
+
+        # Resize before drawing, so small previews don't pay for full-resolution plotting
+        scale = 1.0
+        if size:
+            h, w = image_bgr.shape[:2]
+            scale = min(1.0, size / max(h, w))
+            if scale < 1:
+                image_bgr = cv2.resize(image_bgr, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                       interpolation=cv2.INTER_AREA)
+
+        with stage_timer("render"):
+            annotated = render_annotations(image_bgr, detections, scale=scale)
+        with stage_timer("annotated_save"):
+            ok, encoded = cv2.imencode(".jpg", annotated, [cv2.IMWRITE_JPEG_QUALITY, ANNOTATED_JPEG_QUALITY])
+        if not ok:
+            raise ValueError(f"Failed to encode annotated image for {image_name}")
+        return encoded.tobytes()
+
+    def clear(self):
+        self.memory_cache.clear()
+        self.disk_cache.clear()
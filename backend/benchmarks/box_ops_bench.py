@@ -0,0 +1,116 @@
+"""Micro-benchmark: box_ops (NumPy) against the pure-Python NMS the tkinter HITL tool used to run.
+
+    python benchmarks/box_ops_bench.py [--sizes 10 100 1000] [--repeat 20] [--json report.json]
+
+For every box count, random clustered boxes are generated once and both implementations run on
+the same input; the kept indices are checked to be identical before timings are reported.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box_ops import box_iou, nms  # noqa: E402
+
+
+def python_iou(box1, box2):
+    x1 = max(box1[0], box2[0])
+    y1 = max(box1[1], box2[1])
+    x2 = min(box1[2], box2[2])
+    y2 = min(box1[3], box2[3])
+
+    inter_area = max(0, x2 - x1) * max(0, y2 - y1)
+    box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
+    union_area = box1_area + box2_area - inter_area
+
+    return inter_area / union_area if union_area > 0 else 0
+
+
+def python_nms(boxes, scores, iou_threshold):
+    # The tool's previous implementation: sort, pop(0), rebuild the list with a nested iou()
+    detections = sorted(
+        ([*box, score, i] for i, (box, score) in enumerate(zip(boxes, scores))),
+        key=lambda x: x[4], reverse=True,
+    )
+    keep = []
+    while detections:
+        best = detections.pop(0)
+        keep.append(best[5])
+        detections = [d for d in detections if python_iou(best, d) <= iou_threshold]
+    return keep
+
+
+def python_iou_matrix(boxes_a, boxes_b):
+    return [[python_iou(a, b) for b in boxes_b] for a in boxes_a]
+
+
+def random_boxes(n, rng, image_size=1280):
+    # Boxes around a few centres, so NMS has real overlaps to suppress
+    centres = rng.uniform(0, image_size, size=(max(1, n // 10), 2))
+    xy = centres[rng.integers(0, len(centres), n)] + rng.normal(0, 20, size=(n, 2))
+    wh = rng.uniform(20, 120, size=(n, 2))
+    boxes = np.concatenate([xy - wh / 2, xy + wh / 2], axis=1).clip(0, image_size).astype(np.float32)
+    return boxes, rng.uniform(0.1, 0.5, n).astype(np.float32)
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--iou", type=float, default=0.3, help="NMS threshold (the tool uses 0.3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    rows = []
+    print(f"{'boxes':>6} {'op':<10} {'python ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for n in args.sizes:
+        boxes, scores = random_boxes(n, rng)
+        box_list, score_list = boxes.tolist(), scores.tolist()
+
+        if python_nms(box_list, score_list, args.iou) != nms(boxes, scores, args.iou).tolist():
+            sys.exit(f"NMS results differ at {n} boxes")
+
+        cases = {
+            "nms": (lambda: python_nms(box_list, score_list, args.iou), lambda: nms(boxes, scores, args.iou)),
+            "iou_matrix": (lambda: python_iou_matrix(box_list, box_list), lambda: box_iou(boxes, boxes)),
+        }
+        for op, (python_fn, numpy_fn) in cases.items():
+            # The pure-Python IoU matrix is quadratic; fewer runs keep 1000 boxes reasonable
+            repeat = max(1, args.repeat // (10 if n >= 1000 else 1))
+            python_best, _ = best_of(python_fn, repeat)
+            numpy_best, _ = best_of(numpy_fn, args.repeat)
+            row = {
+                "boxes": n,
+                "op": op,
+                "python_ms": round(python_best * 1000, 3),
+                "numpy_ms": round(numpy_best * 1000, 3),
+                "speedup": round(python_best / numpy_best, 1),
+            }
+            rows.append(row)
+            print(f"{n:>6} {op:<10} {row['python_ms']:>10} {row['numpy_ms']:>10} {row['speedup']:>7}x")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Accuracy / latency parity between the PyTorch and ONNX Runtime backends.
+
+    python benchmarks/onnx_parity.py --model models/HQx1280.pt --images "../tkinter gui app/test_images" [--int8]
+
+Every image goes through PlantDefectDetector.predict() and OnnxDetector.predict(). Boxes are
+matched greedily (same class, highest IoU first); the report lists per-image box counts, matches,
+mean IoU of matched boxes, max confidence difference and latency of both backends.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from box_ops import box_iou  # noqa: E402
+from model_handler import PlantDefectDetector  # noqa: E402
+from onnx_backend import OnnxDetector  # noqa: E402
+
+
+def match_detections(reference, candidate, iou_threshold):
+    # Greedy one-to-one matching of same-class boxes -> list of (iou, confidence difference)
+    if not reference or not candidate:
+        return []
+    ious = box_iou([d["bbox"] for d in reference], [d["bbox"] for d in candidate])
+    same_class = np.equal.outer([d["defect_id"] for d in reference], [d["defect_id"] for d in candidate])
+    ious = np.where(same_class, ious, 0.0)
+
+    matches = []
+    for flat in np.argsort(-ious, axis=None):
+        i, j = np.unravel_index(flat, ious.shape)
+        if ious[i, j] < iou_threshold:
+            break
+        if np.isnan(ious[i, j]):
+            continue
+        conf_diff = abs(reference[i]["confidence"] - candidate[j]["confidence"]) / 1e10
+        matches.append((float(ious[i, j]), conf_diff))
+        ious[i, :] = np.nan
+        ious[:, j] = np.nan
+    return matches
+
+
+def timed_predict(detector, image, conf):
+    t0 = time.perf_counter()
+    detections = detector.predict(image, conf_threshold=conf)
+    return detections, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="models/HQx1280.pt")
+    parser.add_argument("--images", default=os.path.join("..", "tkinter gui app", "test_images"))
+    parser.add_argument("--int8", action="store_true", help="compare against the int8 quantized export")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--match-iou", type=float, default=0.5, help="min IoU for two boxes to count as the same")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the per-image report here")
+    args = parser.parse_args()
+
+    names = sorted(f for f in os.listdir(args.images) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    names = names[:args.limit] if args.limit else names
+    if not names:
+        sys.exit(f"No images found in {args.images}")
+
+    torch_detector = PlantDefectDetector(args.model)
+    torch_detector.load_model()
+    onnx_detector = OnnxDetector(args.model, int8=args.int8, num_threads=args.threads)
+    onnx_detector.load_model()
+    for detector in (torch_detector, onnx_detector):
+        detector.warmup()
+
+    rows = []
+    print(f"{'image':<52} {'pt':>4} {'onnx':>4} {'match':>5} {'mean IoU':>8} {'max dconf':>9} {'pt ms':>8} {'onnx ms':>8}")
+    for name in names:
+        image = np.array(Image.open(os.path.join(args.images, name)).convert("RGB"))
+        torch_dets, torch_seconds = timed_predict(torch_detector, image, args.conf)
+        onnx_dets, onnx_seconds = timed_predict(onnx_detector, image, args.conf)
+        matches = match_detections(torch_dets, onnx_dets, args.match_iou)
+
+        row = {
+            "image": name,
+            "pytorch_boxes": len(torch_dets),
+            "onnx_boxes": len(onnx_dets),
+            "matched": len(matches),
+            "mean_iou": round(statistics.mean(m[0] for m in matches), 4) if matches else None,
+            "max_conf_diff": round(max(m[1] for m in matches), 4) if matches else None,
+            "pytorch_ms": round(torch_seconds * 1000, 1),
+            "onnx_ms": round(onnx_seconds * 1000, 1),
+        }
+        rows.append(row)
+        print(f"{name[:52]:<52} {row['pytorch_boxes']:>4} {row['onnx_boxes']:>4} {row['matched']:>5} "
+              f"{row['mean_iou'] if row['mean_iou'] is not None else '-':>8} "
+              f"{row['max_conf_diff'] if row['max_conf_diff'] is not None else '-':>9} "
+              f"{row['pytorch_ms']:>8} {row['onnx_ms']:>8}")
+
+    total_pt = sum(r["pytorch_boxes"] for r in rows)
+    total_onnx = sum(r["onnx_boxes"] for r in rows)
+    total_matched = sum(r["matched"] for r in rows)
+    ious = [r["mean_iou"] for r in rows if r["mean_iou"] is not None]
+    summary = {
+        "backend": "onnx-int8" if args.int8 else "onnx",
+        "images": len(rows),
+        # Share of PyTorch boxes the ONNX backend reproduced, and vice versa
+        "recall_vs_pytorch": round(total_matched / total_pt, 4) if total_pt else None,
+        "precision_vs_pytorch": round(total_matched / total_onnx, 4) if total_onnx else None,
+        "mean_iou": round(statistics.mean(ious), 4) if ious else None,
+        "identical_box_count_images": sum(1 for r in rows if r["pytorch_boxes"] == r["onnx_boxes"] == r["matched"]),
+        "pytorch_p50_ms": round(statistics.median(r["pytorch_ms"] for r in rows), 1),
+        "onnx_p50_ms": round(statistics.median(r["onnx_ms"] for r in rows), 1),
+    }
+    summary["speedup_p50"] = round(summary["pytorch_p50_ms"] / summary["onnx_p50_ms"], 2)
+
+    print()
+    for key, value in summary.items():
+        print(f"{key:<28} {value}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"summary": summary, "images": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Throughput of bulk inference vs. number of worker processes.
+
+    python benchmarks/process_pool_scaling.py --model models/HQx1280.pt --images uploaded_img --workers 1,2,4,8
+
+For each worker count, a fresh InferencePool is started (start-up and weight loading are
+reported separately, then every worker runs one warmup shard) and the whole image list is
+pushed through it. Prints images/s, speedup over one worker and parallel efficiency.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process_pool import InferencePool  # noqa: E402
+
+
+def list_images(image_dir, limit=None):
+    paths = sorted(
+        os.path.join(image_dir, f) for f in os.listdir(image_dir)
+        if f.lower().endswith(('.jpg', '.jpeg', '.png'))
+    )
+    return paths[:limit] if limit else paths
+
+
+def run(model_path, paths, workers, torch_threads, shard_size, conf_threshold):
+    t0 = time.time()
+    pool = InferencePool(model_path, workers=workers, torch_threads=torch_threads)
+    try:
+        # One shard per worker so every process has loaded its weights before timing starts
+        warmup = (paths * workers)[:workers * shard_size]
+        list(pool.detect(warmup, conf_threshold=conf_threshold, shard_size=shard_size, batch_size=shard_size))
+        startup_seconds = time.time() - t0
+
+        t0 = time.time()
+        errors = sum(1 for _, _, error, _ in pool.detect(
+            paths, conf_threshold=conf_threshold, shard_size=shard_size, batch_size=shard_size) if error)
+        seconds = time.time() - t0
+    finally:
+        pool.shutdown()
+
+    return {
+        "workers": workers,
+        "torch_threads": torch_threads,
+        "images": len(paths),
+        "errors": errors,
+        "startup_seconds": round(startup_seconds, 3),
+        "seconds": round(seconds, 3),
+        "images_per_second": round(len(paths) / seconds, 3) if seconds else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="models/HQx1280.pt")
+    parser.add_argument("--images", default="uploaded_img")
+    parser.add_argument("--limit", type=int, default=None, help="use only the first N images")
+    parser.add_argument("--workers", default=None,
+                        help="comma separated worker counts (default: powers of two up to the core count)")
+    parser.add_argument("--torch-threads", type=int, default=1)
+    parser.add_argument("--shard-size", type=int, default=4)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the results here")
+    args = parser.parse_args()
+
+    paths = list_images(args.images, args.limit)
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(",")]
+    else:
+        cores = os.cpu_count() or 1
+        worker_counts = [1 << i for i in range(cores.bit_length()) if (1 << i) * args.torch_threads <= cores]
+
+    rows = []
+    print(f"{len(paths)} images, {args.torch_threads} torch thread(s) per worker")
+    print(f"{'workers':>7} {'startup s':>9} {'run s':>8} {'img/s':>8} {'speedup':>8} {'efficiency':>10}")
+    for workers in worker_counts:
+        row = run(args.model, paths, workers, args.torch_threads, args.shard_size, args.conf)
+        base = rows[0]["images_per_second"] if rows else row["images_per_second"]
+        base_workers = rows[0]["workers"] if rows else workers
+        row["speedup"] = round(row["images_per_second"] / base, 2)
+        row["efficiency"] = round(row["speedup"] * base_workers / workers, 2)
+        rows.append(row)
+        print(f"{workers:>7} {row['startup_seconds']:>9.2f} {row['seconds']:>8.2f} "
+              f"{row['images_per_second']:>8.2f} {row['speedup']:>7.2f}x {row['efficiency']:>10.0%}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"model": args.model, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+"""Reproducible benchmarks for the backend hot paths, offline and on CPU.
+
+    python benchmarks/run_benchmarks.py [--scales 1000 10000 100000] [--detector stub|real|all]
+                                        [--model models/HQx1280.pt] [--json report.json]
+                                        [--baseline baseline.json] [--tolerance 0.2]
+
+Every scenario runs in a subprocess of its own, in a throwaway working directory that main.py is
+imported from (its paths are relative), and is driven through FastAPI's TestClient:
+
+- inference/<detector>: POST /detect (whole frame, tiled, and bursts of --burst concurrent
+  uploads) and /bulk-detect jobs over --bulk-images images, with an empty and with a warm
+  detection cache. "stub" is the real detector with the forward pass replaced by seeded
+  synthetic boxes, so decoding, tiling, rendering and bookkeeping are all measured; "real"
+  loads --model and is skipped when the weights file is missing. The difference between the
+  two is the network itself.
+- metadata/<scale>: a synthetic store of <scale> images (~3 detections each) and the paths that
+  grow with it: seeding the store, load_all, GET /metadata (whole list and one page, response
+  cache cleared first), validate / update-detection / delete, convert_to_yolov11 and
+  POST /convert-yolov11.
+
+Each case reports iterations, throughput (items/s), p50/p99/mean latency and peak RSS sampled
+while it runs, written as JSON with --json. With --baseline, cases are matched to an earlier
+report; any whose p50 grew or throughput fell by more than --tolerance is listed as a
+regression and the exit status is 1.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from importlib import metadata as package_metadata
+
+import numpy as np
+import psutil
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Class names of the exported dataset (yolo_converter.DATA_YAML); used by the stub and the synthetic store
+CLASS_NAMES = ["BrownSpot", "Browning", "BurnedTip", "Curling", "Purpling", "Wilting", "Yellowing"]
+STUB_MODEL = "stub"
+# Input size the stub reports, so encoded images take the same reduced-decode path as a 640 model
+STUB_INPUT_SIZE = 640
+# Mean synthetic boxes per image, for the stub detector and the synthetic store alike
+MEAN_BOXES = 3
+# Distinct JPEGs behind the synthetic store; every image name is a hardlink to one of them
+METADATA_SOURCE_IMAGES = 8
+METADATA_IMAGE_SIZE = (640, 480)
+RSS_SAMPLE_SECONDS = 0.005
+JOB_POLL_SECONDS = 0.01
+
+
+# ---- synthetic inputs ----------------------------------------------------
+
+def synthetic_jpeg(width, height, seed, quality=90) -> bytes:
+    # Smooth colour fields plus mild noise: decodes and compresses like a photo, unlike pure noise
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    freq = rng.uniform(0.002, 0.02, size=(3, 2))
+    base = rng.uniform(60, 190, size=3)
+    image = np.stack([
+        base[c] + 50 * np.sin(x * freq[c, 0]) + 50 * np.cos(y * freq[c, 1]) for c in range(3)
+    ], axis=-1)
+    image += rng.normal(0, 6, size=image.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(image.clip(0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def synthetic_boxes(rng, count, width, height):
+    # (count, 4) xyxy boxes of 2-15% of the frame, inside the frame
+    centres = rng.uniform(0, 1, size=(count, 2)) * (width, height)
+    sizes = rng.uniform(0.02, 0.15, size=(count, 2)) * (width, height)
+    boxes = np.concatenate([centres - sizes / 2, centres + sizes / 2], axis=1)
+    return boxes.clip(0, (width, height, width, height))
+
+
+def synthetic_metadata(scale, rng):
+    """`scale` image entries shaped like /bulk-detect results, with unique confidences.
+
+    Confidences double as detection handles in the validate / delete endpoints, so they are a
+    permutation spread over 0.05..0.99 rather than random draws.
+    """
+    width, height = METADATA_IMAGE_SIZE
+    counts = rng.poisson(MEAN_BOXES, size=scale)
+    total = int(counts.sum())
+    step = int(0.94 * 10**10) // max(total, 1)
+    confidences = int(0.05 * 10**10) + rng.permutation(total) * step
+    classes = rng.integers(0, len(CLASS_NAMES), size=total)
+
+    entries, k = [], 0
+    for i, count in enumerate(counts):
+        boxes = synthetic_boxes(rng, int(count), width, height).round(2)
+        detections = []
+        for box in boxes:
+            detections.append({
+                "defect_id": int(classes[k]),
+                "defect_type": CLASS_NAMES[classes[k]],
+                "confidence": int(confidences[k]),
+                "bbox": box.tolist(),
+                "status": "unvalidated",
+            })
+            k += 1
+        entries.append({
+            "uploaded_img": f"img_{i:06d}.jpg",
+            "detections": detections,
+            "defect_count": len(detections),
+            "width": width,
+            "height": height,
+        })
+    return entries
+
+
+# ---- detectors -----------------------------------------------------------
+
+def stub_detector_class():
+    from model_handler import PlantDefectDetector
+    from box_ops import clip_boxes
+
+    class StubDetector(PlantDefectDetector):
+        """The real detector with the network swapped for seeded synthetic boxes (see _detect)."""
+
+        def load_model(self):
+            self.weights_hash = STUB_MODEL
+            self.input_size = STUB_INPUT_SIZE
+            self.is_loaded = True
+
+        def warmup(self, size: int = 640):
+            pass
+
+        def _detect(self, images_bgr: list, conf_threshold: float):
+            outputs = []
+            for image in images_bgr:
+                height, width = image.shape[:2]
+                # Seeded by the pixels, so the same image (or tile) always gets the same boxes
+                rng = np.random.default_rng(int(image[::64, ::64].sum()))
+                count = int(rng.poisson(MEAN_BOXES))
+                boxes = clip_boxes(synthetic_boxes(rng, count, width, height).astype(np.float32), width, height)
+                confs = rng.uniform(max(conf_threshold, 0.01), 1.0, size=count)
+                classes = rng.integers(0, len(CLASS_NAMES), size=count)
+                outputs.append([
+                    {
+                        "defect_id": int(defect_id),
+                        "defect_type": CLASS_NAMES[defect_id],
+                        "confidence": int(float(conf) * (10**10)),
+                        "bbox": box.tolist(),
+                        "status": "unvalidated"
+                    }
+                    for box, conf, defect_id in zip(boxes, confs, classes)
+                ])
+            return outputs
+
+    return StubDetector
+
+
+class StubRegistry:
+    """Stands in for ModelRegistry: one always-loaded stub detector."""
+
+    def __init__(self):
+        self.detector = stub_detector_class()(STUB_MODEL)
+        self.detector.load_model()
+
+    def available(self):
+        return {STUB_MODEL: STUB_MODEL}
+
+    def get(self, name):
+        from model_registry import UnknownModel
+        if name != STUB_MODEL:
+            raise UnknownModel(name)
+        return self.detector
+
+    def status(self):
+        return [{"name": STUB_MODEL, "loaded": True}]
+
+
+def use_detector(main, kind, model_path):
+    # Points main at the stub or at a registry holding only model_path
+    if kind == STUB_MODEL:
+        main.model_registry = StubRegistry()
+        main.DEFAULT_MODEL = STUB_MODEL
+    else:
+        from model_registry import ModelRegistry
+        main.model_registry = ModelRegistry(os.path.dirname(model_path), max_loaded=1)
+        main.DEFAULT_MODEL = os.path.splitext(os.path.basename(model_path))[0]
+
+
+# ---- measurement ---------------------------------------------------------
+
+class PeakRss:
+    """Samples this process's RSS on a background thread while a case runs."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._process.memory_info().rss)
+
+    def __enter__(self):
+        self.start = self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+
+def measure(case, fn, iterations, items=1, setup=None):
+    """Runs fn(i) iterations times; setup(i), if given, runs first and is not timed.
+
+    items is how many units (images, requests) one call handles, for the throughput figure.
+    """
+    latencies = []
+    with PeakRss() as memory:
+        for i in range(iterations):
+            if setup is not None:
+                setup(i)
+            t0 = time.perf_counter()
+            fn(i)
+            latencies.append(time.perf_counter() - t0)
+    seconds = np.array(latencies)
+    return {
+        "case": case,
+        "iterations": iterations,
+        "items_per_iteration": items,
+        "throughput_per_s": round(iterations * items / seconds.sum(), 3),
+        "p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(seconds, 99)) * 1000, 3),
+        "mean_ms": round(float(seconds.mean()) * 1000, 3),
+        "peak_rss_mb": round(memory.peak / 1e6, 1),
+        "rss_growth_mb": round((memory.peak - memory.start) / 1e6, 1),
+    }
+
+
+def expect(response, status=200):
+    # A benchmark of an error path is worse than no benchmark
+    if response.status_code != status:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path} returned "
+                           f"{response.status_code}: {response.text[:200]}")
+    return response
+
+
+# ---- scenarios -----------------------------------------------------------
+
+def inference_cases(main, client, args):
+    width, height = args.image_size
+    upload = synthetic_jpeg(width, height, args.seed)
+    results = []
+
+    def detect(tiled):
+        def run(i):
+            expect(client.post("/detect", files={"file": ("bench.jpg", upload, "image/jpeg")},
+                               data={"tiled": "true" if tiled else "false"}))
+        return run
+
+    for case, tiled in (("detect", False), ("detect_tiled", True)):
+        detect(tiled)(0)  # warm up: first request pays for lazy predictor setup
+        results.append(measure(case, detect(tiled), args.detect_requests))
+
+    # --burst concurrent uploads at once, which the /detect batcher turns into shared forward passes
+    with ThreadPoolExecutor(args.burst) as executor:
+        def burst(i):
+            list(executor.map(detect(False), range(args.burst)))
+        results.append(measure("detect_burst", burst, args.repeat, items=args.burst))
+
+    for i in range(args.bulk_images):
+        with open(os.path.join("uploaded_img", f"bulk_{i:04d}.jpg"), "wb") as f:
+            f.write(synthetic_jpeg(width, height, args.seed + 1 + i))
+
+    def bulk_detect(i):
+        job_id = expect(client.post("/bulk-detect", json={"model": main.DEFAULT_MODEL})).json()["job_id"]
+        while True:
+            job = expect(client.get(f"/jobs/{job_id}", params={"timings": "false"})).json()
+            if job["status"] in ("completed", "failed", "cancelled"):
+                break
+            time.sleep(JOB_POLL_SECONDS)
+        if job["status"] != "completed" or job["errors"]:
+            raise RuntimeError(f"bulk-detect job {job['status']}: {job['errors'][:3]}")
+
+    # Cold: every image goes through the model; cached: content hashes hit the detection cache
+    results.append(measure("bulk_detect", bulk_detect, args.repeat, items=args.bulk_images,
+                           setup=lambda i: main.detection_cache.clear()))
+    results.append(measure("bulk_detect_cached", bulk_detect, args.repeat, items=args.bulk_images))
+    return results
+
+
+def link_metadata_images(entries, args):
+    sources = []
+    for i in range(METADATA_SOURCE_IMAGES):
+        path = os.path.join("sources", f"source_{i}.jpg")
+        with open(path, "wb") as f:
+            f.write(synthetic_jpeg(*METADATA_IMAGE_SIZE, args.seed + i, quality=80))
+        sources.append(path)
+    for i, entry in enumerate(entries):
+        os.link(sources[i % len(sources)], os.path.join("uploaded_img", entry["uploaded_img"]))
+
+
+def metadata_cases(main, client, scale, args):
+    from yolo_converter import convert_to_yolov11
+
+    rng = np.random.default_rng(args.seed)
+    entries = synthetic_metadata(scale, rng)
+    link_metadata_images(entries, args)
+    detections = [(entry["uploaded_img"], det) for entry in entries for det in entry["detections"]]
+    n = min(args.requests, len(detections) // 2)
+    picks = rng.choice(len(detections), size=2 * n, replace=False)
+    to_validate, to_delete = [detections[k] for k in picks[:n]], [detections[k] for k in picks[n:]]
+    # /update-detection treats detection_id 0 as missing, so class 0 boxes can't be targeted there
+    updatable = [d for d in detections if d[1]["defect_id"] != 0]
+    to_update = [updatable[k] for k in rng.choice(len(updatable), size=n, replace=False)]
+
+    results = [measure("metadata_seed", lambda i: main.store.sync_images(entries), 1, items=scale)]
+    results.append(measure("metadata_load_all", lambda i: main.store.load_all(), args.repeat, items=scale))
+
+    def clear_response_cache(i):
+        with main.metadata_response_cache_lock:
+            main.metadata_response_cache.clear()
+
+    results.append(measure("get_metadata", lambda i: expect(client.get("/metadata")), args.repeat,
+                           items=scale, setup=clear_response_cache))
+    page = {"cursor": scale // 2, "limit": 100}
+    results.append(measure("get_metadata_page", lambda i: expect(client.get("/metadata", params=page)),
+                           args.requests, setup=clear_response_cache))
+
+    results.append(measure("validate_detection", lambda i: expect(client.patch(
+        f"/detections/{to_validate[i][1]['confidence']}/validate", json={"decision": "correct"})), n))
+
+    def update(i):
+        image_name, det = to_update[i]
+        x1, y1, x2, y2 = det["bbox"]
+        expect(client.patch("/update-detection", json={
+            "image_name": image_name, "detection_id": det["defect_id"], "bbox": [x1 + 1, y1 + 1, x2 + 1, y2 + 1],
+        }))
+
+    results.append(measure("update_detection", update, n))
+    results.append(measure("delete_detection", lambda i: expect(client.delete(
+        f"/detections/{to_delete[i][1]['confidence']}")), n))
+
+    metadata = main.store.load_all()
+    output_dir = os.path.join("exports", "direct")
+    results.append(measure("convert_to_yolov11", lambda i: convert_to_yolov11(metadata, output_dir),
+                           args.repeat, items=scale,
+                           setup=lambda i: shutil.rmtree(output_dir, ignore_errors=True)))
+
+    def clear_exports(i):
+        for name in os.listdir(main.EXPORT_DIR):
+            if name.startswith("yolov11_format"):
+                shutil.rmtree(os.path.join(main.EXPORT_DIR, name))
+
+    # Includes plan_yolov11_export and content hashing; the hash index is cold on the first run only
+    results.append(measure("convert_yolov11_endpoint", lambda i: expect(client.post("/convert-yolov11", json={})),
+                           args.repeat, items=scale, setup=clear_exports))
+    return results
+
+
+def run_scenario(name, args):
+    # Runs in a fresh subprocess: main.py resolves every path against the working directory
+    kind, _, param = name.partition(":")
+    workdir = tempfile.mkdtemp(prefix="plant-bench-")
+    os.chdir(workdir)
+    for d in ("uploaded_img", "processed_img", "models", "cache", "sources", "exports", "yolov11"):
+        os.makedirs(d, exist_ok=True)
+    try:
+        import main
+        from fastapi.testclient import TestClient
+        # Per-request INFO logging would be part of every timing
+        logging.disable(logging.INFO)
+
+        use_detector(main, param if kind == "inference" else STUB_MODEL, args.model)
+        with TestClient(main.app) as client:
+            if kind == "inference":
+                cases = inference_cases(main, client, args)
+            else:
+                cases = metadata_cases(main, client, int(param), args)
+        scale = int(param) if kind == "metadata" else None
+        detector = param if kind == "inference" else None
+        return [{"scenario": name, "detector": detector, "scale": scale, **case} for case in cases]
+    finally:
+        os.chdir(BACKEND_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ---- reporting -----------------------------------------------------------
+
+def environment():
+    def version(package):
+        try:
+            return package_metadata.version(package)
+        except package_metadata.PackageNotFoundError:
+            return None
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "memory_gb": round(psutil.virtual_memory().total / 1e9, 1),
+        "packages": {p: version(p) for p in ("numpy", "torch", "ultralytics", "fastapi", "pillow")},
+    }
+
+
+def print_results(results):
+    print(f"{'scenario':<18} {'case':<26} {'iters':>5} {'items/s':>11} {'p50 ms':>10} {'p99 ms':>10} {'peak MB':>8}")
+    for r in results:
+        print(f"{r['scenario']:<18} {r['case']:<26} {r['iterations']:>5} {r['throughput_per_s']:>11} "
+              f"{r['p50_ms']:>10} {r['p99_ms']:>10} {r['peak_rss_mb']:>8}")
+
+
+def compare(results, baseline, tolerance):
+    """Cases present in both reports, with p50 and throughput ratios (current / baseline).
+
+    A case regresses when its p50 grew, or its throughput fell, by more than tolerance.
+    """
+    previous = {(r["scenario"], r["case"]): r for r in baseline["results"]}
+    rows = []
+    for r in results:
+        base = previous.get((r["scenario"], r["case"]))
+        if base is None:
+            continue
+        p50_ratio = r["p50_ms"] / base["p50_ms"] if base["p50_ms"] else None
+        throughput_ratio = r["throughput_per_s"] / base["throughput_per_s"] if base["throughput_per_s"] else None
+        regressed = ((p50_ratio is not None and p50_ratio > 1 + tolerance)
+                     or (throughput_ratio is not None and throughput_ratio < 1 / (1 + tolerance)))
+        rows.append({
+            "scenario": r["scenario"],
+            "case": r["case"],
+            "p50_ratio": round(p50_ratio, 3) if p50_ratio is not None else None,
+            "throughput_ratio": round(throughput_ratio, 3) if throughput_ratio is not None else None,
+            "peak_rss_mb_delta": round(r["peak_rss_mb"] - base["peak_rss_mb"], 1),
+            "regressed": regressed,
+        })
+    return rows
+
+
+def print_comparison(rows, baseline_path):
+    print(f"\nAgainst {baseline_path} (ratios are current / baseline)")
+    print(f"{'scenario':<18} {'case':<26} {'p50':>7} {'items/s':>8} {'peak MB':>8}")
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        print(f"{row['scenario']:<18} {row['case']:<26} {row['p50_ratio']:>7} {row['throughput_ratio']:>8} "
+              f"{row['peak_rss_mb_delta']:>+8}{flag}")
+
+
+def scenarios(args):
+    names = []
+    detectors = [STUB_MODEL, "real"] if args.detector == "all" else [args.detector]
+    for detector in detectors:
+        if detector == "real" and not os.path.isfile(args.model):
+            print(f"Skipping the real model: {args.model} not found", file=sys.stderr)
+            continue
+        names.append(f"inference:{detector}")
+    names.extend(f"metadata:{scale}" for scale in args.scales)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="synthetic store sizes, in images")
+    parser.add_argument("--detector", choices=[STUB_MODEL, "real", "all"], default="all")
+    parser.add_argument("--model", default="models/HQx1280.pt", help="weights for the real detector")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[1280, 960], metavar=("W", "H"),
+                        help="size of the synthetic /detect and /bulk-detect images")
+    parser.add_argument("--detect-requests", type=int, default=20, help="timed /detect requests per case")
+    parser.add_argument("--burst", type=int, default=8, help="concurrent /detect requests per burst")
+    parser.add_argument("--bulk-images", type=int, default=32, help="images per /bulk-detect job")
+    parser.add_argument("--requests", type=int, default=100,
+                        help="timed requests per single-detection metadata case")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of the whole-collection cases (full /metadata, convert, bulk jobs)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="write the report here")
+    parser.add_argument("--baseline", default=None, help="earlier --json report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative p50 / throughput change counted as a regression")
+    parser.add_argument("--run-scenario", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.model = os.path.abspath(args.model)
+
+    if args.run_scenario:
+        with open(args.result_file, "w") as f:
+            json.dump(run_scenario(args.run_scenario, args), f)
+        return
+
+    # Read before running, so a bad path fails fast
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in scenarios(args):
+            print(f"Running {name} ...", file=sys.stderr)
+            result_file = os.path.join(tmp, "result.json")
+            subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+                            "--run-scenario", name, "--result-file", result_file], check=True)
+            with open(result_file) as f:
+                results.extend(json.load(f))
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {k: v for k, v in vars(args).items()
+                     if k not in ("json_path", "baseline", "run_scenario", "result_file")},
+        "results": results,
+    }
+    print_results(results)
+
+    regressions = []
+    if baseline is not None:
+        report["comparison"] = compare(results, baseline, args.tolerance)
+        print_comparison(report["comparison"], args.baseline)
+        regressions = [row for row in report["comparison"] if row["regressed"]]
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if regressions:
+        sys.exit(f"{len(regressions)} case(s) regressed by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import numpy as np
+
+# Same class offset ultralytics uses for class-aware NMS (larger than any image side)
+MAX_WH = 7680
+# Up to this many boxes NMS precomputes the full IoU matrix (1024^2 float32 = 4 MB)
+NMS_MATRIX_MAX_BOXES = 1024
+
+
+def confidence_band(scores: np.ndarray, low: float, high: float) -> np.ndarray:
+    # Mask of scores strictly inside (low, high): confident enough to show, not confident enough to trust
+    scores = np.asarray(scores)
+    return (scores > low) & (scores < high)
+
+
+def clip_boxes(boxes: np.ndarray, width: int, height: int) -> np.ndarray:
+    # xyxy boxes clipped to a width x height image (returns a new array)
+    boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return boxes
+
+
+def pad_boxes(boxes: np.ndarray, padding: float, width: int, height: int) -> np.ndarray:
+    # Grows xyxy boxes by padding on every side, without leaving the image
+    boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+    boxes[:, :2] -= padding
+    boxes[:, 2:] += padding
+    return clip_boxes(boxes, width, height)
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    # Pairwise IoU of (N, 4) and (M, 4) xyxy boxes -> (N, M)
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+
+    # Per-axis 2-D broadcasts with in-place updates: no (N, M, 2) temporaries
+    inter = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    inter -= np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    np.maximum(inter, 0, out=inter)
+    height = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    height -= np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    np.maximum(height, 0, out=height)
+    inter *= height
+
+    union = area_a[:, None] + area_b[None, :]
+    union -= inter
+    np.maximum(union, 1e-9, out=union)
+    inter /= union
+    return inter
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    # Greedy NMS; returns kept indices sorted by descending score (same contract as torchvision.ops.nms)
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores), kind="stable")
+
+    if order.size <= NMS_MATRIX_MAX_BOXES:
+        # One IoU matrix up front; the greedy pass is then just boolean row ORs
+        overlaps = box_iou(boxes[order], boxes[order]) > iou_threshold
+        suppressed = np.zeros(order.size, dtype=bool)
+        keep = []
+        for i in range(order.size):
+            if not suppressed[i]:
+                keep.append(i)
+                suppressed |= overlaps[i]
+        return order[np.asarray(keep, dtype=np.int64)]
+
+    # Too many boxes for the full matrix: compare each kept box with the survivors only
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        ious = box_iou(boxes[i:i + 1], boxes[order[1:]])[0]
+        order = order[1:][ious <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    # Class-aware NMS: boxes of different classes never suppress each other
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    offsets = np.asarray(classes, dtype=np.float32)[:, None] * MAX_WH
+    return nms(boxes + offsets, scores, iou_threshold)
+
+
+def weighted_boxes_fusion(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_threshold: float):
+    # Clusters same-class boxes that overlap a cluster's fused box by more than iou_threshold
+    # (highest score first) and replaces each cluster by its score-weighted mean box.
+    # Returns (boxes, scores, classes) of the fused boxes; a fused score is its cluster's mean score.
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32)
+    classes = np.asarray(classes)
+    order = np.argsort(-scores, kind="stable")
+
+    fused_boxes, fused_classes = [], []
+    weighted_sums, score_sums, counts = [], [], []
+    for i in order:
+        match = -1
+        if fused_boxes:
+            ious = box_iou(boxes[i:i + 1], np.asarray(fused_boxes))[0]
+            ious[np.asarray(fused_classes) != classes[i]] = 0.0
+            best = int(ious.argmax())
+            if ious[best] > iou_threshold:
+                match = best
+        if match == -1:
+            fused_boxes.append(boxes[i].copy())
+            fused_classes.append(classes[i])
+            weighted_sums.append(boxes[i] * scores[i])
+            score_sums.append(float(scores[i]))
+            counts.append(1)
+        else:
+            weighted_sums[match] = weighted_sums[match] + boxes[i] * scores[i]
+            score_sums[match] += float(scores[i])
+            counts[match] += 1
+            fused_boxes[match] = weighted_sums[match] / score_sums[match]
+
+    if not fused_boxes:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), classes[:0]
+    fused_scores = np.asarray(score_sums, dtype=np.float32) / np.asarray(counts, dtype=np.float32)
+    return np.asarray(fused_boxes, dtype=np.float32), fused_scores, np.asarray(fused_classes)
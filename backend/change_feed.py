@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Change log rows read per query while a subscriber catches up
+CHANGE_BATCH_SIZE = 500
+# Comment line sent on idle streams so proxies don't time them out
+HEARTBEAT_SECONDS = 15
+# Client reconnect delay (ms) announced at the start of every stream
+RETRY_MILLISECONDS = 3000
+
+
+def format_event(event_type: str, payload: dict, event_id: int = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(payload, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class _Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+        # key -> (event_type, payload); only the newest value per key is kept
+        self.ephemeral = OrderedDict()
+        self.lock = threading.Lock()
+
+    def wake(self):
+        # Called from any thread (store writes happen in the threadpool)
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def push(self, key, event_type: str, payload: dict):
+        with self.lock:
+            self.ephemeral.pop(key, None)
+            self.ephemeral[key] = (event_type, payload)
+        self.wake()
+
+    def drain(self):
+        with self.lock:
+            events = list(self.ephemeral.values())
+            self.ephemeral.clear()
+        return events
+
+
+class ChangeFeed:
+    """Server-sent events for metadata changes.
+
+    Durable events come from the store's change log and carry its sequence number as the SSE id,
+    so a reconnecting client (Last-Event-ID) resumes exactly where it left off. Ephemeral events
+    (job progress) are coalesced per key and only go to currently connected clients.
+    """
+
+    def __init__(self, store, batch_size: int = CHANGE_BATCH_SIZE, heartbeat_seconds: float = HEARTBEAT_SECONDS):
+        self.store = store
+        self.batch_size = batch_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        store.listeners.append(self.notify)
+
+    def notify(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.wake()
+
+    def publish(self, key, event_type: str, payload: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(key, event_type, payload)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    async def events(self, since: int = None, request=None):
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            oldest, latest = await run_in_threadpool(self.store.change_seq_range)
+            if since is None:
+                # New clients just loaded /metadata; only what happens from now on is news to them
+                last_seq = latest
+            elif since > latest or (oldest is not None and since < oldest - 1):
+                # Unknown position or part of the gap already pruned: the client must reload
+                yield format_event("resync", {"seq": latest}, latest)
+                last_seq = latest
+            else:
+                last_seq = since
+
+            while True:
+                # Cleared before reading, so a write landing mid-read still wakes the next wait
+                subscriber.wakeup.clear()
+                rows = await run_in_threadpool(self.store.changes_since, last_seq, self.batch_size)
+                for seq, event_type, payload in rows:
+                    yield format_event(event_type, payload, seq)
+                    last_seq = seq
+                for event_type, payload in subscriber.drain():
+                    yield format_event(event_type, payload)
+                if len(rows) == self.batch_size:
+                    continue
+
+                if request is not None and await request.is_disconnected():
+                    break
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
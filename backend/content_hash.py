@@ -0,0 +1,83 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileHashIndex:
+    """Remembers the sha256 of files keyed by (size, mtime), so unchanged files are never re-read."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_file_hashes_sha256 ON file_hashes (sha256)")
+
+    def hash_file(self, path: str) -> str:
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path = ?", (key,)
+            ).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+
+        sha = sha256_file(path)
+        self.record(path, sha, st)
+        return sha
+
+    def record(self, path: str, sha: str, st: os.stat_result = None):
+        # Lets callers that already hashed a file (e.g. while writing it) skip the re-read
+        st = st or os.stat(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(path), st.st_size, st.st_mtime_ns, sha),
+            )
+
+    def find_path(self, sha: str, directory: str = None):
+        # A file we've seen with this content that is still on disk unchanged, or None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns FROM file_hashes WHERE sha256 = ?", (sha,)
+            ).fetchall()
+        directory = os.path.abspath(directory) if directory else None
+        for path, size, mtime_ns in rows:
+            if directory and os.path.dirname(path) != directory:
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                return path
+        return None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
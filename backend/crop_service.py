@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import os
+
+import cv2
+
+from image_cache import MemoryLRUCache, DiskLRUCache
+from image_decode import decode_image
+from metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+CROP_PADDING = 100
+CROP_TRIM_SQUARE_MARGIN = 20
+CROP_JPEG_QUALITY = 90
+
+
+def cut_crop(image_bgr, x1, y1, x2, y2, padding=CROP_PADDING, make_square=True,
+             trim_square_margin=CROP_TRIM_SQUARE_MARGIN):
+    # Handles cropping and padding (same rules the old crop_handler used when it wrote crops during predict)
+    h, w = image_bgr.shape[:2]
+
+    # Add padding but keep inside image boundaries
+    x1 = max(0, x1 - padding)
+    y1 = max(0, y1 - padding)
+    x2 = min(w, x2 + padding)
+    y2 = min(h, y2 + padding)
+
+    # Crop
+    crop = image_bgr[y1:y2, x1:x2]
+
+    # Make crop square if requested
+    if make_square:
+        crop_h, crop_w = crop.shape[:2]
+        if crop_h != crop_w:
+            size = min(crop_h, crop_w)  # keep smaller dimension
+            y_center, x_center = crop_h // 2, crop_w // 2
+            half = size // 2
+
+            # crop to centered square
+            x1_sq = max(0, x_center - half)
+            x2_sq = x1_sq + size
+            y1_sq = max(0, y_center - half)
+            y2_sq = y1_sq + size
+            crop = crop[y1_sq:y2_sq, x1_sq:x2_sq]
+
+        # trim border inside the square if margin allows
+        if trim_square_margin > 0:
+            crop_h, crop_w = crop.shape[:2]
+            if crop_h > 2 * trim_square_margin and crop_w > 2 * trim_square_margin:
+                crop = crop[
+                    trim_square_margin:crop_h - trim_square_margin,
+                    trim_square_margin:crop_w - trim_square_margin
+                ]
+
+    return crop
+
+
+class CropService:
+    """Cuts defect crops from the source image on request, behind memory and disk LRU caches."""
+
+    def __init__(self, source_dir: str, cache_dir: str,
+                 memory_bytes: int = 64 * 1024 * 1024, disk_bytes: int = 512 * 1024 * 1024):
+        self.source_dir = source_dir
+        self.memory_cache = MemoryLRUCache(memory_bytes)
+        self.disk_cache = DiskLRUCache(cache_dir, disk_bytes)
+
+    def cache_key(self, image_name: str, bbox: list, size: int = None) -> str:
+        # The bbox is part of the key, so editing a detection's box never serves a stale crop;
+        # so is the source file's size and mtime, so a re-upload under the same name doesn't either
+        st = os.stat(os.path.join(self.source_dir, image_name))
+        raw = (f"{image_name}|{st.st_size}|{st.st_mtime_ns}|{[round(v, 2) for v in bbox]}|{size}"
+               f"|{CROP_PADDING}|{CROP_TRIM_SQUARE_MARGIN}")
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get_crop(self, image_name: str, bbox: list, size: int = None, key: str = None) -> bytes:
+        # Returns JPEG bytes; size (if given) is the max side of the returned crop
+        key = key or self.cache_key(image_name, bbox, size)
+
+        data = self.memory_cache.get(key)
+        if data is not None:
+            return data
+
+        data = self.disk_cache.get(key)
+        if data is None:
+            data = self._render(image_name, bbox, size)
+            self.disk_cache.put(key, data)
+        self.memory_cache.put(key, data)
+        return data
+
+    def _render(self, image_name: str, bbox: list, size: int = None) -> bytes:
+        source_path = os.path.join(self.source_dir, image_name)
+        if not os.path.isfile(source_path):
+            raise FileNotFoundError(f"Source image not found: {source_path}")
+        # Same frame the boxes were detected in: EXIF rotation is not applied (cv2.imread would)
+        image_bgr = decode_image(source_path).bgr
+
+        with stage_timer("crop_write"):
+            x1, y1, x2, y2 = map(int, bbox)
+            crop = cut_crop(image_bgr, x1, y1, x2, y2)
+
+            if size:
+                crop_h, crop_w = crop.shape[:2]
+                scale = size / max(crop_h, crop_w)
+                if scale < 1:
+                    crop = cv2.resize(crop, (max(1, round(crop_w * scale)), max(1, round(crop_h * scale))),
+                                      interpolation=cv2.INTER_AREA)
+
+            ok, encoded = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, CROP_JPEG_QUALITY])
+        if not ok:
+            raise ValueError(f"Failed to encode crop for {image_name}")
+        return encoded.tobytes()
+
+    def clear(self):
+        self.memory_cache.clear()
+        self.disk_cache.clear()
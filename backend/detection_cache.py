@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DetectionCache:
+    """Persistent cache of model outputs keyed by (image content hash, model identity, conf threshold)."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS detection_cache (
+                    image_sha256 TEXT NOT NULL,
+                    model_id TEXT NOT NULL,
+                    conf_threshold TEXT NOT NULL,
+                    detections TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (image_sha256, model_id, conf_threshold)
+                )"""
+            )
+
+    @staticmethod
+    def _conf_key(conf_threshold: float) -> str:
+        return f"{float(conf_threshold):.6f}"
+
+    def get(self, image_sha256: str, model_id: str, conf_threshold: float):
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT detections FROM detection_cache
+                   WHERE image_sha256 = ? AND model_id = ? AND conf_threshold = ?""",
+                (image_sha256, model_id, self._conf_key(conf_threshold)),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"detections": json.loads(row[0])}
+
+    def put(self, image_sha256: str, model_id: str, conf_threshold: float, detections: list):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO detection_cache
+                   (image_sha256, model_id, conf_threshold, detections, created_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (image_sha256, model_id, self._conf_key(conf_threshold),
+                 json.dumps(detections), time.time()),
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM detection_cache")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
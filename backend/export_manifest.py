@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ID_PATTERN = re.compile(r"^[0-9_]+$")
+
+
+class UnknownExport(KeyError):
+    pass
+
+
+class ExportManifests:
+    """One JSON manifest per dataset export: {arcname: sha256} of every file it contained.
+
+    A later export can be made "since" an earlier one, carrying only the files whose hash
+    changed plus the list of files that disappeared.
+    """
+
+    def __init__(self, manifest_dir: str):
+        self.manifest_dir = manifest_dir
+        self._lock = threading.Lock()
+        self._reserved = set()  # ids handed out for exports still being written
+
+    def _path(self, export_id: str) -> str:
+        if not EXPORT_ID_PATTERN.match(export_id or ""):
+            raise UnknownExport(export_id)
+        return os.path.join(self.manifest_dir, f"{export_id}.json")
+
+    def load(self, export_id: str) -> dict:
+        try:
+            with open(self._path(export_id), "r") as f:
+                return json.load(f)["files"]
+        except FileNotFoundError:
+            raise UnknownExport(export_id)
+
+    def reserve(self) -> str:
+        # Export ids are timestamps (same format as the export folders), made unique within a second.
+        # A reserved id only becomes a usable "since" baseline once save() records its manifest.
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        with self._lock:
+            export_id, n = timestamp, 1
+            while export_id in self._reserved or os.path.exists(self._path(export_id)):
+                n += 1
+                export_id = f"{timestamp}_{n}"
+            self._reserved.add(export_id)
+        return export_id
+
+    def release(self, export_id: str):
+        # The export never completed; its id is dropped without a manifest
+        with self._lock:
+            self._reserved.discard(export_id)
+
+    def save(self, export_id: str, files: dict, since: str = None):
+        # Call once the export has been fully written / sent
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        manifest = {"export_id": export_id, "since": since,
+                    "created_at": datetime.now().strftime("%Y%m%d_%H%M%S"), "files": files}
+        tmp_path = self._path(export_id) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path(export_id))
+        self.release(export_id)
+        logger.info(f"Saved export manifest {export_id} ({len(files)} files)")
+
+    def list(self) -> list:
+        if not os.path.isdir(self.manifest_dir):
+            return []
+        exports = []
+        for name in sorted(os.listdir(self.manifest_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(self.manifest_dir, name), "r") as f:
+                manifest = json.load(f)
+            exports.append({
+                "export_id": manifest["export_id"],
+                "since": manifest["since"],
+                "created_at": manifest["created_at"],
+                "files": len(manifest["files"]),
+            })
+        return exports
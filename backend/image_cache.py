@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryLRUCache:
+    """In-process LRU of encoded images, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._items[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+
+class DiskLRUCache:
+    """Directory of cached files, bounded by total bytes; least recently used files are deleted first."""
+
+    def __init__(self, cache_dir: str, max_bytes: int, suffix: str = ".jpg"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.current_bytes = 0
+        self._index = OrderedDict()  # key -> size, oldest first
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Rebuild the index from what is already on disk, oldest access first
+        entries = []
+        for name in os.listdir(cache_dir):
+            if not name.endswith(suffix):
+                continue
+            st = os.stat(os.path.join(cache_dir, name))
+            entries.append((st.st_mtime, name[:-len(suffix)], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.current_bytes += size
+        self._evict()
+
+    def _path(self, key: str):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self.current_bytes -= size
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        # mtime doubles as last-access time so the order survives restarts
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old
+            self._index[key] = len(data)
+            self.current_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self.current_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._index):
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            self._index.clear()
+            self.current_bytes = 0
@@ -0,0 +1,85 @@
+import io
+import os
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from metrics import stage_timer
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 size by skipping DCT coefficients, which is
+# several times cheaper than a full decode the model would downscale anyway. Largest factor first.
+REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+# Boxes live in the raw sensor frame (see yolo_converter.image_size), so EXIF rotation is never
+# applied, the same as the PIL path this replaces
+ORIENTATION_FLAGS = cv2.IMREAD_IGNORE_ORIENTATION
+JPEG_MAGIC = b"\xff\xd8"
+
+
+class DecodedImage(NamedTuple):
+    bgr: np.ndarray  # contiguous uint8 (h, w, 3), ready for the model without another copy
+    width: int       # size of the source frame, which detections are reported in
+    height: int
+    scale: int       # source pixels per decoded pixel; 1 for a full-resolution decode
+
+
+def reduction_factor(width: int, height: int, target_side: int) -> int:
+    # Largest JPEG scale factor that keeps the longest side at or above target_side
+    if not target_side:
+        return 1
+    for factor in REDUCED_FLAGS:
+        if max(width, height) / factor >= target_side:
+            return factor
+    return 1
+
+
+def _decode_with_pil(source) -> np.ndarray:
+    # Formats OpenCV can't read; also the path that reports a useful error for broken files
+    with Image.open(source if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)) as image:
+        return cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+def decode_image(source, target_side: int = None) -> DecodedImage:
+    """Decodes a file path or encoded bytes straight to a contiguous BGR array.
+
+    With target_side (the model's input size), a JPEG at least twice that size is decoded at
+    reduced scale instead of full resolution; its longest side never drops below target_side.
+    Boxes found on the result go back to the source frame with to_source_coordinates().
+    """
+    with stage_timer("image_decode"):
+        if isinstance(source, (str, os.PathLike)):
+            data = np.fromfile(source, dtype=np.uint8)
+        else:
+            data = np.frombuffer(source, dtype=np.uint8)
+
+        factor = 1
+        if target_side and data[:2].tobytes() == JPEG_MAGIC:
+            # Only the header is parsed here
+            with Image.open(source if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)) as header:
+                width, height = header.size
+            factor = reduction_factor(width, height, target_side)
+
+        flags = REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR
+        image_bgr = cv2.imdecode(data, flags | ORIENTATION_FLAGS) if data.size else None
+        if image_bgr is None:
+            image_bgr, factor = _decode_with_pil(source), 1
+        if factor == 1:
+            height, width = image_bgr.shape[:2]
+    return DecodedImage(image_bgr, width, height, factor)
+
+
+def to_source_coordinates(detections: list, decoded: DecodedImage) -> list:
+    # Decoded-pixel boxes -> source-frame boxes (in place); a no-op for full-resolution decodes
+    if decoded.scale == 1:
+        return detections
+    scale, width, height = decoded.scale, decoded.width, decoded.height
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        det["bbox"] = [min(x1 * scale, width), min(y1 * scale, height),
+                       min(x2 * scale, width), min(y2 * scale, height)]
+    return detections
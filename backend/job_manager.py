@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, params: dict, listener=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"  # queued -> running -> completed / failed / cancelled
+        self.total = 0
+        self.processed = 0
+        self.timings = []  # per-image {"image", "seconds"}
+        self.errors = []   # per-image {"image", "error"} plus job-level failures
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        # listener(job) is called on every status change and processed image
+        self._listener = listener
+
+    def notify(self):
+        if self._listener is not None:
+            try:
+                self._listener(self)
+            except Exception as e:
+                logger.error(f"Job listener failed: {e}")
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def is_finished(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+    def cancel(self):
+        # A job that hasn't started is finished right away; a running one stops at its next check
+        with self._lock:
+            self._cancel_event.set()
+            if self.status != "queued":
+                return
+            self.status = "cancelled"
+            self.finished_at = time.time()
+        self.notify()
+
+    def start(self) -> bool:
+        # queued -> running, unless the job was cancelled while it waited
+        with self._lock:
+            if self.status != "queued":
+                return False
+            self.status = "running"
+            self.started_at = time.time()
+        self.notify()
+        return True
+
+    def check_cancelled(self):
+        # Called by the job function between units of work
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def record_image(self, image_name: str, seconds: float, error: str = None):
+        with self._lock:
+            self.processed += 1
+            self.timings.append({"image": image_name, "seconds": round(seconds, 4)})
+            if error:
+                self.errors.append({"image": image_name, "error": error})
+        self.notify()
+
+    def to_dict(self, include_timings: bool = True):
+        with self._lock:
+            data = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "params": self.params,
+                "status": self.status,
+                "total": self.total,
+                "processed": self.processed,
+                "progress": (self.processed / self.total * 100) if self.total else 0.0,
+                "errors": list(self.errors),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "result": self.result,
+            }
+            if include_timings:
+                data["timings"] = list(self.timings)
+        return data
+
+
+class JobManager:
+    """Runs long jobs (e.g. bulk detection) on a bounded thread pool so the event loop stays free."""
+
+    def __init__(self, max_workers: int = 1, max_pending: int = 16, keep_finished: int = 100, listener=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self.listener = listener
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn, params: dict = None) -> Job:
+        # fn(job) does the work; it should update job.total, call job.record_image()
+        # and job.check_cancelled() as it goes, and return a JSON-able summary
+        with self._lock:
+            if self.queue_depth() >= self.max_pending:
+                raise JobQueueFull(f"Too many pending jobs (max {self.max_pending})")
+            job = Job(kind, params or {}, listener=self.listener)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        logger.info(f"Submitted {kind} job {job.id}")
+        job.notify()
+        return job
+
+    def _run(self, job: Job, fn):
+        if not job.start():
+            return  # cancelled before a worker got to it
+        try:
+            job.result = fn(job)
+            job.status = "cancelled" if job.cancel_requested else "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.errors.append({"image": None, "error": str(e)})
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            logger.info(f"Job {job.id} {job.status} ({job.processed}/{job.total})")
+            job.notify()
+
+    def _prune(self):
+        # Drop the oldest finished jobs once we hold more than keep_finished of them
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None and not job.is_finished:
+            job.cancel()
+        return job
+
+    def queue_depth(self):
+        return sum(1 for job in self._jobs.values() if not job.is_finished)
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,43 +1,89 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Body, Path
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Body, Path, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 import shutil
 import tempfile
+import gzip
+import hashlib
+from collections import OrderedDict
+from urllib.parse import quote
 import time
 import logging
+import threading
 import uvicorn
 from contextlib import asynccontextmanager
-from PIL import Image
-import io
-import numpy as np
+import cv2
 import os
 from datetime import datetime
 from typing import List
 import json
 
-from model_handler import PlantDefectDetector
-from yolo_converter import convert_to_yolov11
+from model_registry import ModelRegistry, UnknownModel
+from process_pool import InferencePool
+from yolo_converter import (convert_to_yolov11, image_size, plan_yolov11_export, manifest_for,
+                            changed_since, stream_yolov11_zip)
+from export_manifest import ExportManifests, UnknownExport
+from job_manager import JobManager, JobQueueFull, JobCancelled
+from content_hash import FileHashIndex
+from detection_cache import DetectionCache
+from metadata_store import MetadataStore
+from crop_service import CropService
+from annotation_renderer import AnnotatedImageService, ANNOTATED_JPEG_QUALITY
+from thumbnailer import Thumbnailer, snap_size
+from change_feed import ChangeFeed
+from tiling import MERGE_METHODS
+from review_queue import ReviewQueue
+from metrics import (RequestTimer, detect_batch_queue_depth, detect_batch_size, job_queue_depth,
+                     render_metrics, stage_timer)
+from image_decode import decode_image
+from request_batcher import RequestBatcher, BatchQueueFull, BatchQueueTimeout
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-detector = PlantDefectDetector("models/HQx1280.pt")
+# Every models/*.pt is selectable by name (file stem) and loaded on first use.
+# Only a few stay resident; the least recently used one is dropped to make room.
+MODELS_DIR = "models"
+DEFAULT_MODEL = "HQx1280"
+MAX_LOADED_MODELS = 2
+MODEL_MEMORY_BUDGET_BYTES = 4 * 1024**3
+# "pytorch" runs the .pt weights; "onnx" / "onnx-int8" run them through ONNX Runtime
+# (exported once per weights file and cached under ONNX_CACHE_DIR)
+INFERENCE_BACKEND = "pytorch"
+ONNX_CACHE_DIR = os.path.join("cache", "onnx")
+model_registry = ModelRegistry(MODELS_DIR, max_loaded=MAX_LOADED_MODELS,
+                               memory_budget_bytes=MODEL_MEMORY_BUDGET_BYTES,
+                               backend=INFERENCE_BACKEND, onnx_cache_dir=ONNX_CACHE_DIR)
+
+def get_detector(model_name):
+    try:
+        return model_registry.get(model_name or DEFAULT_MODEL)
+    except UnknownModel:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{model_name}'")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Loading model from startup...")
     start_time = time.time()
     try: 
-        detector.load_model()
+        # Only the default model is loaded (and warmed up) eagerly, the rest on first request
+        detector = model_registry.get(DEFAULT_MODEL)
         elapsed = time.time() - start_time
         logger.info(f"Model {detector.model_path} successfully loaded in {elapsed:.2f} seconds")
     except Exception as e:
         logger.error(f"error loading model: {e}")
         raise
+    # One-shot import of the old JSON metadata file, if it is still around
+    store.migrate_from_json(metadata_path)
     yield
 
     logger.info("app is shutting down...")
+    await detect_batcher.close()
+    job_manager.shutdown()
+    shutdown_inference_pool()
 
 app = FastAPI(title="Plant Defect Detection API", lifespan=lifespan)
 
@@ -47,93 +93,348 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Content-Disposition", "X-Export-Id", "X-Change-Seq"],
 )
 
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    # Concurrency and latency per route template (not per concrete path, to keep label sets small)
+    timer = RequestTimer(request.method)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        timer.finish(route.path if route is not None else "unmatched", status)
+
 # Serve the outputs folder as static files
 app.mount("/uploaded_img", StaticFiles(directory="uploaded_img"), name="uploaded_img")
 app.mount("/processed_img", StaticFiles(directory="processed_img"), name="processed_img")
+# Legacy JSON metadata, only read once to migrate it into the SQLite store
 metadata_path = os.path.join("processed_img", "detection_metadata.json")
+store = MetadataStore(os.path.join("processed_img", "detections.db"))
+# Pushes metadata deltas (and job progress) to connected clients, see /changes
+change_feed = ChangeFeed(store)
+
+# Unvalidated detections handed to reviewers most-uncertain first, see /review/next.
+# Bands are (low, high, weight) on the model confidence; quotas cap leases out per class.
+REVIEW_BANDS = [(0.1, 0.5, 1.0)]
+REVIEW_CLASS_QUOTAS = {}
+REVIEW_LEASE_SECONDS = 300
+review_queue = ReviewQueue(store, bands=REVIEW_BANDS, class_quotas=REVIEW_CLASS_QUOTAS,
+                           lease_seconds=REVIEW_LEASE_SECONDS)
+
+# Defect crops are cut from uploaded_img on request instead of being written during inference
+crop_service = CropService("uploaded_img", os.path.join("processed_img", "crops"))
+# Annotated views are rendered from the current detections on request, never during inference
+annotated_service = AnnotatedImageService("uploaded_img", os.path.join("processed_img", "annotated"))
+
+# Images per forward pass for /bulk-detect, can be overridden per request with "batch_size"
+BULK_BATCH_SIZE = 8
+
+# Sliced inference for high-resolution captures, opt-in per request with "tiled" (+ "merge"):
+# TILE_SIZE px tiles overlapping by TILE_OVERLAP, TILE_BATCH tiles per forward pass,
+# boxes merged with class-aware "nms" or "wbf"
+TILE_SIZE = 1280
+TILE_OVERLAP = 0.2
+TILE_BATCH = 4
+TILE_MERGE = "nms"
+
+def tiling_options(tiled, merge=None):
+    # predict_tiled() options for a request, or None for whole-frame inference
+    if not tiled:
+        return None
+    merge = merge or TILE_MERGE
+    if merge not in MERGE_METHODS:
+        raise HTTPException(status_code=400, detail=f"merge must be one of {MERGE_METHODS}")
+    return {"tile_size": TILE_SIZE, "overlap": TILE_OVERLAP, "tile_batch": TILE_BATCH, "merge": merge}
+
+def cache_model_id(detector, tiling):
+    # Tiled and whole-frame runs of the same model give different boxes, so they're cached apart
+    if not tiling:
+        return detector.model_id
+    return f"{detector.model_id}#tiled-{tiling['tile_size']}-{tiling['overlap']}-{tiling['merge']}"
+
+# Bulk detection runs as background jobs; inference itself is serialised by the detector,
+# so extra workers only overlap decoding/saving of one job with another
+JOB_WORKERS = 1
+MAX_PENDING_JOBS = 16
+
+def publish_job_progress(job):
+    # Progress is coalesced per job, so a slow client only ever sees the latest state
+    change_feed.publish(("job", job.id), "job_progress", job.to_dict(include_timings=False))
+
+job_manager = JobManager(max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS, listener=publish_job_progress)
+job_queue_depth.set_function(job_manager.queue_depth)
+
+# Bulk inference in worker processes (one detector each) instead of this process.
+# 0 or 1 keeps inference in the API process; each worker runs INFERENCE_TORCH_THREADS torch threads,
+# so INFERENCE_PROCESSES * INFERENCE_TORCH_THREADS should roughly match the core count.
+INFERENCE_PROCESSES = 0
+INFERENCE_TORCH_THREADS = 1
+inference_pool = None
+inference_pool_lock = threading.Lock()
+
+def get_inference_pool(model_path):
+    # One pool at a time, restarted when a job asks for a different model
+    global inference_pool
+    with inference_pool_lock:
+        if inference_pool is not None and inference_pool.model_path != model_path:
+            inference_pool.shutdown()
+            inference_pool = None
+        if inference_pool is None:
+            inference_pool = InferencePool(model_path, workers=INFERENCE_PROCESSES,
+                                           torch_threads=INFERENCE_TORCH_THREADS,
+                                           backend=INFERENCE_BACKEND, onnx_cache_dir=ONNX_CACHE_DIR)
+        return inference_pool
+
+def shutdown_inference_pool():
+    global inference_pool
+    with inference_pool_lock:
+        if inference_pool is not None:
+            inference_pool.shutdown()
+            inference_pool = None
+
+# Re-running /bulk-detect only sends images to the model whose content, model or threshold changed
+BULK_CONF_THRESHOLD = 0.25
+CACHE_DIR = "cache"
+file_hashes = FileHashIndex(os.path.join(CACHE_DIR, "file_hashes.db"))
+detection_cache = DetectionCache(os.path.join(CACHE_DIR, "detection_cache.db"))
+
+# Size-bucketed previews of uploaded/processed files; keyed by source mtime so they never go stale
+thumbnailer = Thumbnailer(os.path.join(CACHE_DIR, "thumbnails"))
+IMAGE_DIRS = {"uploaded": "uploaded_img", "processed": "processed_img"}
+# How many upcoming images (in review order) to advertise as prefetch hints
+PREFETCH_COUNT = 3
 
 @app.get("/")
 def root():
     return {"message": "hello haha world"}
 
-# New endpoint to always fetch fresh metadata
-# PLEASE OPTIMISE THIS HAHA
+# Prometheus scrape target: per-stage timings (pipeline_stage_seconds), request latency and
+# concurrency, bulk job queue depth, model load time / memory and process RSS
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+# Serialized /metadata bodies keyed by ETag (+ encoding). The ETag includes the store version,
+# so an entry can never be served after the data it was built from has changed.
+METADATA_RESPONSE_CACHE_SIZE = 32
+METADATA_GZIP_MIN_BYTES = 1024
+metadata_response_cache = OrderedDict()
+metadata_response_cache_lock = threading.Lock()
+
+def project_entry(entry, fields, detection_fields):
+    # fields / detection_fields are sets of keys to keep (None = keep everything)
+    if detection_fields is not None and "detections" in entry:
+        entry["detections"] = [
+            {k: v for k, v in det.items() if k in detection_fields} for det in entry["detections"]
+        ]
+    if fields is not None:
+        entry = {k: v for k, v in entry.items() if k in fields}
+    return entry
+
+# Metadata, with optional cursor pagination, filters and field projection.
+# Without cursor/limit the response is the plain list of images, as before.
+# Responses carry an ETag, so clients can revalidate with If-None-Match and get a 304.
 @app.get("/metadata")
-async def get_metadata():
-    metadata_path = os.path.join("processed_img", "detection_metadata.json")
-    if os.path.exists(metadata_path):
-        with open(metadata_path, "r") as f:
-            metadata = json.load(f)
-        return JSONResponse(content=metadata)
-    return JSONResponse(content={"error": "No metadata found"}, status_code=404)
+def get_metadata(request: Request, cursor: int = None, limit: int = None, status: str = None,
+                 defect_type: str = None, min_confidence: float = None, max_confidence: float = None,
+                 prefix: str = None, fields: str = None, detection_fields: str = None):
+    if limit is not None and not 1 <= limit <= 10000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 10000")
+
+    query_key = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.items()) if k != "t")
+    # Read before the data: replaying a change the body already contains is harmless, missing one is not
+    change_seq = store.change_seq_range()[1]
+    version = store.version
+    etag = f'W/"{version}-{hashlib.md5(query_key.encode()).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding",
+               "X-Change-Seq": str(change_seq)}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    cache_key = (etag, use_gzip)
+    with metadata_response_cache_lock:
+        cached = metadata_response_cache.get(cache_key)
+        if cached is not None:
+            metadata_response_cache.move_to_end(cache_key)
+    if cached is None:
+        paginated = cursor is not None or limit is not None
+        entries, next_cursor = store.query_images(
+            after_id=cursor,
+            limit=limit,
+            status=status,
+            defect_type=defect_type,
+            # confidences are stored as int(conf * 1e10)
+            min_confidence=int(min_confidence * (10**10)) if min_confidence is not None else None,
+            max_confidence=int(max_confidence * (10**10)) if max_confidence is not None else None,
+            name_prefix=prefix,
+        )
+        # A filter or projection that matches nothing is an empty result; only a plain listing of
+        # an empty store keeps the original 404
+        plain = not any(value is not None for value in (status, defect_type, min_confidence, max_confidence,
+                                                         prefix, fields, detection_fields))
+        if not entries and not paginated and plain:
+            return JSONResponse(content={"error": "No metadata found"}, status_code=404)
+
+        field_set = set(fields.split(",")) if fields else None
+        detection_field_set = set(detection_fields.split(",")) if detection_fields else None
+        entries = [project_entry(entry, field_set, detection_field_set) for entry in entries]
+        payload = {"items": entries, "next_cursor": next_cursor} if paginated else entries
+
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        encoding = None
+        if use_gzip and len(body) >= METADATA_GZIP_MIN_BYTES:
+            body = gzip.compress(body, compresslevel=5)
+            encoding = "gzip"
+        cached = (body, encoding)
+        if store.version == version:
+            with metadata_response_cache_lock:
+                metadata_response_cache[cache_key] = cached
+                while len(metadata_response_cache) > METADATA_RESPONSE_CACHE_SIZE:
+                    metadata_response_cache.popitem(last=False)
+        else:
+            # A write landed while we were reading; don't label this body with the old version
+            del headers["ETag"]
+
+    body, encoding = cached
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Server-sent events with metadata deltas: status_changed, bbox_updated, detection_deleted,
+# detection_added, image_removed, cleared and (without an id) job_progress.
+# Pass ?since=<X-Change-Seq of the /metadata response>; reconnects resume from Last-Event-ID.
+# A "resync" event means the changes since that point are no longer kept, reload /metadata.
+@app.get("/changes")
+async def get_changes(request: Request, since: int = None):
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(
+        change_feed.events(since, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 #----validation process------------------------------------------
 
-def load_metadata():
-    if not os.path.exists(metadata_path):
-        return []
-    with open(metadata_path, "r") as f:
-        metadata = json.load(f)
-    # Clean metadata: only keep detections where crop file actually exists
-    # Fix here for issue with 'healthy' image for viewing
-    cleaned_metadata = []
-    for item in metadata:
-        valid_detections = []
-        for det in item.get("detections", []):
-            crop_path = det.get("crop_path")
-            if crop_path and os.path.exists(crop_path.replace("\\", "/")):
-                valid_detections.append(det)
-        item["detections"] = valid_detections
-        cleaned_metadata.append(item)
-    return cleaned_metadata
-
-def save_metadata(metadata):
-    os.makedirs(os.path.dirname(metadata_path), exist_ok=True)
-    with open(metadata_path, "w") as f:
-        json.dump(metadata, f, indent=2)
+# Review decision -> stored detection status
+DECISION_STATUS = { "correct": "validated", "healthy": "healthy",
+                   "other": "validated", "uncertain": "uncertain",}
 
 @app.patch("/detections/{confidence}/validate")
-async def validate_detection(confidence: int, body: dict = Body(...)):
-    metadata = load_metadata()
+def validate_detection(confidence: int, body: dict = Body(...)):
     decision = body.get("decision")
-    status_map = { "correct": "validated", "healthy": "healthy", 
-                  "other": "validated", "uncertain": "uncertain",}
-    for item in metadata:
-        for det in item.get("detections", []):
-            if det.get("confidence") == confidence:
-                if decision in status_map:
-                    det["status"] = status_map[decision]
-                if decision == "other" and "defect_type" in body:
-                    det["defect_type"] = body["defect_type"]
-                # Save metadata back
-                save_metadata(metadata)
-                return {"updated": det}
-    return {"error": "Detection not found"}
+    updated = store.set_status_by_confidence(
+        confidence,
+        status=DECISION_STATUS.get(decision),
+        defect_type=body["defect_type"] if decision == "other" and "defect_type" in body else None
+    )
+    if updated is None:
+        return {"error": "Detection not found"}
+    return {"updated": updated}
 
 @app.delete("/detections/{confidence}")
-async def delete_detection(confidence: int):
-    metadata = load_metadata()
-    deleted = None
-    for item in metadata:
-        detections = item.get("detections", [])
-        for det in detections:
-            if det["confidence"] == confidence: 
-                detections.remove(det)
-                deleted = det
-                break
-        if deleted:
-            break
+def delete_detection(confidence: int):
+    deleted = store.delete_by_confidence(confidence)
     if not deleted:
         raise HTTPException(status_code=404, detail="Detection not found")
-    save_metadata(metadata)
     return {"success": True, "deleted": deleted}
 
+# Largest number of operations accepted by one /detections/batch call
+MAX_BATCH_OPERATIONS = 1000
+
+def batch_operation(index, op):
+    # Client operation -> store operation; raises HTTPException for malformed input
+    def missing(*fields):
+        return [f for f in fields if op.get(f) is None]
+
+    def target():
+        if op.get("id") is not None:
+            return {"id": op["id"]}
+        if op.get("confidence") is not None:
+            return {"confidence": op["confidence"]}
+        raise HTTPException(status_code=400, detail=f"Operation {index}: 'id' or 'confidence' is required")
+
+    kind = op.get("op")
+    if kind == "validate":
+        decision = op.get("decision")
+        if decision not in DECISION_STATUS:
+            raise HTTPException(status_code=400, detail=f"Operation {index}: unknown decision '{decision}'")
+        return {"op": "status", **target(), "status": DECISION_STATUS[decision],
+                "defect_type": op.get("defect_type") if decision == "other" else None}
+    if kind == "relabel":
+        if missing("defect_type"):
+            raise HTTPException(status_code=400, detail=f"Operation {index}: 'defect_type' is required")
+        return {"op": "status", **target(), "defect_type": op["defect_type"]}
+    if kind == "delete":
+        return {"op": "delete", **target()}
+    if kind == "update_bbox":
+        fields = missing("image_name", "detection_id", "bbox")
+        if fields:
+            raise HTTPException(status_code=400, detail=f"Operation {index}: missing {', '.join(fields)}")
+        return {"op": "bbox", "image_name": op["image_name"], "defect_id": op["detection_id"],
+                "bbox": op["bbox"], "defect_type": op.get("defect_type")}
+    raise HTTPException(status_code=400, detail=f"Operation {index}: unknown op '{kind}'")
+
+# Ordered validate / relabel / update_bbox / delete operations, applied in one transaction.
+# Body: {"operations": [...], "all_or_nothing": false}. Operation shapes:
+#   {"op": "validate", "confidence" | "id", "decision", "defect_type"?}   (same as PATCH .../validate)
+#   {"op": "relabel", "confidence" | "id", "defect_type"}
+#   {"op": "update_bbox", "image_name", "detection_id", "bbox", "defect_type"?}  (same as /update-detection)
+#   {"op": "delete", "confidence" | "id"}
+# A missing detection fails only its own operation, unless all_or_nothing is set.
+@app.post("/detections/batch")
+def apply_detection_batch(body: dict = Body(...)):
+    operations = body.get("operations")
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        raise HTTPException(status_code=400, detail="'operations' must be a list of objects")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_OPERATIONS} operations per batch")
+
+    store_operations = [batch_operation(i, op) for i, op in enumerate(operations)]
+    all_or_nothing = bool(body.get("all_or_nothing", False))
+    results = store.apply_batch(store_operations, all_or_nothing=all_or_nothing) if store_operations else []
+    failed = sum(1 for result in results if not result["ok"])
+    return {
+        "applied": not (all_or_nothing and failed),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": [{"index": i, **result} for i, result in enumerate(results)],
+    }
+
+# The n most uncertain unvalidated detections, leased to this reviewer for REVIEW_LEASE_SECONDS.
+# Leased detections aren't handed to anyone else until they are answered (validated, relabelled
+# or deleted), released, or the lease runs out.
+@app.get("/review/next")
+def review_next(n: int = 1, reviewer: str = None):
+    if not 1 <= n <= 100:
+        raise HTTPException(status_code=400, detail="n must be between 1 and 100")
+    items = []
+    for lease in review_queue.next(n, reviewer):
+        found = store.get_detection(lease["detection_id"])
+        if found is None:
+            continue  # deleted after the queue last synced
+        lease["detection"] = found[0]
+        items.append(lease)
+    return {"items": items, **review_queue.stats()}
+
+@app.delete("/review/leases/{detection_id}")
+def release_review_lease(detection_id: int):
+    if not review_queue.release(detection_id):
+        raise HTTPException(status_code=404, detail="No lease for this detection")
+    return {"success": True}
+
 # Add this new endpoint after your existing endpoints
 
 @app.patch("/update-detection")
-async def update_detection(body: dict = Body(...)):
+def update_detection(body: dict = Body(...)):
     """Update detection bbox and metadata"""
     try:
         image_name = body.get("image_name")
@@ -147,35 +448,12 @@ async def update_detection(body: dict = Body(...)):
                 detail="Missing required fields: image_name, detection_id, or bbox"
             )
 
-        # Load existing metadata
-        metadata = load_metadata()
-        
-        # Find the image and detection
-        image_found = False
-        detection_updated = False
-        
-        for image in metadata:
-            if image["uploaded_img"] == image_name:
-                image_found = True
-                for detection in image["detections"]:
-                    if detection["defect_id"] == detection_id:
-                        # Update bbox
-                        detection["bbox"] = new_bbox
-                        # Update defect type if provided
-                        if new_defect_type:
-                            detection["defect_type"] = new_defect_type
-                        detection_updated = True
-                        break
-                break
-        
-        if not image_found:
+        result = store.update_bbox(image_name, detection_id, new_bbox, new_defect_type)
+        if result == "image_not_found":
             raise HTTPException(status_code=404, detail="Image not found")
-        if not detection_updated:
+        if result == "detection_not_found":
             raise HTTPException(status_code=404, detail="Detection not found")
 
-        # Save updated metadata
-        save_metadata(metadata)
-
         return {
             "success": True,
             "message": "Detection updated successfully",
@@ -186,54 +464,201 @@ async def update_detection(body: dict = Body(...)):
             }
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating detection: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+#-----crops--------------------------------------------------------
+
+@app.get("/crops/{detection_id}")
+def get_crop(detection_id: int, request: Request, size: int = None):
+    if size is not None and not 16 <= size <= 4096:
+        raise HTTPException(status_code=400, detail="size must be between 16 and 4096")
+    found = store.get_detection(detection_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Detection not found")
+    detection, image_name = found
+
+    # The cache key covers the source file, bbox and size, so it doubles as the ETag
+    try:
+        key = crop_service.cache_key(image_name, detection["bbox"], size)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Source image not found")
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = crop_service.get_crop(image_name, detection["bbox"], size, key=key)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+def prefetch_links(image_name, url_for):
+    # Link header advertising the next images in review order, e.g. for <link rel=prefetch>
+    names = store.next_image_names(image_name, PREFETCH_COUNT)
+    return ", ".join(f"<{url_for(name)}>; rel=prefetch" for name in names)
+
+@app.get("/annotated/{image_name}")
+def get_annotated(image_name: str, request: Request, size: int = None):
+    if size is not None and not 16 <= size <= 8192:
+        raise HTTPException(status_code=400, detail="size must be between 16 and 8192")
+    size = snap_size(size)
+    entry = store.get_image(image_name)
+    if entry is None or "detections" not in entry:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    try:
+        key = annotated_service.cache_key(image_name, entry["detections"], size)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Source image not found")
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    size_query = f"?size={size}" if size else ""
+    links = prefetch_links(image_name, lambda name: f"/annotated/{quote(name)}{size_query}")
+    if links:
+        headers["Link"] = links
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    data = annotated_service.get_annotated(image_name, entry["detections"], size, key=key)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+@app.get("/images/{kind}/{image_name}")
+def get_image_file(kind: str, image_name: str, request: Request, size: int = None):
+    # Uploaded / processed files at a bucketed preview size (256/640/1280), or full size without ?size
+    folder = IMAGE_DIRS.get(kind)
+    if folder is None:
+        raise HTTPException(status_code=400, detail="Invalid image kind. Use uploaded or processed.")
+    if os.path.basename(image_name) != image_name:
+        raise HTTPException(status_code=400, detail="Invalid image name")
+    source_path = os.path.join(folder, image_name)
+    if not os.path.isfile(source_path):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    bucket = snap_size(size)
+    headers = {"Cache-Control": "no-cache"}
+    if kind == "uploaded":
+        size_query = f"?size={bucket}" if bucket else ""
+        links = prefetch_links(image_name, lambda name: f"/images/uploaded/{quote(name)}{size_query}")
+        if links:
+            headers["Link"] = links
+
+    if bucket is None:
+        return FileResponse(source_path, headers=headers)
+
+    key = thumbnailer.cache_key(source_path, bucket)
+    headers["ETag"] = f'"{key}"'
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    data = thumbnailer.get_thumbnail(source_path, bucket, key=key)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
 #-----basic process--------------------------------------------
 
+@app.get("/models")
+def list_models():
+    return {"default": DEFAULT_MODEL, "models": model_registry.status()}
+
+# Concurrent whole-frame /detect requests share forward passes: a batch goes to the model once
+# DETECT_BATCH_SIZE requests are waiting or the oldest has waited DETECT_BATCH_DELAY seconds.
+# At most DETECT_MAX_QUEUED requests wait (more get a 429, before their upload is decoded), and
+# one still waiting after DETECT_QUEUE_TIMEOUT seconds gets a 503 instead of a late answer.
+DETECT_BATCH_SIZE = 8
+DETECT_BATCH_DELAY = 0.01
+DETECT_MAX_QUEUED = 16
+DETECT_QUEUE_TIMEOUT = 10.0
+DETECT_RETRY_AFTER_SECONDS = 1
+
+def run_detect_batch(items):
+    # items: (detector, DecodedImage); requests for different models run as separate batches
+    results = [None] * len(items)
+    groups = {}
+    for i, (detector, _) in enumerate(items):
+        groups.setdefault(id(detector), []).append(i)
+    for indices in groups.values():
+        detector = items[indices[0]][0]
+        try:
+            outputs = detector.predict_batch([items[i][1] for i in indices], return_image=True,
+                                             batch_size=len(indices))
+        except Exception as e:
+            outputs = [e] * len(indices)
+        for i, output in zip(indices, outputs):
+            results[i] = output
+    return results
+
+detect_batcher = RequestBatcher(run_detect_batch, max_batch_size=DETECT_BATCH_SIZE, max_delay=DETECT_BATCH_DELAY,
+                                max_queued=DETECT_MAX_QUEUED, max_wait=DETECT_QUEUE_TIMEOUT,
+                                on_batch=detect_batch_size.observe)
+detect_batch_queue_depth.set_function(detect_batcher.queue_depth)
+
+def detect_overloaded(detail, status_code):
+    return HTTPException(status_code=status_code, detail=detail,
+                         headers={"Retry-After": str(DETECT_RETRY_AFTER_SECONDS)})
+
+def save_annotated(file_path, annotated_image):
+    # The annotated image is BGR already, so OpenCV encodes it without a channel-swapped copy
+    with stage_timer("annotated_save"):
+        if not cv2.imwrite(file_path, annotated_image, [cv2.IMWRITE_JPEG_QUALITY, ANNOTATED_JPEG_QUALITY]):
+            raise ValueError(f"Failed to write {file_path}")
+
 @app.post("/detect")
-async def detect_defects(file: UploadFile = File(...)):
+async def detect_defects(file: UploadFile = File(...), model: str = Form(None),
+                         tiled: bool = Form(False), merge: str = Form(None)):
     # from fakhrul, use as reference
     logger.info(f"Detect route endpoint was called with file: {file.filename}")
     start_time = time.time()
 
     try:
+        tiling = tiling_options(tiled, merge)
+        # Shed load before spending time on the upload
+        if not tiling and detect_batcher.is_full():
+            raise detect_overloaded(f"Too many queued requests (max {DETECT_MAX_QUEUED})", 429)
+        # Loading a cold model blocks, so resolve it off the event loop
+        detector = await run_in_threadpool(get_detector, model)
         if not detector.is_loaded:
             raise HTTPException(status_code=503, detail="model not loaded")
         
         logger.info("Analyzing image...")
         contents = await file.read()
 
+        # Straight to a contiguous BGR array; full resolution, since the annotated copy is saved.
+        # Off the event loop, so a burst of uploads decodes in parallel with batching.
         try:
-            image = Image.open(io.BytesIO(contents))
+            frame = await run_in_threadpool(decode_image, contents)
         except Exception as e:
             raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        if image.mode != 'RGB':
-            logger.info("Converting image...")
-            image = image.convert('RGB')
-
-        image_array = np.array(image)
+        del contents  # only the decoded frame is held while the request waits for a batch
 
         logger.info("Running prediction...")
-        detections, annotated_image = detector.predict(image_array, return_image=True)
+        if tiling:
+            # Tiles of one image already fill a forward pass, so tiled requests skip the batcher
+            detections, annotated_image = await run_in_threadpool(
+                detector.predict_tiled, frame, return_image=True, **tiling
+            )
+        else:
+            try:
+                detections, annotated_image = await detect_batcher.submit((detector, frame))
+            except BatchQueueFull as e:
+                raise detect_overloaded(str(e), 429)
+            except BatchQueueTimeout as e:
+                raise detect_overloaded(str(e), 503)
 
         # save image
         output_dir = "processed_img"
         os.makedirs(output_dir, exist_ok=True)
 
-        # image file name, just metadata stuff
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # image file name, just metadata stuff (microseconds, so concurrent requests don't collide)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         file_extension = os.path.splitext(file.filename)[1] if file.filename else '.jpg'
         saved_filename = f"{timestamp}_processed{file_extension}.jpg"
         file_path = os.path.join(output_dir, saved_filename)
 
-        # convert bgr to rgb back, then save image using PIL
         if annotated_image is not None:
-            annotated_rgb = annotated_image[..., ::-1]
-            annotated_pil = Image.fromarray(annotated_rgb)
-            annotated_pil.save(file_path)
+            await run_in_threadpool(save_annotated, file_path, annotated_image)
             logger.info(f"Processed image saved to: {file_path}")
         
         processing_time = time.time() - start_time
@@ -242,161 +667,386 @@ async def detect_defects(file: UploadFile = File(...)):
         return {
             "success": True,
             "filename": file.filename,
+            "model": model or DEFAULT_MODEL,
+            "tiled": tiling is not None,
             "saved_path": file_path,
             "detections": detections,
             "defect_count": len(detections),
             "processing_time": processing_time
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Detection failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/bulk-detect")
-async def bulk_detect(data: dict):
-    model_name = data.get("model", "HQx1280")  # Default to HQx1280 if not specified
-    input_dir = "uploaded_img"
-    output_dir = "processed_img"
-    os.makedirs(output_dir, exist_ok=True)
-
-    metadata_path = os.path.join(output_dir, "detection_metadata.json")
+def bulk_entry(image_file, detections, size):
+    # Only boxes are stored; the annotated view is rendered on request by /annotated/{image_name}.
+    # size (width, height) is kept so exports can normalise boxes without touching the image.
+    return {
+        "uploaded_img": image_file,
+        "detections": detections,
+        "defect_count": len(detections),
+        "width": size[0],
+        "height": size[1]
+    }
 
-    # Load old metadata if exists
-    if os.path.exists(metadata_path):
-        with open(metadata_path, "r") as f:
-            existing_metadata = {item["uploaded_img"]: item for item in json.load(f)}
-    else:
-        existing_metadata = {}
+def run_bulk_detect(job, model_name, batch_size, conf_threshold, tiling=None):
+    # Runs on a job worker thread, never on the event loop
+    input_dir = "uploaded_img"
+    # Held for the whole job, so evicting this model from the registry meanwhile is harmless
+    detector = model_registry.get(model_name)
 
-    results = []
     image_files = [f for f in os.listdir(input_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    job.total = len(image_files)
 
-    for image_file in image_files:
-        file_path = os.path.join(input_dir, image_file)
-        try:
-            image = Image.open(file_path)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            image_array = np.array(image)
-
-            detections, annotated_image = detector.predict(image_array, return_image=True)
-
-            # Reuse old processed filename if available, otherwise generate new one
-            if image_file in existing_metadata and "processed_img" in existing_metadata[image_file]:
-                annotated_filename = existing_metadata[image_file]["processed_img"]
-            else:
-                annotated_filename = f"{os.path.splitext(image_file)[0]}_processed.jpg"
+    if INFERENCE_PROCESSES > 1:
+        results, cache_hits, cancelled = bulk_detect_in_pool(job, detector, input_dir, image_files,
+                                                             batch_size, conf_threshold, tiling)
+    else:
+        results, cache_hits, cancelled = bulk_detect_in_process(job, detector, input_dir, image_files,
+                                                                batch_size, conf_threshold, tiling)
 
-            annotated_path = os.path.join(output_dir, annotated_filename)
+    # Statuses are merged inside the store's transaction, so decisions made while the job ran are kept.
+    # A cancelled run keeps the old entries for images it never reached.
+    done = {entry["uploaded_img"] for entry in results}
+    keep = {f for f in image_files if f not in done} if cancelled else set()
+    store.sync_images(results, keep=keep)
 
-            # Save/update annotated image (overwrite safely)
-            if annotated_image is not None:
-                annotated_rgb = annotated_image[..., ::-1]
-                annotated_pil = Image.fromarray(annotated_rgb)
-                annotated_pil.save(annotated_path)
+    logger.info(f"Metadata saved to: {store.db_path}")
 
-            new_entry = {
-                "uploaded_img": image_file,
-                "processed_img": annotated_filename,
-                "detections": detections,
-                "defect_count": len(detections)
-            }
-
-            # If image exists already in metadata, preserve validated statuses
-            if image_file in existing_metadata:
-                old_entry = existing_metadata[image_file]
+    return {
+        "processed": len(results),
+        "failed": sum(1 for entry in results if "error" in entry),
+        "cache_hits": cache_hits,
+        "metadata_path": store.db_path
+    }
 
-                old_detections = {d["defect_id"]: d for d in old_entry.get("detections", [])}
-                for det in new_entry["detections"]:
-                    if det["defect_id"] in old_detections:
-                        det["status"] = old_detections[det["defect_id"]].get("status", "unvalidated")
+def bulk_detect_in_process(job, detector, input_dir, image_files, batch_size, conf_threshold, tiling=None):
+    results = []
+    cancelled = False
+    cache_hits = 0
+    model_id = cache_model_id(detector, tiling)
 
-            results.append(new_entry)
+    # Decode + infer one mini-batch at a time so memory stays bounded by batch_size
+    for start in range(0, len(image_files), batch_size):
+        try:
+            job.check_cancelled()
+        except JobCancelled:
+            cancelled = True
+            break
 
+        chunk = image_files[start:start + batch_size]
+        chunk_results = [None] * len(chunk)
+        chunk_seconds = [0.0] * len(chunk)
+
+        image_hashes = [None] * len(chunk)
+        decoded = []  # (position in chunk, DecodedImage)
+        for i, image_file in enumerate(chunk):
+            file_path = os.path.join(input_dir, image_file)
+            t0 = time.time()
+            try:
+                image_hashes[i] = file_hashes.hash_file(file_path)
+                cached = detection_cache.get(image_hashes[i], model_id, conf_threshold)
+                if cached is not None:
+                    cache_hits += 1
+                    chunk_results[i] = bulk_entry(image_file, cached["detections"], image_size(file_path))
+                    chunk_seconds[i] += time.time() - t0
+                    continue
+
+                # Reduced-scale JPEG decode for whole-frame inference; tiles need full resolution
+                decoded.append((i, decode_image(file_path, None if tiling else detector.input_size)))
+            except Exception as e:
+                logger.error(f"Failed to process {image_file}: {e}")
+                chunk_results[i] = {"uploaded_img": image_file, "error": str(e)}
+            chunk_seconds[i] += time.time() - t0
+
+        t0 = time.time()
+        try:
+            if tiling:
+                # Tiles of one image already fill a forward pass
+                outputs = [
+                    detector.predict_tiled(frame, conf_threshold=conf_threshold, **tiling)
+                    for _, frame in decoded
+                ]
+            else:
+                outputs = detector.predict_batch(
+                    [frame for _, frame in decoded],
+                    conf_threshold=conf_threshold,
+                    batch_size=batch_size
+                )
+        except Exception as e:
+            logger.error(f"Batch inference failed for {[chunk[i] for i, _ in decoded]}: {e}")
+            outputs = [e] * len(decoded)
+        # Share the batch forward pass evenly between its images
+        infer_share = (time.time() - t0) / len(decoded) if decoded else 0.0
+
+        # Source sizes, not the possibly reduced decoded ones: boxes are in source pixels
+        decoded_sizes = {i: (frame.width, frame.height) for i, frame in decoded}
+        for i, output in zip(decoded_sizes, outputs):
+            image_file = chunk[i]
+            t0 = time.time()
+            try:
+                if isinstance(output, Exception):
+                    raise output
+                chunk_results[i] = bulk_entry(image_file, output, decoded_sizes[i])
+                detection_cache.put(image_hashes[i], model_id, conf_threshold, output)
+            except Exception as e:
+                logger.error(f"Failed to process {image_file}: {e}")
+                chunk_results[i] = {"uploaded_img": image_file, "error": str(e)}
+            chunk_seconds[i] += infer_share + time.time() - t0
+
+        for image_file, entry, seconds in zip(chunk, chunk_results, chunk_seconds):
+            job.record_image(image_file, seconds, entry.get("error"))
+        results.extend(chunk_results)
+
+    return results, cache_hits, cancelled
+
+def bulk_detect_in_pool(job, detector, input_dir, image_files, batch_size, conf_threshold, tiling=None):
+    # Cache lookups stay in this process (they're cheap); only misses are sharded across workers,
+    # and their results are merged as each shard comes back
+    entries = {}
+    cache_hits = 0
+    model_id = cache_model_id(detector, tiling)
+
+    misses = {}  # path -> (image_file, hash)
+    for image_file in image_files:
+        file_path = os.path.join(input_dir, image_file)
+        t0 = time.time()
+        try:
+            image_hash = file_hashes.hash_file(file_path)
+            cached = detection_cache.get(image_hash, model_id, conf_threshold)
+            if cached is None:
+                misses[file_path] = (image_file, image_hash)
+                continue
+            entries[image_file] = bulk_entry(image_file, cached["detections"], image_size(file_path))
+            cache_hits += 1
+            job.record_image(image_file, time.time() - t0)
         except Exception as e:
             logger.error(f"Failed to process {image_file}: {e}")
-            results.append({
-                "uploaded_img": image_file,
-                "error": str(e)
-            })
+            entries[image_file] = {"uploaded_img": image_file, "error": str(e)}
+            job.record_image(image_file, time.time() - t0, str(e))
 
-    # Save merged metadata
-    with open(metadata_path, "w") as f:
-        json.dump(results, f, indent=2)
+    pool = get_inference_pool(detector.model_path)
+    try:
+        for file_path, detections, error, seconds in pool.detect(
+                list(misses), conf_threshold=conf_threshold, shard_size=batch_size,
+                batch_size=batch_size, should_stop=lambda: job.cancel_requested, tiling=tiling):
+            image_file, image_hash = misses[file_path]
+            if error is None:
+                detection_cache.put(image_hash, model_id, conf_threshold, detections)
+                try:
+                    entries[image_file] = bulk_entry(image_file, detections, image_size(file_path))
+                except Exception as e:
+                    error = str(e)
+            if error is not None:
+                logger.error(f"Failed to process {image_file}: {error}")
+                entries[image_file] = {"uploaded_img": image_file, "error": error}
+            job.record_image(image_file, seconds, error)
+    except Exception as e:
+        # A crashed worker breaks the whole pool; start a fresh one on the next job
+        logger.error(f"Inference pool failed: {e}")
+        shutdown_inference_pool()
+        for image_file, _ in misses.values():
+            if image_file not in entries:
+                entries[image_file] = {"uploaded_img": image_file, "error": str(e)}
+                job.record_image(image_file, 0.0, str(e))
+
+    cancelled = job.cancel_requested and len(entries) < len(image_files)
+    # Shards finish out of order; keep the listing order so metadata ids stay stable
+    results = [entries[f] for f in image_files if f in entries]
+    return results, cache_hits, cancelled
 
-    logger.info(f"Metadata saved to: {metadata_path}")
+@app.post("/bulk-detect")
+async def bulk_detect(data: dict):
+    model_name = data.get("model") or DEFAULT_MODEL
+    if model_name not in model_registry.available():
+        raise HTTPException(status_code=404, detail=f"Unknown model '{model_name}'")
+    batch_size = int(data.get("batch_size", BULK_BATCH_SIZE))
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be >= 1")
+    conf_threshold = float(data.get("conf_threshold", BULK_CONF_THRESHOLD))
+    tiling = tiling_options(data.get("tiled"), data.get("merge"))
+
+    try:
+        job = job_manager.submit(
+            "bulk-detect",
+            lambda job: run_bulk_detect(job, model_name, batch_size, conf_threshold, tiling),
+            {"model": model_name, "batch_size": batch_size, "conf_threshold": conf_threshold, "tiling": tiling}
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
 
     return {
         "success": True,
-        "processed": len(results),
-        "results": results
+        "job_id": job.id,
+        "status": job.status
     }
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, timings: bool = True):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict(include_timings=timings)
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "job_id": job.id, "status": job.status, "cancel_requested": job.cancel_requested}
+
+# Uploads are copied from the multipart spool in chunks (never fully in memory), hashed on the way,
+# and written to a temp file that is renamed into place only once complete
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_CONCURRENCY = 4
+# Serialises the "does this name / this content already exist" check with the rename into place
+upload_lock = threading.Lock()
+
+def save_upload(fileobj, filename, input_dir):
+    # Returns (status, same_as): "saved", "skipped" (name already taken) or
+    # "deduplicated" (same bytes as an existing upload, hardlinked to it instead of stored again)
+    final_path = os.path.join(input_dir, filename)
+    fd, tmp_path = tempfile.mkstemp(dir=input_dir, prefix=".upload-", suffix=".part")
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: fileobj.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        sha = digest.hexdigest()
+
+        with upload_lock:
+            if os.path.exists(final_path):
+                return "skipped", None
+
+            existing = file_hashes.find_path(sha, directory=input_dir)
+            if existing is not None:
+                try:
+                    os.link(existing, final_path)
+                    # Same inode, same hash: bulk-detect reuses the cached detections for this name
+                    file_hashes.record(final_path, sha)
+                    return "deduplicated", os.path.basename(existing)
+                except OSError as e:
+                    logger.info(f"Hardlink not possible for {filename}, storing a copy: {e}")
+
+            os.replace(tmp_path, final_path)
+            tmp_path = None
+            file_hashes.record(final_path, sha)
+            return "saved", None
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 @app.post("/upload-images")
 async def upload_images(files: List[UploadFile] = File(...)):
     # Save multiple uploaded images to the uploaded_img folder.
     input_dir = "uploaded_img"
     os.makedirs(input_dir, exist_ok=True)
-    saved_files = []
-    skipped_files = []
-
-    for file in files:
-        saved_filename = f"{file.filename}"
-        file_path = os.path.join(input_dir, saved_filename)
-
-        # Check if file already exists
-        if os.path.exists(file_path):
-            logger.info(f"Skipped duplicate file: {file_path}")
-            skipped_files.append(saved_filename)
-            continue  # skip saving
-        # Save new file
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def save(file):
+        saved_filename = os.path.basename(file.filename or "")
+        if not saved_filename:
+            return saved_filename, "skipped", None
+        async with semaphore:
+            status, same_as = await run_in_threadpool(save_upload, file.file, saved_filename, input_dir)
+        logger.info(f"Upload {saved_filename}: {status}{f' (same as {same_as})' if same_as else ''}")
+        return saved_filename, status, same_as
 
-        logger.info(f"Image uploaded and saved to: {file_path}")
-        saved_files.append(saved_filename)
+    results = await asyncio.gather(*(save(file) for file in files))
 
     return {
         "success": True,
-        "saved_files": saved_files
+        "saved_files": [name for name, status, _ in results if status == "saved"],
+        "deduplicated_files": [
+            {"filename": name, "same_as": same_as} for name, status, same_as in results if status == "deduplicated"
+        ],
+        "skipped_files": [name for name, status, _ in results if status == "skipped"]
     }
 
+# Every export records a manifest of content hashes; passing "since" (an earlier export_id)
+# exports only files added or changed since then, plus deleted.txt for files that are gone
+EXPORT_DIR = "yolov11"
+export_manifests = ExportManifests(os.path.join(EXPORT_DIR, "manifests"))
+
+def plan_export(since):
+    # Returns (export_id, files to write, deleted list or None for a full export, manifest).
+    # The id is only reserved: the manifest is saved (and usable as "since") once the export completes.
+    try:
+        previous = export_manifests.load(since) if since else None
+    except UnknownExport:
+        raise HTTPException(status_code=404, detail=f"Unknown export '{since}'")
+    files = plan_yolov11_export(store.load_all())
+    manifest = manifest_for(files, file_hashes.hash_file)
+    deleted = None
+    if previous is not None:
+        files, deleted = changed_since(files, manifest, previous)
+    export_id = export_manifests.reserve()
+    return export_id, files, deleted, manifest
+
+def stream_export(export_id, files, deleted, manifest, since):
+    # The manifest is recorded only after the last byte of the zip was handed out; a failed or
+    # abandoned download must not become the baseline for the next ?since= export
+    completed = False
+    try:
+        yield from stream_yolov11_zip(files, deleted)
+        completed = True
+    finally:
+        if completed:
+            export_manifests.save(export_id, manifest, since=since)
+        else:
+            export_manifests.release(export_id)
+
+@app.get("/exports")
+def list_exports():
+    return {"exports": export_manifests.list()}
+
 @app.post("/convert-yolov11")
-async def convert_yolov11():
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_dir = os.path.join("yolov11",f"yolov11_format{timestamp}")
-    result = convert_to_yolov11(metadata_path, output_dir)
+def convert_yolov11(data: dict = Body(default=None)):
+    since = (data or {}).get("since")
+    export_id, files, deleted, manifest = plan_export(since)
+    output_dir = os.path.join(EXPORT_DIR, f"yolov11_format{export_id}")
+    try:
+        result = convert_to_yolov11(None, output_dir, files=files, deleted=deleted)
+    except Exception:
+        export_manifests.release(export_id)
+        raise
+    export_manifests.save(export_id, manifest, since=since)
     return {
         "status": "success",
         "output_dir": output_dir,
-        "timestamp": timestamp
+        "timestamp": export_id,
+        "export_id": export_id,
+        "since": since,
+        "exported_files": result["files"],
+        "deleted_files": len(deleted) if deleted is not None else 0
     }
 
 @app.get("/download-annotations")
-async def download_annotations():
+def download_annotations(since: str = None):
+    # The zip is generated while it is sent: no staging directory, no temp archive
     try:
-        # Step 1: Convert to YOLOv11 format
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_dir = os.path.join("yolov11", f"yolov11_format_{timestamp}")
-        os.makedirs(output_dir, exist_ok=True)
-        convert_to_yolov11(metadata_path, output_dir)
-
-        # Step 2: Zip the folder
-        zip_filename = f"annotations_{timestamp}.zip"
-        zip_path = os.path.join(tempfile.gettempdir(), zip_filename)
-        shutil.make_archive(zip_path.replace(".zip", ""), "zip", output_dir)
-
-        # Step 3: Return file for download
-        return FileResponse(
-            path=zip_path,
-            filename=zip_filename,
-            media_type="application/zip"
-        )
+        export_id, files, deleted, manifest = plan_export(since)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Download annotations failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    zip_filename = f"annotations_{export_id}{f'_since_{since}' if since else ''}.zip"
+    return StreamingResponse(
+        stream_export(export_id, files, deleted, manifest, since),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{zip_filename}"',
+            # Pass this back as ?since= on the next download to get only what changed
+            "X-Export-Id": export_id,
+        }
+    )
+
 @app.delete("/clear-folder/{folder_type}")
 def clear_folder(folder_type: str):
 
@@ -410,6 +1060,16 @@ def clear_folder(folder_type: str):
         raise HTTPException(status_code=404, detail=f"Folder '{folder}' does not exist.")
 
     files = os.listdir(folder)
+    if folder_type.lower() in ("uploaded", "processed"):
+        # Previews, crops and annotated views are all cut from the uploaded sources
+        thumbnailer.clear()
+        crop_service.clear()
+        annotated_service.clear()
+    if folder_type.lower() == "processed":
+        # The metadata database lives here too; empty it in place instead of unlinking an open file
+        store.clear()
+        db_name = os.path.basename(store.db_path)
+        files = [f for f in files if not f.startswith(db_name)]
     if not files:  # empty
         return {"message": "folder is empty already!"}
 
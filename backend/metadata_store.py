@@ -0,0 +1,564 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from metrics import observe_stage, stage_timer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    uploaded_img TEXT NOT NULL UNIQUE,
+    processed_img TEXT,  -- legacy; annotated views are served from /annotated/{uploaded_img}
+    error TEXT,
+    width INTEGER,  -- recorded at inference time so exports never decode images for their size
+    height INTEGER
+);
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    defect_id INTEGER NOT NULL,
+    defect_type TEXT NOT NULL,
+    confidence INTEGER NOT NULL,
+    bbox TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'unvalidated',
+    crop_path TEXT  -- legacy; crops are now served from /crops/{id}
+);
+CREATE INDEX IF NOT EXISTS idx_detections_image ON detections(image_id, defect_id);
+CREATE INDEX IF NOT EXISTS idx_detections_confidence ON detections(confidence);
+CREATE INDEX IF NOT EXISTS idx_detections_status ON detections(status);
+CREATE INDEX IF NOT EXISTS idx_detections_class ON detections(defect_type);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0');
+-- Change log for the /changes feed; written in the same transaction as the change itself
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+"""
+
+DETECTION_COLUMNS = "d.id, d.defect_id, d.defect_type, d.confidence, d.bbox, d.status"
+# Change log entries kept for clients resuming the feed; older clients get a resync
+CHANGE_RETENTION = 10000
+
+
+def _detection_row_to_dict(row):
+    return {
+        "id": row[0],
+        "defect_id": row[1],
+        "defect_type": row[2],
+        "confidence": row[3],
+        "bbox": json.loads(row[4]),
+        "status": row[5],
+        # Relative URL of the lazily generated crop (GET /crops/{detection_id})
+        "crop_path": f"crops/{row[0]}",
+    }
+
+
+class _BatchRejected(Exception):
+    pass
+
+
+class MetadataStore:
+    """SQLite (WAL) store for images and their detections, replacing detection_metadata.json.
+
+    Entries go in and come out in the same shape the JSON file used, so callers and the
+    frontend keep working; every update touches only the rows it changes.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        # Called (no arguments) after every committed write, e.g. to wake change feed subscribers
+        self.listeners = []
+        self._conn().executescript(SCHEMA)
+        self._add_missing_columns()
+
+    def _add_missing_columns(self):
+        # Stores created before a column existed get it added in place
+        conn = self._conn()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+        for name in ("width", "height"):
+            if name not in columns:
+                conn.execute(f"ALTER TABLE images ADD COLUMN {name} INTEGER")
+
+    def _conn(self):
+        # One connection per thread; WAL lets readers run while a writer commits
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+            conn.execute(
+                "DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGE_RETENTION,)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        # Includes waiting for the write lock, which is what a slow save looks like to callers
+        observe_stage("metadata_save", time.perf_counter() - start)
+        for listener in self.listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Store listener failed: {e}")
+
+    def _record_change(self, conn, change_type: str, payload: dict):
+        conn.execute("INSERT INTO changes (type, payload) VALUES (?, ?)", (change_type, json.dumps(payload)))
+
+    @property
+    def version(self) -> int:
+        # Bumped on every committed write
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0])
+
+    # ---- reads ---------------------------------------------------------
+
+    def _image_entries(self, conn, where: str = "", params: tuple = (), limit: int = None,
+                       detection_where: str = "", detection_params: tuple = ()):
+        # detection_where filters detections (alias d); when set, images without a matching
+        # detection are left out as well
+        if detection_where:
+            exists = f"EXISTS (SELECT 1 FROM detections d WHERE d.image_id = images.id AND {detection_where})"
+            where = f"{where} AND {exists}" if where else f"WHERE {exists}"
+            params = tuple(params) + tuple(detection_params)
+        query = f"SELECT id, uploaded_img, error, width, height FROM images {where} ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params = tuple(params) + (limit,)
+        images = conn.execute(query, params).fetchall()
+        if not images:
+            return []
+
+        detections_by_image = {image_id: [] for image_id, *_ in images}
+        if where or limit is not None:
+            # Fetch detections for just these images, in chunks to stay under SQLite's variable limit
+            image_ids = list(detections_by_image)
+            extra = f"AND {detection_where}" if detection_where else ""
+            rows = []
+            for i in range(0, len(image_ids), 500):
+                chunk = image_ids[i:i + 500]
+                rows.extend(conn.execute(
+                    f"SELECT d.image_id, {DETECTION_COLUMNS} FROM detections d "
+                    f"WHERE d.image_id IN ({','.join('?' * len(chunk))}) {extra} ORDER BY d.id",
+                    tuple(chunk) + tuple(detection_params),
+                ))
+            rows.sort(key=lambda row: row[1])
+        else:
+            rows = conn.execute(f"SELECT d.image_id, {DETECTION_COLUMNS} FROM detections d ORDER BY d.id")
+        for row in rows:
+            detections_by_image[row[0]].append(_detection_row_to_dict(row[1:]))
+
+        entries = []
+        for image_id, uploaded_img, error, width, height in images:
+            entry = {"id": image_id, "uploaded_img": uploaded_img}
+            if error is not None:
+                entry["error"] = error
+            else:
+                detections = detections_by_image[image_id]
+                entry.update({
+                    # Relative URL of the on-demand annotated view
+                    "processed_img": f"annotated/{quote(uploaded_img)}",
+                    "detections": detections,
+                    "defect_count": len(detections),
+                })
+                if width is not None and height is not None:
+                    entry["width"], entry["height"] = width, height
+            entries.append(entry)
+        return entries
+
+    def query_images(self, after_id: int = None, limit: int = None, status: str = None,
+                     defect_type: str = None, min_confidence: int = None, max_confidence: int = None,
+                     name_prefix: str = None):
+        """Keyset-paginated, filtered read. Returns (entries, next_after_id or None)."""
+        where, params = [], []
+        if after_id is not None:
+            where.append("id > ?")
+            params.append(after_id)
+        if name_prefix:
+            # Range scan on the unique name index instead of LIKE
+            where.append("uploaded_img >= ? AND uploaded_img < ?")
+            params.extend([name_prefix, name_prefix[:-1] + chr(ord(name_prefix[-1]) + 1)])
+
+        detection_where, detection_params = [], []
+        for clause, value in (("d.status = ?", status), ("d.defect_type = ?", defect_type),
+                              ("d.confidence >= ?", min_confidence), ("d.confidence <= ?", max_confidence)):
+            if value is not None:
+                detection_where.append(clause)
+                detection_params.append(value)
+
+        with stage_timer("metadata_load"):
+            entries = self._image_entries(
+                self._conn(),
+                "WHERE " + " AND ".join(where) if where else "",
+                tuple(params),
+                limit=limit + 1 if limit is not None else None,
+                detection_where=" AND ".join(detection_where),
+                detection_params=tuple(detection_params),
+            )
+        next_after_id = None
+        if limit is not None and len(entries) > limit:
+            entries = entries[:limit]
+            next_after_id = entries[-1]["id"]
+        return entries, next_after_id
+
+    def load_all(self) -> list:
+        return self._image_entries(self._conn())
+
+    def count_images(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def get_image(self, uploaded_img: str):
+        entries = self._image_entries(self._conn(), "WHERE uploaded_img = ?", (uploaded_img,))
+        return entries[0] if entries else None
+
+    def images_by_name(self) -> dict:
+        return {entry["uploaded_img"]: entry for entry in self.load_all()}
+
+    def find_by_confidence(self, confidence: int):
+        row = self._conn().execute(
+            f"SELECT {DETECTION_COLUMNS} FROM detections d WHERE d.confidence = ? ORDER BY d.id LIMIT 1",
+            (confidence,),
+        ).fetchone()
+        return _detection_row_to_dict(row) if row else None
+
+    def next_image_names(self, uploaded_img: str, n: int) -> list:
+        # The n images after this one in review order (insertion order), for prefetch hints
+        rows = self._conn().execute(
+            "SELECT uploaded_img FROM images WHERE error IS NULL AND id > "
+            "(SELECT id FROM images WHERE uploaded_img = ?) ORDER BY id LIMIT ?",
+            (uploaded_img, n),
+        )
+        return [row[0] for row in rows]
+
+    def get_detection(self, detection_id: int):
+        # Returns (detection, uploaded_img) or None
+        row = self._conn().execute(
+            f"SELECT {DETECTION_COLUMNS}, i.uploaded_img FROM detections d "
+            "JOIN images i ON i.id = d.image_id WHERE d.id = ?",
+            (detection_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return _detection_row_to_dict(row[:-1]), row[-1]
+
+    def unvalidated_snapshot(self, min_confidence: int, max_confidence: int):
+        """(change seq, [(detection id, uploaded_img, defect_type, confidence)]) of the unvalidated
+        detections with min_confidence < confidence < max_confidence, read in one transaction so
+        replaying the changes after that seq brings the list up to date."""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            latest = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+            rows = conn.execute(
+                "SELECT d.id, i.uploaded_img, d.defect_type, d.confidence FROM detections d "
+                "JOIN images i ON i.id = d.image_id "
+                "WHERE d.status = 'unvalidated' AND d.confidence > ? AND d.confidence < ?",
+                (min_confidence, max_confidence),
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return (latest[0] if latest else 0), rows
+
+    def changes_since(self, seq: int, limit: int = 500) -> list:
+        # [(seq, type, payload)] after seq, oldest first
+        rows = self._conn().execute(
+            "SELECT seq, type, payload FROM changes WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit)
+        )
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def change_seq_range(self):
+        # (oldest retained seq or None, latest seq ever assigned or 0)
+        conn = self._conn()
+        oldest = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+        latest = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return oldest, latest[0] if latest else 0
+
+    # ---- single-row updates --------------------------------------------
+
+    def _detection_event(self, conn, detection_id: int) -> dict:
+        # Payload shared by the per-detection change events
+        detection = self._detection_by_id(conn, detection_id)
+        image = conn.execute(
+            "SELECT i.uploaded_img FROM images i JOIN detections d ON d.image_id = i.id WHERE d.id = ?",
+            (detection_id,),
+        ).fetchone()
+        return {"uploaded_img": image[0], "detection": detection}
+
+    def _detection_by_id(self, conn, detection_id: int):
+        row = conn.execute(
+            f"SELECT {DETECTION_COLUMNS} FROM detections d WHERE d.id = ?", (detection_id,)
+        ).fetchone()
+        return _detection_row_to_dict(row) if row else None
+
+    def _id_by_confidence(self, conn, confidence: int):
+        row = conn.execute(
+            "SELECT id FROM detections WHERE confidence = ? ORDER BY id LIMIT 1", (confidence,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_status(self, conn, detection_id: int, status: str = None, defect_type: str = None):
+        if status is not None:
+            conn.execute("UPDATE detections SET status = ? WHERE id = ?", (status, detection_id))
+        if defect_type is not None:
+            conn.execute("UPDATE detections SET defect_type = ? WHERE id = ?", (defect_type, detection_id))
+        event = self._detection_event(conn, detection_id)
+        self._record_change(conn, "status_changed", event)
+        return event["detection"]
+
+    def _delete(self, conn, detection_id: int):
+        event = self._detection_event(conn, detection_id)
+        conn.execute("DELETE FROM detections WHERE id = ?", (detection_id,))
+        self._record_change(conn, "detection_deleted", event)
+        return event["detection"]
+
+    def _update_bbox(self, conn, uploaded_img: str, defect_id: int, bbox: list, defect_type: str = None):
+        image = conn.execute("SELECT id FROM images WHERE uploaded_img = ?", (uploaded_img,)).fetchone()
+        if image is None:
+            return "image_not_found"
+        row = conn.execute(
+            "SELECT id FROM detections WHERE image_id = ? AND defect_id = ? ORDER BY id LIMIT 1",
+            (image[0], defect_id),
+        ).fetchone()
+        if row is None:
+            return "detection_not_found"
+        conn.execute("UPDATE detections SET bbox = ? WHERE id = ?", (json.dumps(bbox), row[0]))
+        if defect_type:
+            conn.execute("UPDATE detections SET defect_type = ? WHERE id = ?", (defect_type, row[0]))
+        event = self._detection_event(conn, row[0])
+        self._record_change(conn, "bbox_updated", event)
+        return event["detection"]
+
+    def set_status_by_confidence(self, confidence: int, status: str = None, defect_type: str = None):
+        # Returns the updated detection, or None if no detection has this confidence
+        with self._write() as conn:
+            detection_id = self._id_by_confidence(conn, confidence)
+            if detection_id is None:
+                return None
+            return self._set_status(conn, detection_id, status, defect_type)
+
+    def delete_by_confidence(self, confidence: int):
+        # Returns the deleted detection, or None if no detection has this confidence
+        with self._write() as conn:
+            detection_id = self._id_by_confidence(conn, confidence)
+            if detection_id is None:
+                return None
+            return self._delete(conn, detection_id)
+
+    def update_bbox(self, uploaded_img: str, defect_id: int, bbox: list, defect_type: str = None):
+        # Returns "image_not_found", "detection_not_found" or the updated detection
+        with self._write() as conn:
+            return self._update_bbox(conn, uploaded_img, defect_id, bbox, defect_type)
+
+    def apply_batch(self, operations: list, all_or_nothing: bool = False):
+        """Apply validation operations in order, in a single transaction.
+
+        Each operation is {"op": "status", "id" | "confidence", "status"?, "defect_type"?},
+        {"op": "delete", "id" | "confidence"} or
+        {"op": "bbox", "image_name", "defect_id", "bbox", "defect_type"?}.
+        Returns one {"ok": True, "detection"} or {"ok": False, "error"} per operation. A failed
+        operation doesn't stop the rest unless all_or_nothing is set, in which case nothing is
+        written and every result has "applied": False.
+        """
+        results = []
+        try:
+            with self._write() as conn:
+                for op in operations:
+                    results.append(self._apply_operation(conn, op))
+                if all_or_nothing and not all(result["ok"] for result in results):
+                    raise _BatchRejected()
+        except _BatchRejected:
+            for result in results:
+                result["applied"] = False
+        return results
+
+    def _apply_operation(self, conn, op: dict):
+        kind = op.get("op")
+        if kind == "bbox":
+            result = self._update_bbox(conn, op["image_name"], op["defect_id"], op["bbox"], op.get("defect_type"))
+            if isinstance(result, str):
+                return {"ok": False, "error": result}
+            return {"ok": True, "detection": result}
+
+        if "id" in op:
+            exists = conn.execute("SELECT 1 FROM detections WHERE id = ?", (op["id"],)).fetchone()
+            detection_id = op["id"] if exists else None
+        else:
+            detection_id = self._id_by_confidence(conn, op["confidence"])
+        if detection_id is None:
+            return {"ok": False, "error": "detection_not_found"}
+        if kind == "status":
+            return {"ok": True, "detection": self._set_status(conn, detection_id, op.get("status"), op.get("defect_type"))}
+        return {"ok": True, "detection": self._delete(conn, detection_id)}
+
+    # ---- bulk writes ---------------------------------------------------
+
+    def _insert_entry(self, conn, entry: dict):
+        cursor = conn.execute(
+            "INSERT INTO images (uploaded_img, error, width, height) VALUES (?, ?, ?, ?)",
+            (entry["uploaded_img"], entry.get("error"), entry.get("width"), entry.get("height")),
+        )
+        conn.executemany(
+            """INSERT INTO detections
+               (image_id, defect_id, defect_type, confidence, bbox, status)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            [
+                (cursor.lastrowid, det["defect_id"], det["defect_type"], det["confidence"],
+                 json.dumps(det["bbox"]), det.get("status", "unvalidated"))
+                for det in entry.get("detections", [])
+            ],
+        )
+        return cursor.lastrowid
+
+    def sync_images(self, entries: list, keep: set = frozenset()):
+        """Make the store hold exactly `entries` (plus any existing image named in `keep`).
+
+        Only images whose entry differs from what is stored are written, in one transaction.
+        A stored detection that matches an incoming one keeps its row id and status: it matches
+        on (defect_id, confidence), which review edits never change, or failing that on
+        (defect_id, bbox). Unmatched stored detections are deleted, unmatched incoming ones added.
+        """
+        with self._write() as conn:
+            stored = {}  # uploaded_img -> (image id, error, width, height)
+            for image_id, name, error, width, height in conn.execute(
+                "SELECT id, uploaded_img, error, width, height FROM images"
+            ):
+                stored[name] = (image_id, error, width, height)
+            stored_detections = {}  # image id -> [(id, defect_id, confidence, bbox json)]
+            for row in conn.execute("SELECT image_id, id, defect_id, confidence, bbox FROM detections ORDER BY id"):
+                stored_detections.setdefault(row[0], []).append(row[1:])
+
+            synced = {entry["uploaded_img"] for entry in entries}
+            for name in stored:
+                if name not in keep and name not in synced:
+                    conn.execute("DELETE FROM images WHERE id = ?", (stored[name][0],))
+                    self._record_change(conn, "image_removed", {"uploaded_img": name})
+
+            for entry in entries:
+                old = stored.get(entry["uploaded_img"])
+                if old is None:
+                    image_id = self._insert_entry(conn, entry)
+                else:
+                    image_id = old[0]
+                    changed = self._sync_detections(conn, image_id, stored_detections.get(image_id, []),
+                                                    entry.get("detections", []))
+                    fields = (entry.get("error"), entry.get("width"), entry.get("height"))
+                    if fields != old[1:]:
+                        conn.execute("UPDATE images SET error = ?, width = ?, height = ? WHERE id = ?",
+                                     fields + (image_id,))
+                        changed = True
+                    if not changed:
+                        continue
+                # Clients and the review queue replace the image's detection list wholesale
+                self._record_change(conn, "detection_added", {
+                    "uploaded_img": entry["uploaded_img"],
+                    "detections": [
+                        _detection_row_to_dict(row) for row in conn.execute(
+                            f"SELECT {DETECTION_COLUMNS} FROM detections d WHERE d.image_id = ? ORDER BY d.id",
+                            (image_id,),
+                        )
+                    ],
+                })
+
+    def _sync_detections(self, conn, image_id: int, old_rows: list, detections: list) -> bool:
+        # Returns True if any detection row of the image was added, updated or deleted
+        unmatched = list(old_rows)
+
+        def take(matches):
+            for i, row in enumerate(unmatched):
+                if matches(row):
+                    return unmatched.pop(i)
+            return None
+
+        # Exact matches first, so a box-only match can't claim a row another detection owns
+        rest = [det for det in detections
+                if take(lambda row: row[1] == det["defect_id"] and row[2] == det["confidence"]) is None]
+        for det in rest:
+            bbox = json.dumps(det["bbox"])
+            row = take(lambda row: row[1] == det["defect_id"] and row[3] == bbox)
+            if row is not None:
+                # Same box from a different model run: keep the id and review status, refresh the score
+                conn.execute("UPDATE detections SET confidence = ? WHERE id = ?", (det["confidence"], row[0]))
+            else:
+                conn.execute(
+                    """INSERT INTO detections
+                       (image_id, defect_id, defect_type, confidence, bbox, status)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (image_id, det["defect_id"], det["defect_type"], det["confidence"], bbox,
+                     det.get("status", "unvalidated")),
+                )
+        if unmatched:
+            conn.executemany("DELETE FROM detections WHERE id = ?", [(row[0],) for row in unmatched])
+        return bool(rest or unmatched)
+
+    def clear(self):
+        with self._write() as conn:
+            conn.execute("DELETE FROM images")
+            self._record_change(conn, "cleared", {})
+
+    # ---- migration -----------------------------------------------------
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """One-shot import of the old detection_metadata.json; the file is renamed afterwards."""
+        if not os.path.exists(json_path):
+            return 0
+        if self.count_images() > 0:
+            logger.warning(f"Store {self.db_path} is not empty, skipping migration of {json_path}")
+            return 0
+
+        with open(json_path, "r") as f:
+            metadata = json.load(f)
+
+        with self._write() as conn:
+            for entry in metadata:
+                # Same cleaning load_metadata() did on every request: drop detections whose crop is gone
+                entry["detections"] = [
+                    det for det in entry.get("detections", [])
+                    if det.get("crop_path") and os.path.exists(det["crop_path"].replace("\\", "/"))
+                ]
+                self._insert_entry(conn, entry)
+
+        os.replace(json_path, json_path + ".migrated")
+        logger.info(f"Migrated {len(metadata)} images from {json_path} into {self.db_path}")
+        return len(metadata)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+if __name__ == "__main__":
+    # python metadata_store.py [json_path] [db_path]
+    logging.basicConfig(level=logging.INFO)
+    json_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("processed_img", "detection_metadata.json")
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join("processed_img", "detections.db")
+    count = MetadataStore(db_path).migrate_from_json(json_path)
+    print(f"Migrated {count} images into {db_path}")
@@ -0,0 +1,62 @@
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+
+# Stage timings are observed in this process only; bulk inference in pool workers shows up as
+# bulk_job time per image (see job timings) rather than per stage.
+STAGES = (
+    "image_decode",       # file / upload bytes -> contiguous BGR array (image_decode.decode_image)
+    "bgr_convert",        # RGB array inputs only: RGB -> BGR view for the model
+    "model_forward",      # one _detect call (a batch of images or tiles)
+    "render",             # drawing detections onto an image (replaces result.plot)
+    "crop_write",         # cutting, encoding and caching a defect crop
+    "annotated_save",     # encoding and writing an annotated image
+    "metadata_load",      # reading detections from the store for a response
+    "metadata_save",      # writing bulk results / review decisions to the store
+)
+# 0.5 ms .. ~30 s, wide enough for a crop encode and a large bulk metadata save
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+stage_seconds = Histogram("pipeline_stage_seconds", "Time spent per pipeline stage", ["stage"],
+                          buckets=STAGE_BUCKETS)
+# Label children resolved once, so observing a stage is a dict lookup plus a histogram update
+_stage_children = {stage: stage_seconds.labels(stage) for stage in STAGES}
+
+request_seconds = Histogram("http_request_duration_seconds", "HTTP request latency (until the response starts)",
+                            ["method", "route", "status"], buckets=STAGE_BUCKETS)
+requests_in_progress = Gauge("http_requests_in_progress", "HTTP requests being handled")
+job_queue_depth = Gauge("bulk_job_queue_depth", "Bulk jobs queued or running")
+detect_batch_queue_depth = Gauge("detect_batch_queue_depth", "/detect requests waiting for a batch")
+detect_batch_size = Histogram("detect_batch_size", "/detect requests per batched forward pass",
+                              buckets=(1, 2, 4, 8, 16, 32))
+model_load_seconds = Gauge("model_load_seconds", "Time the last load of each model took", ["model"])
+model_memory_bytes = Gauge("model_memory_bytes", "Measured RSS growth of each model load", ["model"])
+# Process RSS, CPU and open fds come from prometheus_client's default process collector
+# (process_resident_memory_bytes etc.)
+
+
+def stage_timer(stage: str):
+    # with stage_timer("image_decode"): ...
+    return _stage_children[stage].time()
+
+
+def observe_stage(stage: str, seconds: float):
+    _stage_children[stage].observe(seconds)
+
+
+class RequestTimer:
+    """Tracks one HTTP request: in-progress gauge while it runs, latency histogram when done."""
+
+    def __init__(self, method: str):
+        self.method = method
+        self.start = time.perf_counter()
+        requests_in_progress.inc()
+
+    def finish(self, route: str, status: int):
+        requests_in_progress.dec()
+        request_seconds.labels(self.method, route, str(status)).observe(time.perf_counter() - self.start)
+
+
+def render_metrics():
+    # (body, content type) in the Prometheus text format
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,127 +1,197 @@
 import logging
 import os
+import threading
 from ultralytics import YOLO
 import numpy as np
-import cv2
+
+from content_hash import sha256_file
+from image_decode import DecodedImage, decode_image, to_source_coordinates
+from annotation_renderer import render_annotations
+from box_ops import clip_boxes
+from metrics import stage_timer
+from tiling import tile_windows, offset_detections, merge_detections
 
 logger = logging.getLogger(__name__)
 
+# Encoded inputs (paths, bytes) that predict*() decode themselves
+ENCODED_TYPES = (str, os.PathLike, bytes, bytearray, memoryview)
+
+def input_side(imgsz) -> int:
+    # Longest side of the model input; imgsz is an int or [h, w]
+    return max(imgsz) if isinstance(imgsz, (list, tuple)) else int(imgsz)
+
 class PlantDefectDetector:
-    def __init__(self, model_path: str, crop_dir: str = "processed_img"):
+    def __init__(self, model_path: str):
         self.model_path = model_path
         self.model = None 
         self.is_loaded = False
-        self.crop_dir = crop_dir
-        os.makedirs(self.crop_dir, exist_ok=True)
+        self.weights_hash = None
+        # Longest side the model letterboxes to; larger JPEGs are decoded at reduced scale
+        self.input_size = None
+        # ultralytics predictors are not thread-safe; /detect and bulk jobs share one model
+        self._infer_lock = threading.Lock()
     
     def load_model(self):
         try:
             logger.info(f"Loading model from {self.model_path}")
             self.model = YOLO(self.model_path)
+            self.input_size = input_side(self.model.overrides.get("imgsz", 640))
+            # Hash the weights so cached detections are tied to this exact model file
+            if os.path.isfile(self.model_path):
+                self.weights_hash = sha256_file(self.model_path)
             self.is_loaded = True
             logger.info("Model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             raise
 
-    def crop_handler(self, image_bgr, x1, y1, x2, y2, defect_id, defect_type, padding=100, make_square=True):
-        #Handles cropping, padding, and saving defect crop 
-        h, w = image_bgr.shape[:2]
-
-        # Add padding but keep inside image boundaries
-        x1 = max(0, x1 - padding)
-        y1 = max(0, y1 - padding)
-        x2 = min(w, x2 + padding)
-        y2 = min(h, y2 + padding)
-
-        # Crop
-        crop = image_bgr[y1:y2, x1:x2]
-        
-        # Make crop square if requested
-        if make_square:
-            crop_h, crop_w = crop.shape[:2]
-            if crop_h != crop_w:
-                size = min(crop_h, crop_w)  # keep smaller dimension
-                y_center, x_center = crop_h // 2, crop_w // 2
-                half = size // 2
-
-                # crop to centered square
-                x1_sq = max(0, x_center - half)
-                x2_sq = x1_sq + size
-                y1_sq = max(0, y_center - half)
-                y2_sq = y1_sq + size
-                crop = crop[y1_sq:y2_sq, x1_sq:x2_sq]
-
-            trim_square_margin = 20
-            # trim 20px border inside the square if margin allows
-            if trim_square_margin > 0:
-                crop_h, crop_w = crop.shape[:2]
-                if crop_h > 2 * trim_square_margin and crop_w > 2 * trim_square_margin:
-                    crop = crop[
-                        trim_square_margin:crop_h - trim_square_margin,
-                        trim_square_margin:crop_w - trim_square_margin
-                    ]
-
-        image_id = 'crops'
-        # Filename: defectType_classId_bbox.jpg //// pls fix this later TT
-        save_dir = os.path.join(self.crop_dir, image_id)
-        os.makedirs(save_dir, exist_ok=True)
-
-        # Filename: defectType_classId_bbox.jpg
-        filename = f"{defect_type}_{defect_id}_{x1}{y1}{x2}{y2}.jpg"
-        save_path = os.path.join(save_dir, filename)
-
-        # Save file
-        cv2.imwrite(save_path, crop)
-
-        return save_path
-
-    def predict(self, image: np.ndarray, return_image: bool, conf_threshold: float = 0.25):
+    def warmup(self, size: int = 640):
+        # One throwaway inference so the first real request doesn't pay for lazy
+        # predictor setup (fusing layers, allocating buffers)
+        if not self.is_loaded:
+            raise Exception("Model not loaded")
+        with self._infer_lock:
+            self.model(np.zeros((size, size, 3), dtype=np.uint8), verbose=False)
+
+    @property
+    def model_id(self):
+        # Identity used to key the detection cache: path + weights content
+        return f"{self.model_path}@{self.weights_hash}"
+
+    def _prepare(self, image, reduce: bool = True) -> DecodedImage:
+        # Accepts a DecodedImage, a path or encoded bytes (decoded here; with reduce, at reduced
+        # scale when much larger than the model input), or an RGB array as before
+        if isinstance(image, DecodedImage):
+            return image
+        if isinstance(image, ENCODED_TYPES):
+            return decode_image(image, self.input_size if reduce else None)
+        with stage_timer("bgr_convert"):
+            height, width = image.shape[:2]
+            return DecodedImage(image[..., ::-1], width, height, 1) # Convert RGB → BGR for OpenCV
+
+    def _parse_result(self, result):
+        # Turns one ultralytics result into our detection dicts; only boxes are kept, annotated
+        # views are rendered later from stored detections (see annotation_renderer)
+        # The full result repr is large; only worth it when debugging
+        logger.debug(result)
+
+        if result.boxes is None or len(result.boxes) == 0:
+            return []
+
+        # One device -> host copy per image instead of one per box
+        height, width = result.orig_shape
+        boxes = clip_boxes(result.boxes.xyxy.cpu().numpy(), width, height)
+        confs = result.boxes.conf.cpu().numpy()
+        classes = result.boxes.cls.cpu().numpy().astype(int)
+
+        # Crops are no longer written here; they're cut on demand from the
+        # stored bbox by crop_service (GET /crops/{detection_id})
+        detections = [
+            {
+                "defect_id": int(defect_id),
+                "defect_type": result.names[int(defect_id)],
+                "confidence": int(float(conf) * (10**10)),
+                "bbox": box.tolist(),
+                "status": "unvalidated"
+            }
+            for box, conf, defect_id in zip(boxes, confs, classes)
+        ]
+        return detections
+
+    def _detect(self, images_bgr: list, conf_threshold: float):
+        # One forward pass over same-shape BGR images -> one detection list per image.
+        # Other inference backends (see onnx_backend) only need to override this.
+        with self._infer_lock:
+            results = self.model(images_bgr if len(images_bgr) > 1 else images_bgr[0], conf=conf_threshold)
+        return [self._parse_result(result) for result in results]
+
+    def _forward(self, images_bgr: list, conf_threshold: float):
+        with stage_timer("model_forward"):
+            return self._detect(images_bgr, conf_threshold)
+
+    def predict(self, image, return_image: bool = False, conf_threshold: float = 0.25):
+        # image: RGB array, path, encoded bytes or DecodedImage. Boxes are always in source-frame
+        # pixels; the annotated image is drawn on the frame as decoded (full size for encoded input).
         if not self.is_loaded:
             raise Exception("Model not loaded")
 
-        image_bgr = image[..., ::-1] # Convert RGB → BGR for OpenCV
+        frame = self._prepare(image, reduce=not return_image)
+        detections = self._forward([frame.bgr], conf_threshold)[0]
+
+        if return_image:
+            with stage_timer("render"):
+                annotated = render_annotations(frame.bgr, detections)
+            return to_source_coordinates(detections, frame), annotated
+        return to_source_coordinates(detections, frame)
+
+    def predict_batch(self, images: list, return_image: bool = False,
+                      conf_threshold: float = 0.25, batch_size: int = 8):
+        # Same output as calling predict() on each image, but runs the model on mini-batches.
+        # images can be anything predict() takes; paths are only decoded one mini-batch at a time.
+        if not self.is_loaded:
+            raise Exception("Model not loaded")
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+
+        outputs = []
+        for start in range(0, len(images), batch_size):
+            chunk = [self._prepare(image, reduce=not return_image) for image in images[start:start + batch_size]]
+
+            # ultralytics only uses minimal (rect) letterboxing when every image in the call has
+            # the same shape, so group by shape to keep boxes identical to the single-image path
+            groups = {}
+            for idx, frame in enumerate(chunk):
+                groups.setdefault(frame.bgr.shape, []).append(idx)
+
+            chunk_outputs = [None] * len(chunk)
+            for indices in groups.values():
+                batch_detections = self._forward([chunk[i].bgr for i in indices], conf_threshold)
+                for i, detections in zip(indices, batch_detections):
+                    chunk_outputs[i] = detections
+
+            for frame, detections in zip(chunk, chunk_outputs):
+                if return_image:
+                    with stage_timer("render"):
+                        annotated = render_annotations(frame.bgr, detections)
+                    outputs.append((to_source_coordinates(detections, frame), annotated))
+                else:
+                    outputs.append(to_source_coordinates(detections, frame))
+
+        return outputs
+
+    def predict_tiled(self, image, return_image: bool = False, conf_threshold: float = 0.25,
+                      tile_size: int = 1280, overlap: float = 0.2, tile_batch: int = 4,
+                      merge: str = "nms", full_frame: bool = True):
+        # Sliced inference for large captures: the frame is cut into overlapping tile_size tiles
+        # that run at native resolution, tile_batch at a time, so small defects aren't lost to
+        # downscaling and model memory depends on the tile batch rather than the frame size.
+        # full_frame adds one ordinary whole-image pass for defects larger than a tile.
+        # Boxes are mapped back to frame coordinates and merged class by class (nms or wbf).
+        if not self.is_loaded:
+            raise Exception("Model not loaded")
+        if tile_batch < 1:
+            raise ValueError("tile_batch must be >= 1")
 
-        results = self.model(image_bgr, conf=conf_threshold)
+        # Tiles exist to keep native resolution, so encoded input is never decoded at reduced scale
+        frame = self._prepare(image, reduce=False)
+        image_bgr = frame.bgr
+        height, width = image_bgr.shape[:2]
+        windows = tile_windows(height, width, tile_size, overlap)
 
         detections = []
-        annotated_image = None
-
-        for result in results:
-            logger.info(result)
-
-            if result.boxes is not None:
-                for box in result.boxes:
-                    defect_id = int(box.cls[0])
-                    defect_type = result.names[defect_id]
-                    x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                    conf = float(box.conf[0])
-                    conf_str = int(conf * (10**10))
-
-                    # Call crop_handler
-                    crop_path = self.crop_handler(
-                        image_bgr, x1, y1, x2, y2,
-                        defect_id, defect_type
-                    )
-
-                    detection = {
-                        "defect_id": defect_id,
-                        "defect_type": defect_type,
-                        "confidence": conf_str,
-                        "bbox": box.xyxy[0].cpu().numpy().tolist(),
-                        "status": "unvalidated",
-                        "crop_path": crop_path
-                    }
-                    detections.append(detection)
-            
-            if return_image:
-                annotated_image = result.plot(
-                    conf=True,
-                    labels=True,
-                    boxes=True,
-                    line_width=5
-                )
-        
+        if full_frame and len(windows) > 1:
+            detections.extend(self._forward([image_bgr], conf_threshold)[0])
+        for start in range(0, len(windows), tile_batch):
+            batch = windows[start:start + tile_batch]
+            # Only this batch of tiles is copied out of the frame
+            tiles = [np.ascontiguousarray(image_bgr[y0:y1, x0:x1]) for x0, y0, x1, y1 in batch]
+            for (x0, y0, _, _), tile_detections in zip(batch, self._forward(tiles, conf_threshold)):
+                detections.extend(offset_detections(tile_detections, x0, y0))
+            del tiles
+
+        detections = merge_detections(detections, merge)
         if return_image:
-            return detections, annotated_image
-        return detections
+            with stage_timer("render"):
+                annotated = render_annotations(image_bgr, detections)
+            return to_source_coordinates(detections, frame), annotated
+        return to_source_coordinates(detections, frame)
@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import psutil
+
+from metrics import model_load_seconds, model_memory_bytes
+from model_handler import PlantDefectDetector
+
+logger = logging.getLogger(__name__)
+
+
+BACKENDS = ("pytorch", "onnx", "onnx-int8")
+
+
+class UnknownModel(KeyError):
+    pass
+
+
+def create_detector(model_path: str, backend: str = "pytorch", onnx_cache_dir: str = None):
+    # pytorch runs the .pt weights through ultralytics; onnx / onnx-int8 run a cached ONNX export
+    if backend == "pytorch":
+        return PlantDefectDetector(model_path)
+    if backend in ("onnx", "onnx-int8"):
+        from onnx_backend import OnnxDetector
+        kwargs = {"cache_dir": onnx_cache_dir} if onnx_cache_dir else {}
+        return OnnxDetector(model_path, int8=backend == "onnx-int8", **kwargs)
+    raise ValueError(f"Unknown inference backend '{backend}', use one of {BACKENDS}")
+
+
+class ModelRegistry:
+    """Detectors for every weight file under models_dir, loaded on first use.
+
+    At most max_loaded models stay resident, and their combined footprint (RSS growth measured
+    around each load) is kept under memory_budget_bytes; the least recently used model is
+    evicted first. A detector that is evicted while a job still holds it stays alive until that
+    job drops it, the registry just stops handing it out.
+    """
+
+    def __init__(self, models_dir: str, max_loaded: int = 2, memory_budget_bytes: int = None,
+                 warmup_size: int = 640, backend: str = "pytorch", onnx_cache_dir: str = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}', use one of {BACKENDS}")
+        self.models_dir = models_dir
+        self.backend = backend
+        self.onnx_cache_dir = onnx_cache_dir
+        self.max_loaded = max_loaded
+        self.memory_budget_bytes = memory_budget_bytes
+        self.warmup_size = warmup_size
+        self._loaded = OrderedDict()  # name -> detector, least recently used first
+        self._stats = {}              # name -> {"memory_bytes", "load_seconds", "loaded_at"}
+        self._lock = threading.Lock()
+        # Loads are serialised so two cold models never spike memory at the same time
+        self._load_lock = threading.Lock()
+
+    def available(self):
+        # name (file stem) -> path, rescanned on every call so new weight files are picked up
+        if not os.path.isdir(self.models_dir):
+            return {}
+        return {
+            os.path.splitext(f)[0]: os.path.join(self.models_dir, f)
+            for f in sorted(os.listdir(self.models_dir)) if f.endswith(".pt")
+        }
+
+    def get(self, name: str) -> PlantDefectDetector:
+        with self._lock:
+            detector = self._loaded.get(name)
+            if detector is not None:
+                self._loaded.move_to_end(name)
+                return detector
+
+        path = self.available().get(name)
+        if path is None:
+            raise UnknownModel(name)
+
+        with self._load_lock:
+            # Another request may have loaded it while we waited
+            with self._lock:
+                detector = self._loaded.get(name)
+                if detector is not None:
+                    self._loaded.move_to_end(name)
+                    return detector
+
+            # Make room up front, using the last measured footprint (or the file size) as estimate
+            estimate = self._stats.get(name, {}).get("memory_bytes") or os.path.getsize(path)
+            self._evict(reserve_bytes=estimate)
+
+            process = psutil.Process()
+            rss_before = process.memory_info().rss
+            start_time = time.time()
+            detector = create_detector(path, self.backend, self.onnx_cache_dir)
+            detector.load_model()
+            if self.warmup_size:
+                detector.warmup(self.warmup_size)
+            load_seconds = time.time() - start_time
+            memory_bytes = max(process.memory_info().rss - rss_before, os.path.getsize(path))
+
+            with self._lock:
+                self._loaded[name] = detector
+                self._stats[name] = {
+                    "memory_bytes": memory_bytes,
+                    "load_seconds": load_seconds,
+                    "loaded_at": time.time(),
+                }
+            model_load_seconds.labels(name).set(load_seconds)
+            model_memory_bytes.labels(name).set(memory_bytes)
+            logger.info(f"Model {name} loaded in {load_seconds:.2f} seconds (~{memory_bytes / 1e6:.0f} MB)")
+            # The measured footprint can be larger than the estimate
+            self._evict(keep=name)
+            return detector
+
+    def _evict(self, reserve_bytes: int = 0, keep: str = None):
+        with self._lock:
+            while self._loaded:
+                resident = sum(self._stats[name]["memory_bytes"] for name in self._loaded)
+                slots = len(self._loaded) + (1 if reserve_bytes else 0)
+                over_count = slots > self.max_loaded
+                over_budget = (self.memory_budget_bytes is not None
+                               and resident + reserve_bytes > self.memory_budget_bytes)
+                if not (over_count or over_budget):
+                    break
+                victim = next((name for name in self._loaded if name != keep), None)
+                if victim is None:
+                    break
+                del self._loaded[victim]
+                logger.info(f"Evicted model {victim} (least recently used)")
+
+    def unload(self, name: str):
+        with self._lock:
+            return self._loaded.pop(name, None) is not None
+
+    def status(self):
+        with self._lock:
+            loaded = list(self._loaded)
+            stats = {name: dict(s) for name, s in self._stats.items()}
+        return [
+            {
+                "name": name,
+                "path": path,
+                "loaded": name in loaded,
+                **{k: stats[name][k] for k in ("memory_bytes", "load_seconds") if name in stats},
+            }
+            for name, path in self.available().items()
+        ]
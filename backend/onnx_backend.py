@@ -0,0 +1,192 @@
+import ast
+import logging
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+from box_ops import batched_nms
+from content_hash import sha256_file
+from model_handler import PlantDefectDetector, input_side
+
+logger = logging.getLogger(__name__)
+
+# ultralytics predict() defaults, so both backends keep/suppress the same boxes
+NMS_IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+MAX_NMS_CANDIDATES = 30000
+
+
+def export_onnx(model_path: str, cache_dir: str, weights_hash: str = None, int8: bool = False) -> str:
+    # Exports .pt weights to ONNX once; the file name carries the weights hash, so retrained
+    # weights get a fresh export and an unchanged model is never exported twice
+    weights_hash = weights_hash or sha256_file(model_path)
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    fp32_path = os.path.join(cache_dir, f"{stem}-{weights_hash[:16]}.onnx")
+    int8_path = os.path.join(cache_dir, f"{stem}-{weights_hash[:16]}-int8.onnx")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    if not os.path.exists(fp32_path):
+        from ultralytics import YOLO
+
+        # ultralytics writes the export next to the weights, so export from a private copy
+        work_dir = tempfile.mkdtemp(dir=cache_dir)
+        try:
+            work_pt = os.path.join(work_dir, os.path.basename(model_path))
+            shutil.copy2(model_path, work_pt)
+            logger.info(f"Exporting {model_path} to ONNX")
+            # dynamic axes keep the minimal (rect) letterbox of the PyTorch path and allow batching
+            exported = YOLO(work_pt).export(format="onnx", dynamic=True, simplify=True)
+            os.replace(exported, fp32_path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not int8:
+        return fp32_path
+
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing {fp32_path} to int8")
+        tmp_path = f"{int8_path}.tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QUInt8)
+        os.replace(tmp_path, int8_path)
+    return int8_path
+
+
+def letterbox(image_bgr: np.ndarray, new_shape, stride: int = 32, auto: bool = True):
+    # Same resize + pad as ultralytics' LetterBox (centered, gray 114 border).
+    # auto pads only up to the next multiple of stride instead of the full square.
+    shape = image_bgr.shape[:2]
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+
+    r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])
+    new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+    dw, dh = new_shape[1] - new_unpad[0], new_shape[0] - new_unpad[1]
+    if auto:
+        dw, dh = np.mod(dw, stride), np.mod(dh, stride)
+    dw /= 2
+    dh /= 2
+
+    if shape[::-1] != new_unpad:
+        image_bgr = cv2.resize(image_bgr, new_unpad, interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return cv2.copyMakeBorder(image_bgr, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+
+def scale_boxes(boxes: np.ndarray, input_shape, original_shape) -> np.ndarray:
+    # Maps xyxy boxes from the letterboxed input back onto the original image, clipped to it
+    gain = min(input_shape[0] / original_shape[0], input_shape[1] / original_shape[1])
+    pad_x = round((input_shape[1] - original_shape[1] * gain) / 2 - 0.1)
+    pad_y = round((input_shape[0] - original_shape[0] * gain) / 2 - 0.1)
+    boxes[:, [0, 2]] -= pad_x
+    boxes[:, [1, 3]] -= pad_y
+    boxes /= gain
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, original_shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, original_shape[0])
+    return boxes
+
+
+class OnnxDetector(PlantDefectDetector):
+    """PlantDefectDetector running an ONNX export of the .pt weights through ONNX Runtime.
+
+    Pre-processing (letterbox) and post-processing (class-aware NMS, box rescaling) follow
+    ultralytics' predict path, and detections come out in the same dict format as predict().
+    """
+
+    def __init__(self, model_path: str, cache_dir: str = os.path.join("cache", "onnx"), int8: bool = False,
+                 num_threads: int = None):
+        super().__init__(model_path)
+        self.cache_dir = cache_dir
+        self.int8 = int8
+        self.num_threads = num_threads
+        self.onnx_path = None
+        self.session = None
+
+    def load_model(self):
+        import onnxruntime as ort
+
+        try:
+            self.weights_hash = sha256_file(self.model_path)
+            self.onnx_path = export_onnx(self.model_path, self.cache_dir, self.weights_hash, self.int8)
+            logger.info(f"Loading ONNX model from {self.onnx_path}")
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.num_threads:
+                options.intra_op_num_threads = self.num_threads
+            self.session = ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+            self.input_name = self.session.get_inputs()[0].name
+
+            # ultralytics stores class names, input size and stride in the export's metadata
+            meta = self.session.get_modelmeta().custom_metadata_map
+            self.names = ast.literal_eval(meta["names"])
+            self.imgsz = ast.literal_eval(meta["imgsz"])
+            self.input_size = input_side(self.imgsz)
+            self.stride = int(meta["stride"])
+            self.is_loaded = True
+            logger.info("Model loaded successfully")
+        except Exception as e:
+            logger.error(f"Failed to load model: {e}")
+            raise
+
+    @property
+    def model_id(self):
+        # Different numerics than the PyTorch model, so cached detections must not be shared
+        return f"{super().model_id}#onnx{'-int8' if self.int8 else ''}"
+
+    def warmup(self, size: int = 640):
+        if not self.is_loaded:
+            raise Exception("Model not loaded")
+        self._detect([np.zeros((size, size, 3), dtype=np.uint8)], 0.25)
+
+    def _detect(self, images_bgr: list, conf_threshold: float):
+        # images_bgr all share one shape (see predict_batch), so they letterbox to one input size
+        inputs = [letterbox(image_bgr, self.imgsz, stride=self.stride, auto=True) for image_bgr in images_bgr]
+        batch = np.stack(inputs)[..., ::-1].transpose(0, 3, 1, 2)  # BGR -> RGB, BHWC -> BCHW
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+        # ONNX Runtime sessions are safe to run from several threads, no lock needed
+        preds = self.session.run(None, {self.input_name: batch})[0]  # (B, 4 + classes, candidates)
+        return [
+            self._postprocess(pred, batch.shape[2:], image_bgr.shape[:2], conf_threshold)
+            for pred, image_bgr in zip(preds, images_bgr)
+        ]
+
+    def _postprocess(self, pred: np.ndarray, input_shape, original_shape, conf_threshold: float):
+        pred = pred.T  # (candidates, 4 + classes)
+        class_scores = pred[:, 4:]
+        classes = class_scores.argmax(1)
+        scores = class_scores[np.arange(len(pred)), classes]
+
+        mask = scores > conf_threshold
+        pred, classes, scores = pred[mask], classes[mask], scores[mask]
+        if len(pred) > MAX_NMS_CANDIDATES:
+            top = np.argsort(-scores, kind="stable")[:MAX_NMS_CANDIDATES]
+            pred, classes, scores = pred[top], classes[top], scores[top]
+
+        # xywh -> xyxy
+        boxes = np.empty((len(pred), 4), dtype=np.float32)
+        half_w, half_h = pred[:, 2] / 2, pred[:, 3] / 2
+        boxes[:, 0] = pred[:, 0] - half_w
+        boxes[:, 1] = pred[:, 1] - half_h
+        boxes[:, 2] = pred[:, 0] + half_w
+        boxes[:, 3] = pred[:, 1] + half_h
+
+        keep = batched_nms(boxes, scores, classes, NMS_IOU_THRESHOLD)[:MAX_DETECTIONS]
+        boxes = scale_boxes(boxes[keep], input_shape, original_shape)
+
+        return [
+            {
+                "defect_id": int(defect_id),
+                "defect_type": self.names[int(defect_id)],
+                "confidence": int(float(conf) * (10**10)),
+                "bbox": box.tolist(),
+                "status": "unvalidated"
+            }
+            for box, conf, defect_id in zip(boxes, scores[keep], classes[keep])
+        ]
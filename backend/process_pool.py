@@ -0,0 +1,105 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from model_registry import create_detector
+
+logger = logging.getLogger(__name__)
+
+# Set once per worker process by _init_worker
+_worker_detector = None
+
+
+def _init_worker(model_path: str, torch_threads: int, backend: str, onnx_cache_dir: str):
+    # Each worker owns one detector for its whole life, so weights are loaded once per process.
+    # torch defaults to one intra-op thread per core; with N workers that oversubscribes the CPU.
+    global _worker_detector
+    import torch
+    torch.set_num_threads(torch_threads)
+    _worker_detector = create_detector(model_path, backend, onnx_cache_dir)
+    if backend != "pytorch":
+        # Same cap for ONNX Runtime's intra-op pool
+        _worker_detector.num_threads = torch_threads
+    _worker_detector.load_model()
+
+
+def _predict(paths: list, conf_threshold: float, batch_size: int, tiling: dict):
+    if tiling:
+        return [_worker_detector.predict_tiled(path, conf_threshold=conf_threshold, **tiling) for path in paths]
+    return _worker_detector.predict_batch(paths, conf_threshold=conf_threshold, batch_size=batch_size)
+
+
+def _detect_shard(paths: list, conf_threshold: float, batch_size: int, tiling: dict = None):
+    # Runs in a worker. Images are decoded here from their paths, so only file names and
+    # detection dicts cross the process boundary. tiling holds predict_tiled() options.
+    t0 = time.time()
+    try:
+        outputs = _predict(paths, conf_threshold, batch_size, tiling)
+        share = (time.time() - t0) / len(paths) if paths else 0.0
+        return [(path, detections, None, share) for path, detections in zip(paths, outputs)]
+    except Exception as e:
+        logger.error(f"Shard inference failed, retrying image by image: {e}")
+
+    # One unreadable file shouldn't fail its whole shard
+    results = []
+    for path in paths:
+        t0 = time.time()
+        try:
+            detections = _predict([path], conf_threshold, batch_size, tiling)[0]
+            results.append((path, detections, None, time.time() - t0))
+        except Exception as e:
+            results.append((path, None, str(e), time.time() - t0))
+    return results
+
+
+class InferencePool:
+    """Process pool of detectors for bulk inference on multi-core CPUs.
+
+    The image list is split into shards of shard_size paths; at most 2 shards per worker are in
+    flight, and results are yielded as each shard finishes, so the caller can merge metadata and
+    report progress while the rest is still running.
+    """
+
+    def __init__(self, model_path: str, workers: int = None, torch_threads: int = 1,
+                 backend: str = "pytorch", onnx_cache_dir: str = None):
+        self.model_path = model_path
+        self.backend = backend
+        self.torch_threads = max(1, torch_threads)
+        self.workers = workers or max(1, (os.cpu_count() or 1) // self.torch_threads)
+        # spawn, not fork: forking a process that already has torch threads running can deadlock
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_path, self.torch_threads, backend, onnx_cache_dir),
+        )
+        logger.info(f"Started inference pool: {self.workers} workers x {self.torch_threads} torch threads")
+
+    def detect(self, paths: list, conf_threshold: float = 0.25, shard_size: int = 8,
+               batch_size: int = 8, should_stop=None, tiling: dict = None):
+        # Yields (path, detections, error, seconds) in completion order.
+        # should_stop() is polled between shards; pending shards are dropped once it returns True.
+        shards = [paths[i:i + shard_size] for i in range(0, len(paths), shard_size)]
+        next_shard = 0
+        pending = set()
+        try:
+            while next_shard < len(shards) or pending:
+                while next_shard < len(shards) and len(pending) < 2 * self.workers:
+                    pending.add(self._executor.submit(_detect_shard, shards[next_shard], conf_threshold,
+                                                      batch_size, tiling))
+                    next_shard += 1
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
+                if should_stop is not None and should_stop():
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
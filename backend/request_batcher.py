@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class BatchQueueFull(Exception):
+    pass
+
+
+class BatchQueueTimeout(Exception):
+    pass
+
+
+class _Pending:
+    __slots__ = ("item", "future", "enqueued_at", "expiry")
+
+    def __init__(self, item, future, enqueued_at):
+        self.item = item
+        self.future = future
+        self.enqueued_at = enqueued_at
+        self.expiry = None  # loop timer failing the item after max_wait, cancelled once it is dispatched
+
+
+class RequestBatcher:
+    """Coalesces concurrent single-item calls from the event loop into batched calls.
+
+    run_batch(items) -> results (one per item, an Exception instance fails just that item) runs
+    on a worker thread, one batch at a time. A batch is started once max_batch_size items are
+    waiting or the oldest one has waited max_delay seconds; whatever arrives while a batch runs
+    forms the next one, so under load batches fill up without any extra delay.
+
+    Admission is bounded: submit() raises BatchQueueFull when max_queued items are already
+    waiting, and an item still waiting max_wait seconds after submit() fails with
+    BatchQueueTimeout right then (even while a slow batch holds the worker) instead of being
+    served late.
+    """
+
+    def __init__(self, run_batch, max_batch_size: int = 8, max_delay: float = 0.01,
+                 max_queued: int = 16, max_wait: float = 10.0, on_batch=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        # on_batch(batch size) after every dispatched batch, e.g. for metrics
+        self.on_batch = on_batch
+        self._queue = deque()
+        self._loop = None
+        self._wakeup = None
+        self._worker = None
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def is_full(self) -> bool:
+        return len(self._queue) >= self.max_queued
+
+    def _start(self, loop):
+        # The worker belongs to one event loop; a new loop (e.g. a server restart in-process) gets a new one
+        self._loop = loop
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self._worker = loop.create_task(self._run())
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker.done():
+            self._start(loop)
+        if self.is_full():
+            raise BatchQueueFull(f"Too many queued requests (max {self.max_queued})")
+        pending = _Pending(item, loop.create_future(), time.monotonic())
+        pending.expiry = loop.call_later(self.max_wait, self._expire, pending)
+        self._queue.append(pending)
+        self._wakeup.set()
+        return await pending.future
+
+    def _expire(self, pending):
+        # Still queued after max_wait: drop it and fail the caller now rather than after the running batch
+        try:
+            self._queue.remove(pending)
+        except ValueError:
+            return
+        if not pending.future.done():
+            pending.future.set_exception(
+                BatchQueueTimeout(f"Request waited more than {self.max_wait:g}s for inference"))
+
+    async def _next_batch(self) -> list:
+        while not self._queue:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        # Give concurrent callers until the oldest item's deadline to join, unless the batch is full
+        deadline = self._queue[0].enqueued_at + self.max_delay
+        while len(self._queue) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+        batch = []
+        while self._queue and len(batch) < self.max_batch_size:
+            pending = self._queue.popleft()
+            pending.expiry.cancel()
+            if pending.future.done():
+                continue  # caller went away
+            batch.append(pending)
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            try:
+                results = await asyncio.to_thread(self.run_batch, [pending.item for pending in batch])
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {e}")
+                results = [e] * len(batch)
+            if self.on_batch is not None:
+                self.on_batch(len(batch))
+            for pending, result in zip(batch, results):
+                if pending.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    pending.future.set_exception(result)
+                else:
+                    pending.future.set_result(result)
+
+    async def close(self):
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+        for pending in self._queue:
+            pending.expiry.cancel()
+            if not pending.future.done():
+                pending.future.cancel()
+        self._queue.clear()
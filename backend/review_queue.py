@@ -0,0 +1,258 @@
+import heapq
+import logging
+import math
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# (low, high, weight): detections with low < confidence < high are queued for review, with their
+# uncertainty scaled by weight. Defaults match the tkinter tool's CONF_LOW / CONF_HIGH.
+DEFAULT_BANDS = [(0.1, 0.5, 1.0)]
+DEFAULT_LEASE_SECONDS = 300
+# Change log rows applied per query while catching up with the store
+SYNC_BATCH_SIZE = 1000
+# Heaps are rebuilt from the live items once stale entries outnumber live ones this many times
+# (never below HEAP_COMPACT_MIN entries, so small queues aren't rebuilt constantly)
+HEAP_COMPACT_FACTOR = 2
+HEAP_COMPACT_MIN = 1024
+
+
+def uncertainty(confidence: float) -> float:
+    # Binary entropy of the confidence, in bits: 1.0 at 0.5, 0.0 at 0 or 1
+    p = min(max(confidence, 1e-12), 1 - 1e-12)
+    return -(p * math.log2(p) + (1 - p) * math.log2(1 - p))
+
+
+class ReviewQueue:
+    """Unvalidated detections, most uncertain first, handed out to reviewers as leases.
+
+    Each defect class has its own heap keyed by band weight * uncertainty(confidence). The queue
+    is loaded from the store once and then kept current by replaying the store's change log, so a
+    detection that gets validated, deleted or re-detected drops out (or moves) without a rescan.
+    next() takes the best head among the classes under quota, O(classes + log n) per detection,
+    and leases what it returns for lease_seconds; unanswered leases go back into the queue.
+    class_quotas ({defect_type: max leases out at once}) stop one abundant class from taking all
+    reviewer time; a class at quota is skipped without touching its heap.
+    """
+
+    def __init__(self, store, bands: list = None, class_quotas: dict = None,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.store = store
+        self.bands = sorted(bands or DEFAULT_BANDS)
+        self.class_quotas = dict(class_quotas or {})
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._seq = 0
+        self._heaps = {}        # defect_type -> [(-priority, detection id)]; stale entries skipped on pop
+        self._heap_entries = 0  # entries across all heaps, live or stale
+        self._items = {}        # detection id -> (priority, defect_type, uploaded_img)
+        self._by_image = {}     # uploaded_img -> set of queued/leased detection ids
+        self._leases = {}       # detection id -> (reviewer, expires_at)
+        self._lease_heap = []   # (expires_at, detection id)
+        self._leased_per_class = Counter()
+
+    def _priority(self, confidence: int):
+        # Stored confidences are int(conf * 1e10); None if outside every band
+        conf = confidence / 10**10
+        for low, high, weight in self.bands:
+            if low < conf < high:
+                return weight * uncertainty(conf)
+        return None
+
+    # ---- keeping in sync with the store ------------------------------
+
+    def _rebuild(self):
+        low = int(self.bands[0][0] * 10**10)
+        high = int(max(band[1] for band in self.bands) * 10**10)
+        self._seq, rows = self.store.unvalidated_snapshot(low, high)
+        leases = self._leases
+        self._items, self._by_image, self._heaps, self._heap_entries = {}, {}, {}, 0
+        self._leases, self._lease_heap, self._leased_per_class = {}, [], Counter()
+        for detection_id, uploaded_img, defect_type, confidence in rows:
+            self._add(detection_id, uploaded_img, defect_type, confidence)
+        # Outstanding leases survive a rebuild as long as their detection is still queued
+        for detection_id, (reviewer, expires_at) in leases.items():
+            if detection_id in self._items:
+                self._lease(detection_id, reviewer, expires_at)
+        self._loaded = True
+        logger.info(f"Review queue loaded: {len(self._items)} detections")
+
+    def _add(self, detection_id, uploaded_img, defect_type, confidence):
+        priority = self._priority(confidence)
+        if priority is None:
+            self._remove(detection_id)
+            return
+        previous = self._items.get(detection_id)
+        if previous is not None and previous[1] != defect_type and detection_id in self._leases:
+            # Relabelled while leased: move the lease to its new class
+            self._leased_per_class[previous[1]] -= 1
+            self._leased_per_class[defect_type] += 1
+        self._items[detection_id] = (priority, defect_type, uploaded_img)
+        self._by_image.setdefault(uploaded_img, set()).add(detection_id)
+        # An unchanged queued item already has its heap entry
+        if detection_id not in self._leases and (previous is None or previous[:2] != (priority, defect_type)):
+            self._push(detection_id)
+
+    def _push(self, detection_id):
+        priority, defect_type, _ = self._items[detection_id]
+        heapq.heappush(self._heaps.setdefault(defect_type, []), (-priority, detection_id))
+        self._heap_entries += 1
+        live = len(self._items) - len(self._leases)
+        if self._heap_entries > max(HEAP_COMPACT_MIN, HEAP_COMPACT_FACTOR * live):
+            self._compact()
+
+    def _compact(self):
+        # Drop every stale entry: one entry per queued (not leased) item, re-heapified per class
+        heaps = {}
+        for detection_id, (priority, defect_type, _) in self._items.items():
+            if detection_id not in self._leases:
+                heaps.setdefault(defect_type, []).append((-priority, detection_id))
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        self._heaps = heaps
+        self._heap_entries = sum(len(heap) for heap in heaps.values())
+
+    def _is_live(self, entry, defect_type):
+        neg_priority, detection_id = entry
+        item = self._items.get(detection_id)
+        return (item is not None and detection_id not in self._leases
+                and item[0] == -neg_priority and item[1] == defect_type)
+
+    def _head(self, defect_type):
+        # Highest-priority live entry of a class (stale entries above it are discarded), or None
+        heap = self._heaps[defect_type]
+        while heap and not self._is_live(heap[0], defect_type):
+            heapq.heappop(heap)
+            self._heap_entries -= 1
+        if not heap:
+            del self._heaps[defect_type]
+            return None
+        return heap[0]
+
+    def _remove(self, detection_id):
+        item = self._items.pop(detection_id, None)
+        if item is None:
+            return
+        ids = self._by_image.get(item[2])
+        if ids is not None:
+            ids.discard(detection_id)
+            if not ids:
+                del self._by_image[item[2]]
+        if self._leases.pop(detection_id, None) is not None:
+            self._leased_per_class[item[1]] -= 1
+
+    def _apply(self, change_type, payload):
+        if change_type in ("status_changed", "bbox_updated"):
+            detection = payload["detection"]
+            if detection["status"] == "unvalidated":
+                self._add(detection["id"], payload["uploaded_img"], detection["defect_type"], detection["confidence"])
+            else:
+                self._remove(detection["id"])
+        elif change_type == "detection_deleted":
+            self._remove(payload["detection"]["id"])
+        elif change_type in ("detection_added", "image_removed"):
+            # Re-detected images get new detection ids, so drop everything queued for the image first
+            for detection_id in list(self._by_image.get(payload["uploaded_img"], ())):
+                self._remove(detection_id)
+            for detection in payload.get("detections", []):
+                if detection["status"] == "unvalidated":
+                    self._add(detection["id"], payload["uploaded_img"], detection["defect_type"],
+                              detection["confidence"])
+        elif change_type == "cleared":
+            for detection_id in list(self._items):
+                self._remove(detection_id)
+
+    def _sync(self):
+        if not self._loaded:
+            self._rebuild()
+            return
+        oldest, _ = self.store.change_seq_range()
+        if oldest is not None and self._seq < oldest - 1:
+            # Fell behind the retained change log
+            self._rebuild()
+            return
+        while True:
+            rows = self.store.changes_since(self._seq, SYNC_BATCH_SIZE)
+            for seq, change_type, payload in rows:
+                self._apply(change_type, payload)
+                self._seq = seq
+            if len(rows) < SYNC_BATCH_SIZE:
+                break
+
+    # ---- leases ------------------------------------------------------
+
+    def _lease(self, detection_id, reviewer, expires_at):
+        self._leases[detection_id] = (reviewer, expires_at)
+        self._leased_per_class[self._items[detection_id][1]] += 1
+        heapq.heappush(self._lease_heap, (expires_at, detection_id))
+
+    def _expire_leases(self, now):
+        while self._lease_heap and self._lease_heap[0][0] <= now:
+            expires_at, detection_id = heapq.heappop(self._lease_heap)
+            lease = self._leases.get(detection_id)
+            if lease is None or lease[1] != expires_at:
+                continue  # released, answered or re-leased since
+            self._release(detection_id)
+
+    def _release(self, detection_id):
+        lease = self._leases.pop(detection_id, None)
+        if lease is None:
+            return False
+        self._leased_per_class[self._items[detection_id][1]] -= 1
+        self._push(detection_id)
+        return True
+
+    def release(self, detection_id: int) -> bool:
+        # Puts a leased detection back in the queue; False if it wasn't leased
+        with self._lock:
+            return self._release(detection_id)
+
+    def next(self, n: int = 1, reviewer: str = None) -> list:
+        """Lease up to n of the most uncertain queued detections.
+
+        Returns [{"detection_id", "uploaded_img", "defect_type", "priority", "lease_expires_at"}].
+        """
+        with self._lock:
+            self._sync()
+            now = time.time()
+            self._expire_leases(now)
+
+            leased = []
+            while len(leased) < n:
+                best = None  # (head entry, defect_type) with the highest priority among classes under quota
+                for defect_type in list(self._heaps):
+                    quota = self.class_quotas.get(defect_type)
+                    if quota is not None and self._leased_per_class[defect_type] >= quota:
+                        continue
+                    head = self._head(defect_type)
+                    if head is not None and (best is None or head < best[0]):
+                        best = (head, defect_type)
+                if best is None:
+                    break
+                (_, detection_id), defect_type = best
+                heapq.heappop(self._heaps[defect_type])
+                self._heap_entries -= 1
+                item = self._items[detection_id]
+                expires_at = now + self.lease_seconds
+                self._lease(detection_id, reviewer, expires_at)
+                leased.append({
+                    "detection_id": detection_id,
+                    "uploaded_img": item[2],
+                    "defect_type": item[1],
+                    "priority": round(item[0], 6),
+                    "lease_expires_at": expires_at,
+                })
+            return leased
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._sync()
+            self._expire_leases(time.time())
+            return {
+                "queued": len(self._items) - len(self._leases),
+                "leased": len(self._leases),
+                "leased_per_class": {k: v for k, v in self._leased_per_class.items() if v},
+            }
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from request_batcher import BatchQueueTimeout, RequestBatcher
+
+
+def test_queued_request_times_out_while_a_batch_runs():
+    release = threading.Event()
+
+    def run_batch(items):
+        # The first batch holds the worker until the test lets it go
+        if items == ["slow"]:
+            release.wait(5)
+        return [f"done {item}" for item in items]
+
+    async def scenario():
+        batcher = RequestBatcher(run_batch, max_batch_size=1, max_delay=0, max_wait=0.2)
+        slow = asyncio.ensure_future(batcher.submit("slow"))
+        await asyncio.sleep(0.05)  # "slow" is now running
+        start = time.monotonic()
+        with pytest.raises(BatchQueueTimeout):
+            await batcher.submit("queued")
+        waited = time.monotonic() - start
+        assert batcher.queue_depth() == 0
+        release.set()
+        assert await slow == "done slow"
+        await batcher.close()
+        return waited
+
+    waited = asyncio.run(scenario())
+    assert 0.15 < waited < 0.5
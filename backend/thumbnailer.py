@@ -0,0 +1,75 @@
+import hashlib
+import io
+import logging
+import os
+
+from PIL import Image
+
+from image_cache import MemoryLRUCache, DiskLRUCache
+
+logger = logging.getLogger(__name__)
+
+# Requested sizes are snapped up to one of these, so the cache holds a few variants per image
+SIZE_BUCKETS = (256, 640, 1280)
+THUMBNAIL_JPEG_QUALITY = 85
+
+
+def snap_size(size: int = None):
+    # None (or anything above the largest bucket) means full resolution
+    if size is None:
+        return None
+    for bucket in SIZE_BUCKETS:
+        if size <= bucket:
+            return bucket
+    return None
+
+
+class Thumbnailer:
+    """Size-bucketed JPEG derivatives of source images, cached in memory and on disk.
+
+    Derivatives are keyed by the source path, size and mtime, so replacing a source file
+    invalidates its thumbnails without any bookkeeping.
+    """
+
+    def __init__(self, cache_dir: str, memory_bytes: int = 64 * 1024 * 1024,
+                 disk_bytes: int = 1024 * 1024 * 1024):
+        self.memory_cache = MemoryLRUCache(memory_bytes)
+        self.disk_cache = DiskLRUCache(cache_dir, disk_bytes)
+
+    @staticmethod
+    def cache_key(source_path: str, size: int) -> str:
+        st = os.stat(source_path)
+        raw = f"{os.path.abspath(source_path)}|{st.st_size}|{st.st_mtime_ns}|{size}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get_thumbnail(self, source_path: str, size: int, key: str = None) -> bytes:
+        key = key or self.cache_key(source_path, size)
+
+        data = self.memory_cache.get(key)
+        if data is not None:
+            return data
+
+        data = self.disk_cache.get(key)
+        if data is None:
+            data = self._render(source_path, size)
+            self.disk_cache.put(key, data)
+        self.memory_cache.put(key, data)
+        return data
+
+    @staticmethod
+    def _render(source_path: str, size: int) -> bytes:
+        with Image.open(source_path) as image:
+            # For JPEGs, draft() makes the decoder itself downscale by 1/2, 1/4 or 1/8 (DCT scaling),
+            # so a 4000px capture is never fully decoded just to produce a 256px preview
+            if image.format == "JPEG":
+                image.draft("RGB", (size, size))
+            image = image.convert("RGB")
+            image.thumbnail((size, size), Image.LANCZOS)
+
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=THUMBNAIL_JPEG_QUALITY, optimize=True)
+        return out.getvalue()
+
+    def clear(self):
+        self.memory_cache.clear()
+        self.disk_cache.clear()
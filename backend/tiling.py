@@ -0,0 +1,72 @@
+import numpy as np
+
+from box_ops import batched_nms, weighted_boxes_fusion
+
+MERGE_METHODS = ("nms", "wbf")
+# Boxes of one defect found in neighbouring tiles (and the full frame) overlap at least this much
+MERGE_IOU_THRESHOLD = 0.5
+
+
+def _starts(length: int, tile: int, step: int) -> list:
+    # Tile offsets along one axis; the last tile is shifted inward so every tile has full size
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def tile_windows(height: int, width: int, tile_size: int, overlap: float) -> list:
+    """(x0, y0, x1, y1) windows covering the image with `overlap` (fraction of tile_size) between
+    neighbours. All windows share one shape, so they can go through the model as one batch."""
+    if tile_size < 32:
+        raise ValueError("tile_size must be >= 32")
+    if not 0 <= overlap < 1:
+        raise ValueError("overlap must be in [0, 1)")
+    tile_h, tile_w = min(tile_size, height), min(tile_size, width)
+    step = max(1, int(tile_size * (1 - overlap)))
+    return [
+        (x0, y0, x0 + tile_w, y0 + tile_h)
+        for y0 in _starts(height, tile_h, step)
+        for x0 in _starts(width, tile_w, step)
+    ]
+
+
+def offset_detections(detections: list, x0: int, y0: int) -> list:
+    # Tile coordinates -> frame coordinates (in place)
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        det["bbox"] = [x1 + x0, y1 + y0, x2 + x0, y2 + y0]
+    return detections
+
+
+def merge_detections(detections: list, method: str = "nms", iou_threshold: float = MERGE_IOU_THRESHOLD) -> list:
+    """Merge the per-tile (and full-frame) detections of one image, class by class.
+
+    nms keeps the highest-scoring box of each overlapping group; wbf replaces the group by the
+    score-weighted mean box.
+    """
+    if method not in MERGE_METHODS:
+        raise ValueError(f"Unknown merge method '{method}', use one of {MERGE_METHODS}")
+    if not detections:
+        return []
+
+    boxes = np.array([det["bbox"] for det in detections], dtype=np.float32)
+    scores = np.array([det["confidence"] for det in detections], dtype=np.float64) / 10**10
+    classes = np.array([det["defect_id"] for det in detections])
+
+    if method == "nms":
+        return [detections[i] for i in batched_nms(boxes, scores, classes, iou_threshold)]
+
+    names = {det["defect_id"]: det["defect_type"] for det in detections}
+    fused_boxes, fused_scores, fused_classes = weighted_boxes_fusion(boxes, scores, classes, iou_threshold)
+    return [
+        {
+            "defect_id": int(defect_id),
+            "defect_type": names[int(defect_id)],
+            "confidence": int(float(score) * (10**10)),
+            "bbox": box.tolist(),
+            "status": "unvalidated"
+        }
+        for box, score, defect_id in zip(fused_boxes, fused_scores, fused_classes)
+    ]
@@ -1,64 +1,26 @@
+import hashlib
 import json
+import logging
 import os
 import shutil
-import cv2
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-def convert_to_yolov11(metadata_path: str, output_dir: str):
-    # Define subfolders for YOLOv11 structure
-    train_img_dir = os.path.join(output_dir, "train/images")
-    train_lbl_dir = os.path.join(output_dir, "train/labels")
-    valid_img_dir = os.path.join(output_dir, "valid/images")
-    valid_lbl_dir = os.path.join(output_dir, "valid/labels")
-    test_img_dir = os.path.join(output_dir, "test/images")
-    test_lbl_dir = os.path.join(output_dir, "test/labels")
+from PIL import Image
 
-    # Make directories
-    for d in [train_img_dir, train_lbl_dir, valid_img_dir, valid_lbl_dir, test_img_dir, test_lbl_dir]:
-        os.makedirs(d, exist_ok=True)
+from content_hash import sha256_file
 
-    # Load metadata
-    with open(metadata_path, "r") as f:
-        metadata = json.load(f)
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
-    total = len(metadata)
-    train_end = int(total * 1.0)
-
-    for idx, item in enumerate(metadata):
-        image_name = item["uploaded_img"]
-        detections = item.get("detections", [])
+logger = logging.getLogger(__name__)
 
-        # Path to input image
-        src_img_path = os.path.join("uploaded_img", image_name)
-        if not os.path.exists(src_img_path):
-            continue  # skip missing images
-
-        # Deterministic split by index
-        if idx < train_end:
-            img_out_dir, lbl_out_dir = train_img_dir, train_lbl_dir
-
-        # Copy image
-        dst_img_path = os.path.join(img_out_dir, image_name)
-        shutil.copy(src_img_path, dst_img_path)
-
-        # Get image size for normalization
-        img = cv2.imread(src_img_path)
-        h, w, _ = img.shape
-
-        # Write YOLOv11 label file
-        label_path = os.path.join(lbl_out_dir, os.path.splitext(image_name)[0] + ".txt")
-        with open(label_path, "w") as lf:
-            for det in detections:
-                cls = det["defect_id"]
-                x1, y1, x2, y2 = det["bbox"]  # assuming absolute coords
-                # Normalize
-                xc = ((x1 + x2) / 2) / w
-                yc = ((y1 + y2) / 2) / h
-                bw = (x2 - x1) / w
-                bh = (y2 - y1) / h
-                lf.write(f"{cls} {xc:.6f} {yc:.6f} {bw:.6f} {bh:.6f}\n")
-
-    # Write data.yaml file
-    yaml_content = """train: ../train/images
+# Label writes and image links are I/O-bound, so threads are enough
+EXPORT_WORKERS = 8
+DATA_YAML = """train: ../train/images
 val: ../valid/images
 test: ../test/images
 
@@ -72,8 +34,248 @@ roboflow:
   license: CC BY 4.0
   url: https://universe.roboflow.com/planthealthml/plantdefecttest/dataset/3
 """
+
+DATASET_DIRS = ["train/images", "train/labels", "valid/images", "valid/labels", "test/images", "test/labels"]
+# Already-compressed formats are stored as-is in zips; deflating them costs CPU for ~0% gain
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png")
+ZIP_STREAM_CHUNK_SIZE = 1024 * 1024
+# Written by incremental exports: one arcname per line that the previous export had and this one doesn't
+DELETED_LIST = "deleted.txt"
+
+# ioctl(FICLONE) from linux/fs.h: copy-on-write clone on btrfs / xfs
+FICLONE = 0x40049409
+
+
+def image_size(path: str):
+    # (width, height) from the file header; PIL doesn't decode pixel data until asked to.
+    # These are the raw (un-rotated) dimensions, the same frame inference boxes are in.
+    with Image.open(path) as image:
+        return image.size
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    # Places src at dst as cheaply as the filesystem allows; returns the method used
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return "reflink"
+        except OSError:
+            os.remove(dst)
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+def yolo_label_lines(detections, w, h):
+    lines = []
+    for det in detections:
+        cls = det["defect_id"]
+        x1, y1, x2, y2 = det["bbox"]  # assuming absolute coords
+        # Normalize
+        xc = ((x1 + x2) / 2) / w
+        yc = ((y1 + y2) / 2) / h
+        bw = (x2 - x1) / w
+        bh = (y2 - y1) / h
+        lines.append(f"{cls} {xc:.6f} {yc:.6f} {bw:.6f} {bh:.6f}\n")
+    return "".join(lines)
+
+
+def _plan_item(item, img_out_dir, lbl_out_dir):
+    # The files one metadata entry contributes: its image (by path) and its label (as text)
+    image_name = item["uploaded_img"]
+    detections = item.get("detections", [])
+
+    # Path to input image
+    src_img_path = os.path.join("uploaded_img", image_name)
+    if not os.path.exists(src_img_path):
+        return []  # skip missing images
+
+    # Image size for normalization: recorded at inference time, else read from the header
+    if item.get("width") and item.get("height"):
+        w, h = item["width"], item["height"]
+    else:
+        try:
+            w, h = image_size(src_img_path)
+        except OSError as e:
+            logger.error(f"Skipping unreadable image {src_img_path}: {e}")
+            return []
+
+    label_name = os.path.splitext(image_name)[0] + ".txt"
+    return [
+        (f"{img_out_dir}/{image_name}", src_img_path, None),
+        (f"{lbl_out_dir}/{label_name}", None, yolo_label_lines(detections, w, h)),
+    ]
+
+
+def plan_yolov11_export(metadata, workers: int = EXPORT_WORKERS):
+    """Every file of the YOLOv11 dataset as (arcname, source_path, text), without writing anything.
+
+    Images carry the path they are linked/streamed from, labels and data.yaml their content.
+    metadata is the list of image entries (e.g. MetadataStore.load_all()) or a path to a JSON dump of it.
+    """
+    if isinstance(metadata, str):
+        with open(metadata, "r") as f:
+            metadata = json.load(f)
+
+    total = len(metadata)
+    train_end = int(total * 1.0)
+
+    jobs = []
+    for idx, item in enumerate(metadata):
+        # Deterministic split by index
+        if idx < train_end:
+            img_out_dir, lbl_out_dir = "train/images", "train/labels"
+        jobs.append((item, img_out_dir, lbl_out_dir))
+
+    # Header reads (for entries without a recorded size) are I/O-bound, so threads are enough
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        files = [spec for specs in pool.map(lambda job: _plan_item(*job), jobs) for spec in specs]
+    files.append(("data.yaml", None, DATA_YAML))
+    return files
+
+
+def manifest_for(files, hash_file=sha256_file) -> dict:
+    # arcname -> sha256 of its content; hash_file lets callers use a memoised hasher (FileHashIndex)
+    return {
+        arcname: hash_file(source) if source is not None else hashlib.sha256(text.encode()).hexdigest()
+        for arcname, source, text in files
+    }
+
+
+def changed_since(files, manifest: dict, previous: dict):
+    # Files that are new or whose content changed since `previous`, plus the arcnames that are gone
+    changed = [spec for spec in files if previous.get(spec[0]) != manifest[spec[0]]]
+    deleted = sorted(set(previous) - set(manifest))
+    return changed, deleted
+
+
+def _write_file(spec, output_dir):
+    arcname, source, text = spec
+    dst = os.path.join(output_dir, arcname)
+    if source is not None:
+        return link_or_copy(source, dst)
+    with open(dst, "w") as f:
+        f.write(text)
+    return "text"
+
+
+def convert_to_yolov11(metadata, output_dir: str, workers: int = EXPORT_WORKERS,
+                       files: list = None, deleted: list = None):
+    # files (from plan_yolov11_export, possibly filtered by changed_since) defaults to the whole
+    # dataset; with deleted set, this is an incremental export and deleted.txt lists removed files
+    # Define subfolders for YOLOv11 structure
+    train_img_dir = os.path.join(output_dir, "train/images")
+    train_lbl_dir = os.path.join(output_dir, "train/labels")
+    valid_img_dir = os.path.join(output_dir, "valid/images")
+    valid_lbl_dir = os.path.join(output_dir, "valid/labels")
+    test_img_dir = os.path.join(output_dir, "test/images")
+    test_lbl_dir = os.path.join(output_dir, "test/labels")
+
+    # Make directories
+    for d in [train_img_dir, train_lbl_dir, valid_img_dir, valid_lbl_dir, test_img_dir, test_lbl_dir]:
+        os.makedirs(d, exist_ok=True)
+
+    if files is None:
+        files = plan_yolov11_export(metadata, workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        methods = Counter(pool.map(lambda spec: _write_file(spec, output_dir), files))
+    images = sum(count for method, count in methods.items() if method != "text")
+    logger.info(f"Exported {images} images, {methods['text']} text files to {output_dir} ({dict(methods)})")
+
+    if deleted is not None:
+        with open(os.path.join(output_dir, DELETED_LIST), "w") as f:
+            f.writelines(f"{arcname}\n" for arcname in deleted)
+
     yaml_path = os.path.join(output_dir, "data.yaml")
-    with open(yaml_path, "w") as f:
-        f.write(yaml_content)
+    return {"status": "success", "output_dir": output_dir,
+            "yaml": yaml_path if os.path.exists(yaml_path) else None,
+            "images": images, "files": len(files), "transfer": dict(methods)}
+
+
+class _ZipStreamBuffer:
+    """Write-only sink for ZipFile that hands out what has been written so far.
+
+    It can tell() but not seek(), so zipfile writes data descriptors after each member
+    instead of seeking back to patch headers, which is what makes the archive streamable.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def seekable(self):
+        return False
+
+    def seek(self, *args):
+        raise OSError("stream is not seekable")
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _drain(buffer):
+    # Deflated members are buffered inside zipfile, so a write doesn't always produce output
+    data = buffer.pop()
+    if data:
+        yield data
+
+
+def stream_yolov11_zip(files, deleted: list = None, chunk_size: int = ZIP_STREAM_CHUNK_SIZE):
+    """Yields a zip of `files` (from plan_yolov11_export / changed_since) without touching disk.
+
+    Labels and data.yaml come from memory, images are read straight from uploaded_img in
+    chunk_size pieces, so memory stays flat and the first bytes go out immediately. With
+    deleted set, the archive also carries deleted.txt, like an incremental convert_to_yolov11.
+    """
+    buffer = _ZipStreamBuffer()
+    images = 0
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for d in DATASET_DIRS:
+            zf.writestr(zipfile.ZipInfo(d + "/"), b"")
+
+        for arcname, source, text in files:
+            if source is None:
+                zf.writestr(arcname, text)
+                yield from _drain(buffer)
+                continue
+
+            try:
+                info = zipfile.ZipInfo.from_file(source, arcname)
+            except OSError as e:
+                logger.error(f"Skipping {source}: {e}")
+                continue
+            info.compress_type = (zipfile.ZIP_STORED if arcname.lower().endswith(STORED_EXTENSIONS)
+                                  else zipfile.ZIP_DEFLATED)
+            with open(source, "rb") as src, zf.open(info, "w") as dst:
+                for chunk in iter(lambda: src.read(chunk_size), b""):
+                    dst.write(chunk)
+                    yield from _drain(buffer)
+            images += 1
+            yield from _drain(buffer)
 
-    return {"status": "success", "output_dir": output_dir, "yaml": yaml_path}
+        if deleted is not None:
+            zf.writestr(DELETED_LIST, "".join(f"{arcname}\n" for arcname in deleted))
+    # Central directory
+    yield from _drain(buffer)
+    logger.info(f"Streamed {images} images as a zip")
@@ -1,7 +1,7 @@
-import React, { useRef, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { Download, Trash2 } from 'lucide-react';
 
-// Add available models
+// Display names for known models; the selectable list itself comes from GET /models
 const AVAILABLE_MODELS = [
   { id: 'HQx1280', name: 'High Quality 1280px' },
   { id: 'modelv4_l_0.2', name: 'Model v4 Large' }
@@ -18,6 +18,25 @@ export const ProgressBar: React.FC<ProgressBarProps> = ({ progress, current, tot
   const [isDetecting, setIsDetecting] = useState(false);
   const [isConverting, setIsConverting] = useState(false);
   const [selectedModel, setSelectedModel] = useState(AVAILABLE_MODELS[0].id);
+  // Sliced inference, for high-resolution captures with small defects
+  const [tiled, setTiled] = useState(false);
+  const [jobProgress, setJobProgress] = useState(0);
+  const [models, setModels] = useState(AVAILABLE_MODELS);
+
+  // Offer whatever weight files the backend has under models/ (falls back to the static list)
+  useEffect(() => {
+    fetch('http://localhost:8000/models')
+      .then(res => res.ok ? res.json() : null)
+      .then(data => {
+        if (!data?.models?.length) return;
+        setModels(data.models.map((m: any) => ({
+          id: m.name,
+          name: AVAILABLE_MODELS.find(known => known.id === m.name)?.name ?? m.name,
+        })));
+        setSelectedModel(data.default);
+      })
+      .catch(() => {});
+  }, []);
 
   // --- Upload handler ---
   const handleBulkUpload = async (event: React.ChangeEvent<HTMLInputElement>) => {
@@ -36,28 +55,45 @@ export const ProgressBar: React.FC<ProgressBarProps> = ({ progress, current, tot
 
     const result = await response.json();
     if (result.success) {
-      alert(`Uploaded files: ${result.saved_files.join(', ')}`);
+      const deduplicated = result.deduplicated_files.map((d: any) => `${d.filename} (= ${d.same_as})`);
+      alert(
+        `Uploaded files: ${result.saved_files.join(', ')}` +
+        (deduplicated.length ? `\nAlready uploaded under another name: ${deduplicated.join(', ')}` : '') +
+        (result.skipped_files.length ? `\nSkipped (name exists): ${result.skipped_files.join(', ')}` : '')
+      );
     } else {
       alert('Bulk upload failed');
     }
   };
 
   // --- Modified bulk detect handler with model selection ---
+  // Bulk detection runs as a background job on the backend; poll it until it finishes
   const handleBulkDetect = async () => {
     try {
       setIsDetecting(true);
+      setJobProgress(0);
       const response = await fetch('http://localhost:8000/bulk-detect', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ model: selectedModel })
+        body: JSON.stringify({ model: selectedModel, tiled })
       });
 
-      const result = await response.json();
-      console.log(result);
+      const submitted = await response.json();
+      if (!response.ok || !submitted.job_id) throw new Error(submitted.detail || "Job submission failed");
 
-      alert(`Processed ${result.processed} images!`);
+      let job: any = submitted;
+      while (!['completed', 'failed', 'cancelled'].includes(job.status)) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const jobResponse = await fetch(`http://localhost:8000/jobs/${submitted.job_id}?timings=false`);
+        job = await jobResponse.json();
+        setJobProgress(Math.round(job.progress ?? 0));
+      }
+      console.log(job);
+
+      if (job.status !== 'completed') throw new Error(`Detection job ${job.status}`);
+      alert(`Processed ${job.result.processed} images!`);
       window.location.reload();
     } catch (error) {
       console.error("Detection failed", error);
@@ -78,7 +114,7 @@ export const ProgressBar: React.FC<ProgressBarProps> = ({ progress, current, tot
       const result = await response.json();
       console.log(result);
 
-      alert(`✅ Conversion complete: ${result.output_path}`);
+      alert(`✅ Conversion complete: ${result.output_dir} (export id ${result.export_id})`);
     } catch (error) {
       console.error("Conversion failed", error);
       alert("Conversion failed!");
@@ -88,29 +124,15 @@ export const ProgressBar: React.FC<ProgressBarProps> = ({ progress, current, tot
   };
 
   // --- Download Yolov11 handler ---
-  const handleDownloadAnnotations = async () => {
-    try {
-      const response = await fetch('http://localhost:8000/download-annotations', {
-        method: 'GET',
-      });
-
-      if (!response.ok) throw new Error("Failed to download annotations");
-
-      const blob = await response.blob();
-      const url = window.URL.createObjectURL(blob);
-
-      const link = document.createElement('a');
-      link.href = url;
-      link.download = 'annotations.zip';
-      document.body.appendChild(link);
-      link.click();
-      link.remove();
-
-      window.URL.revokeObjectURL(url);
-    } catch (error) {
-      console.error("Download failed", error);
-      alert("Download failed!");
-    }
+  // The backend streams the zip as it builds it; let the browser's download manager
+  // write it to disk instead of buffering the whole archive into a blob first
+  const handleDownloadAnnotations = () => {
+    const link = document.createElement('a');
+    link.href = 'http://localhost:8000/download-annotations';
+    link.download = 'annotations.zip';
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
   };
 
   // --- Clear folder with confirmation ---
@@ -138,6 +160,7 @@ export const ProgressBar: React.FC<ProgressBarProps> = ({ progress, current, tot
 
   // Spinner / Loading Overlay
   if (isDetecting || isConverting) {
+    const overlayProgress = isDetecting ? jobProgress : progress;
     return (
       <div className="fixed inset-0 z-50 flex items-center justify-center bg-black bg-opacity-50 backdrop-blur-sm">
         <div className="relative bg-white rounded-2xl shadow-2xl p-10 max-w-lg w-full text-center">
@@ -145,7 +168,7 @@ export const ProgressBar: React.FC<ProgressBarProps> = ({ progress, current, tot
           <div className="relative flex items-center justify-center mb-6">
             <div className="animate-spin rounded-full h-16 w-16 border-t-4 border-green-500 border-opacity-70"></div>
             <span className="absolute text-lg font-semibold text-gray-700">
-              {progress}%
+              {overlayProgress}%
             </span>
           </div>
 
@@ -159,7 +182,7 @@ export const ProgressBar: React.FC<ProgressBarProps> = ({ progress, current, tot
           {/* Description */}
           <p className="text-gray-600 mb-6">
             {isDetecting
-              ? `Processing images... (${progress})`
+              ? `Processing images... (${overlayProgress}%)`
               : "Please wait while dataset is being converted."}
           </p>
 
@@ -167,7 +190,7 @@ export const ProgressBar: React.FC<ProgressBarProps> = ({ progress, current, tot
           <div className="w-full bg-gray-200 rounded-full h-3 overflow-hidden">
             <div
               className="bg-green-500 h-3 rounded-full transition-all duration-300"
-              style={{ width: `${progress}%` }}
+              style={{ width: `${overlayProgress}%` }}
             ></div>
           </div>
         </div>
@@ -220,12 +243,16 @@ export const ProgressBar: React.FC<ProgressBarProps> = ({ progress, current, tot
             onChange={(e) => setSelectedModel(e.target.value)}
             className="px-2 py-1 border rounded bg-white"
           >
-            {AVAILABLE_MODELS.map(model => (
+            {models.map(model => (
               <option key={model.id} value={model.id}>
                 {model.name}
               </option>
             ))}
           </select>
+          <label className="flex items-center gap-1 text-sm" title="Run high-resolution images as overlapping tiles">
+            <input type="checkbox" checked={tiled} onChange={(e) => setTiled(e.target.checked)} />
+            Tiled
+          </label>
           
           <button
             className="px-3 py-1 bg-blue-500 text-white rounded hover:bg-blue-600"
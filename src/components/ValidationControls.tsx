@@ -1,6 +1,7 @@
 import React, { useState } from 'react';
 import { Check, X, AlertTriangle, Trash2, Album } from 'lucide-react';
 import { DEFECT_CLASSES } from '../types';
+import { queueValidation } from '../hooks/validationQueue';
 
 interface ValidationControlsProps {
   onValidate: (decision: "correct" | "healthy" | "other" |"uncertain"| "next" | "back", className?: string) => void;
@@ -15,47 +16,23 @@ export const ValidationControls: React.FC<ValidationControlsProps> = ({
 }) => {
   const [selectedClass, setSelectedClass] = useState(DEFECT_CLASSES[0]);
   
-  const validateDetection = async (
+  // Decisions are queued and sent in batches, so the UI never waits on the server
+  const validateDetection = (
     decision: "correct" | "healthy" | "other" | "uncertain" ,
     className?: string
   ) => {
-    try {
-      let body: any = { decision };
-
-      if (decision === "other" && className) {
-        body.defect_type = className;
-      }
-
-      const res = await fetch(`http://localhost:8000/detections/${confidence}/validate`, {
-        method: "PATCH",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(body),
-      });
-
-      if (!res.ok) throw new Error("Failed to update detection");
-      const updated = await res.json();
-      console.log("Detection updated:", updated);
-
-      onValidate(decision, className);
-    } catch (err) {
-      console.error("Error updating detection:", err);
-    }
+    queueValidation({
+      op: "validate",
+      confidence,
+      decision,
+      ...(decision === "other" && className ? { defect_type: className } : {}),
+    });
+    onValidate(decision, className);
   };
 
-  const deleteDetection = async () => {
-    try {
-      const res = await fetch(`http://localhost:8000/detections/${confidence}`, {
-        method: "DELETE",
-      });
-
-      if (!res.ok) throw new Error("Failed to delete detection");
-      const result = await res.json();
-      console.log("Detection deleted:", result);
-
-      onValidate("healthy");
-    } catch (err) {
-      console.error("Error deleting detection:", err);
-    }
+  const deleteDetection = () => {
+    queueValidation({ op: "delete", confidence });
+    onValidate("healthy");
   };
 
 return (
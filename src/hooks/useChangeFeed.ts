@@ -0,0 +1,71 @@
+import { useEffect, useRef } from "react";
+
+export interface ChangeEvent {
+  type: string;
+  data: any;
+}
+
+const CHANGE_EVENT_TYPES = [
+  "status_changed",
+  "bbox_updated",
+  "detection_deleted",
+  "detection_added",
+  "image_removed",
+  "cleared",
+  "resync",
+  "job_progress",
+];
+
+// Subscribes to the server's /changes event stream while `since` is set.
+// `since` is the X-Change-Seq header of the /metadata response the caller rendered; the browser
+// resumes from the last received event id on its own after a dropped connection.
+export const useChangeFeed = (since: number | null, onChange: (event: ChangeEvent) => void) => {
+  // Always call the latest callback without reopening the stream on every render
+  const onChangeRef = useRef(onChange);
+  onChangeRef.current = onChange;
+
+  useEffect(() => {
+    if (since === null) return;
+
+    const source = new EventSource(`http://localhost:8000/changes?since=${since}`);
+    const handler = (e: MessageEvent) => {
+      onChangeRef.current({ type: e.type, data: JSON.parse(e.data) });
+    };
+    CHANGE_EVENT_TYPES.forEach((type) => source.addEventListener(type, handler));
+
+    return () => source.close();
+  }, [since]);
+};
+
+// X-Change-Seq of a /metadata response, or null if the server didn't send one
+export const changeSeqOf = (response: Response): number | null => {
+  const seq = response.headers.get("X-Change-Seq");
+  return seq === null ? null : parseInt(seq, 10);
+};
+
+// Applies a change to raw /metadata detections grouped by image (uploaded_img -> detections).
+// Returns "changed" if the map was updated, "reload" if the caller must refetch, null otherwise.
+// Detections only need the fields the caller fetched plus `id`.
+export const applyChangeToDetections = (
+  byImage: Map<string, any[]>,
+  { type, data }: ChangeEvent
+): "changed" | "reload" | null => {
+  if (type === "resync" || type === "cleared") return "reload";
+
+  const detections = byImage.get(data.uploaded_img);
+  if (type === "status_changed" || type === "bbox_updated") {
+    const idx = detections ? detections.findIndex((d) => d.id === data.detection.id) : -1;
+    if (!detections || idx === -1) return null;
+    detections[idx] = { ...detections[idx], ...data.detection };
+  } else if (type === "detection_deleted") {
+    if (!detections) return null;
+    byImage.set(data.uploaded_img, detections.filter((d) => d.id !== data.detection.id));
+  } else if (type === "detection_added") {
+    byImage.set(data.uploaded_img, data.detections);
+  } else if (type === "image_removed") {
+    if (!byImage.delete(data.uploaded_img)) return null;
+  } else {
+    return null;
+  }
+  return "changed";
+};
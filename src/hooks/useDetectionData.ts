@@ -1,33 +1,40 @@
 import { useState, useEffect, useRef } from "react";
 import { Detection, ImageData } from "../types";
-
-// --- Fetch metadata only once ---
-const fetchDetectionMetadata = async (): Promise<ImageData[]> => {
-  const response = await fetch(
-    `http://localhost:8000/metadata?t=${Date.now()}` // cache-bust
-  );
+import { ChangeEvent, changeSeqOf, useChangeFeed } from "./useChangeFeed";
+
+const toDetection = (det: any): Detection => ({
+  id: det.id,
+  defect_id: det.defect_id,
+  defect_type: det.defect_type,
+  confidence: parseFloat(det.confidence), // convert to number here
+  bbox: det.bbox,
+  status: det.status,
+  crop_path: `http://localhost:8000/${det.crop_path.replace(/\\/g, "/")}`,
+  validated: det.status !== "unvalidated",
+  validatedAs: undefined,
+});
+
+// --- Fetch metadata only once, then follow /changes ---
+const fetchDetectionMetadata = async (): Promise<{ images: ImageData[]; changeSeq: number | null }> => {
+  // Revalidate with the server's ETag instead of cache-busting; unchanged data comes back as a 304
+  const response = await fetch("http://localhost:8000/metadata", { cache: "no-cache" });
 
   if (!response.ok) throw new Error("Failed to fetch metadata");
 
   const metadata = await response.json();
 
-  return metadata.map((item: any) => ({
+  const images = metadata.map((item: any) => ({
     uploaded_img: item.uploaded_img,
-    processed_img: `http://localhost:8000/processed_img/${item.processed_img}`,
+    processed_img: `http://localhost:8000/${item.processed_img}`, // rendered on demand from current detections
     defect_count: item.defect_count,
-    detections: item.detections.map((det: any) => ({
-      defect_id: det.defect_id,
-      defect_type: det.defect_type,
-      confidence: parseFloat(det.confidence), // convert to number here
-      bbox: det.bbox,
-      status: det.status,
-      crop_path: `http://localhost:8000/${det.crop_path.replace(/\\/g, "/")}`,
-      validated: det.status !== "unvalidated",
-      validatedAs: undefined,
-    })),
+    detections: (item.detections ?? []).map(toDetection),
   }));
+  return { images, changeSeq: changeSeqOf(response) };
 };
 
+// How many upcoming images to preload while reviewing
+const PREFETCH_COUNT = 3;
+
 // Add FilterStatus type at the top
 export type FilterStatus = 'all' | 'validated' | 'unvalidated';
 
@@ -46,6 +53,9 @@ export const useDetectionData = () => {
 
   const [filterStatus, setFilterStatus] = useState<FilterStatus>('all');
 
+  // Change feed position of the loaded metadata (null until loaded)
+  const [changeSeq, setChangeSeq] = useState<number | null>(null);
+
   // Add filtered metadata getter
   const getFilteredMetadata = () => {
     return metadataRef.current.filter(img => {
@@ -80,7 +90,9 @@ export const useDetectionData = () => {
 
   // --- Load metadata once ---
   const reloadMetadata = async () => {
-    metadataRef.current = await fetchDetectionMetadata();
+    const { images, changeSeq } = await fetchDetectionMetadata();
+    metadataRef.current = images;
+    setChangeSeq(changeSeq);
 
     // Start at the first image that actually has detections
     const firstIdx = metadataRef.current.findIndex(
@@ -99,6 +111,51 @@ export const useDetectionData = () => {
     reloadMetadata();
   }, []);
 
+  // --- Apply server-side changes in place (other reviewers, bulk runs) ---
+  const applyChange = ({ type, data }: ChangeEvent) => {
+    if (type === "job_progress") return;
+    if (type === "resync" || type === "cleared") {
+      reloadMetadata();
+      return;
+    }
+
+    const images = metadataRef.current;
+    const imgIdx = images.findIndex((img) => img.uploaded_img === data.uploaded_img);
+    const img = imgIdx === -1 ? undefined : images[imgIdx];
+
+    if (type === "status_changed" || type === "bbox_updated") {
+      const detIdx = img ? img.detections.findIndex((d) => d.id === data.detection.id) : -1;
+      if (!img || detIdx === -1) return;
+      // Keep the local decision label, the server only knows the status
+      img.detections[detIdx] = { ...toDetection(data.detection), validatedAs: img.detections[detIdx].validatedAs };
+    } else if (type === "detection_deleted") {
+      if (!img) return;
+      img.detections = img.detections.filter((d) => d.id !== data.detection.id);
+      img.defect_count = img.detections.length;
+    } else if (type === "detection_added") {
+      const detections = data.detections.map(toDetection);
+      if (img) {
+        img.detections = detections;
+        img.defect_count = detections.length;
+      } else {
+        images.push({
+          uploaded_img: data.uploaded_img,
+          processed_img: `http://localhost:8000/annotated/${encodeURIComponent(data.uploaded_img)}`,
+          defect_count: detections.length,
+          detections,
+        });
+      }
+    } else if (type === "image_removed") {
+      if (imgIdx !== -1) images.splice(imgIdx, 1);
+    } else {
+      return;
+    }
+
+    updateWindow(currentImageIndex);
+  };
+
+  useChangeFeed(changeSeq, applyChange);
+
   // --- Sliding Window Management ---
   const updateWindow = (imgIndex: number) => {
     const windowSize = 5; // keep only 5 in state
@@ -106,6 +163,15 @@ export const useDetectionData = () => {
     const end = Math.min(metadataRef.current.length, start + windowSize);
 
     setWindowData(metadataRef.current.slice(start, end));
+
+    // Warm the browser cache with the previews of the next few images,
+    // so stepping forward doesn't wait on decode + resize server-side
+    metadataRef.current.slice(imgIndex + 1, imgIndex + 1 + PREFETCH_COUNT).forEach((img) => {
+      new Image().src = `${img.processed_img}?size=1280`;
+      img.detections.slice(0, 1).forEach((det) => {
+        new Image().src = `${det.crop_path}?size=640`;
+      });
+    });
   };
 
   // --- Getters for current image/detection ---
@@ -191,6 +257,26 @@ export const useDetectionData = () => {
 };
 
 
+  // --- Server-ranked review: jump to the most uncertain unvalidated detection ---
+  // The server leases it to this reviewer, so concurrent reviewers get different detections.
+  const goToMostUncertain = async () => {
+    const res = await fetch("http://localhost:8000/review/next?n=1");
+    if (!res.ok) return false;
+    const { items } = await res.json();
+    if (!items.length) return false;
+
+    const { uploaded_img, detection_id } = items[0];
+    const filteredData = getFilteredMetadata();
+    const imgIdx = filteredData.findIndex((img) => img.uploaded_img === uploaded_img);
+    if (imgIdx === -1) return false;
+    const detIdx = filteredData[imgIdx].detections.findIndex((d) => d.id === detection_id);
+
+    setCurrentImageIndex(imgIdx);
+    setCurrentDetectionIndex(Math.max(0, detIdx));
+    updateWindow(imgIdx);
+    return true;
+  };
+
   // --- Progress helpers ---
   const getTotalDetections = () =>
     metadataRef.current.reduce(
@@ -243,5 +329,6 @@ export const useDetectionData = () => {
     moveToNextImage,
     moveToPrevImage,
     goToImage,
+    goToMostUncertain,
   };
 };
@@ -0,0 +1,65 @@
+// Review decisions are queued locally and sent to POST /detections/batch in one request
+// every FLUSH_EVERY decisions or FLUSH_INTERVAL_MS, whichever comes first.
+const BATCH_URL = "http://localhost:8000/detections/batch";
+const FLUSH_EVERY = 20;
+const FLUSH_INTERVAL_MS = 3000;
+
+export type ValidationOperation =
+  | { op: "validate"; confidence: number; decision: string; defect_type?: string }
+  | { op: "relabel"; confidence: number; defect_type: string }
+  | { op: "update_bbox"; image_name: string; detection_id: number; bbox: number[]; defect_type?: string }
+  | { op: "delete"; confidence: number };
+
+let pending: ValidationOperation[] = [];
+let timer: ReturnType<typeof setTimeout> | null = null;
+let inFlight: Promise<void> | null = null;
+
+export const flushValidations = async (keepalive = false): Promise<void> => {
+  if (timer) {
+    clearTimeout(timer);
+    timer = null;
+  }
+  // One batch at a time keeps the server applying decisions in the order they were made
+  while (inFlight) await inFlight;
+  if (pending.length === 0) return;
+
+  const operations = pending;
+  pending = [];
+  inFlight = (async () => {
+    try {
+      const res = await fetch(BATCH_URL, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ operations }),
+        keepalive, // lets the last batch finish while the page unloads
+      });
+      if (!res.ok) throw new Error(`Batch rejected: ${res.status}`);
+      const result = await res.json();
+      result.results
+        .filter((r: any) => !r.ok)
+        .forEach((r: any) => console.error("Validation failed:", operations[r.index], r.error));
+    } catch (err) {
+      // Network/server failure: put the batch back in front of anything queued meanwhile
+      console.error("Error sending validations, will retry:", err);
+      pending = [...operations, ...pending];
+      scheduleFlush();
+    } finally {
+      inFlight = null;
+    }
+  })();
+  await inFlight;
+};
+
+const scheduleFlush = () => {
+  if (!timer) timer = setTimeout(() => flushValidations(), FLUSH_INTERVAL_MS);
+};
+
+export const queueValidation = (operation: ValidationOperation) => {
+  pending.push(operation);
+  if (pending.length >= FLUSH_EVERY) flushValidations();
+  else scheduleFlush();
+};
+
+export const pendingValidationCount = () => pending.length;
+
+window.addEventListener("pagehide", () => flushValidations(true));
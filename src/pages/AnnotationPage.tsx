@@ -31,8 +31,8 @@ const AnnotationPage: React.FC<AnnotationPageProps> = ({
   const [startPoint, setStartPoint] = useState<{ x: number; y: number } | null>(null);
 
   // Get full image URLs - can optmiise here later
-  const uploadedImageUrl = `http://localhost:8000/uploaded_img/${currentImage?.uploaded_img}`;
-  const processedImageUrl = currentImage?.processed_img;
+  const uploadedImageUrl = `http://localhost:8000/images/uploaded/${currentImage?.uploaded_img}?size=1280`;
+  const processedImageUrl = currentImage?.processed_img && `${currentImage.processed_img}?size=1280`;
 
   // Reset position and zoom when image changes
   useEffect(() => {
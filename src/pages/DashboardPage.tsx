@@ -1,6 +1,7 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { PieChart, Pie, BarChart, Bar, XAxis,YAxis, CartesianGrid,Tooltip,Legend,Cell,} from "recharts";
 import { Detection,DEFECT_CLASSES } from "../types";
+import { applyChangeToDetections, changeSeqOf, useChangeFeed } from "../hooks/useChangeFeed";
 
 interface DefectCount { name: string; value: number;}
 interface PieLabel { name: string; percent: number;}
@@ -29,45 +30,68 @@ const DashboardPage: React.FC = () => {
     {} as Record<string, string>
     );
 
-  useEffect(() => {
-    fetch("http://localhost:8000/metadata")
-      .then((res) => res.json())
-      .then((data) => {
-        const typeCount: Record<string, number> = {};
-        const statusCount: Record<string, number> = {
-          validated: 0,
-          unvalidated: 0,
-          healthy: 0,
-        };
-
-        data.forEach((item: any) => {
-          item.detections.forEach((det: Detection) => {
-            typeCount[det.defect_type] =
-              (typeCount[det.defect_type] || 0) + 1;
-
-            if (det.status === "validated") statusCount.validated++;
-            else if (det.status === "healthy") statusCount.healthy++;
-            else statusCount.unvalidated++;
-          });
-        });
-
-        // Sort descending
-        const sortedDefects = Object.entries(typeCount)
-          .map(([name, value]) => ({ name, value }))
-          .sort((a, b) => b.value - a.value);
-
-        const sortedStatus = Object.entries(statusCount)
-          .map(([name, value]) => ({
-            name: name.charAt(0).toUpperCase() + name.slice(1),
-            value,
-          }))
-          .sort((a, b) => b.value - a.value);
-
-        setDefectCounts(sortedDefects);
-        setValidationStatus(sortedStatus);
+  // Detections per image, kept current from the change feed
+  const byImageRef = useRef(new Map<string, any[]>());
+  const [changeSeq, setChangeSeq] = useState<number | null>(null);
+
+  const updateCounts = () => {
+    const typeCount: Record<string, number> = {};
+    const statusCount: Record<string, number> = {
+      validated: 0,
+      unvalidated: 0,
+      healthy: 0,
+    };
+
+    byImageRef.current.forEach((detections) => {
+      detections.forEach((det: Detection) => {
+        typeCount[det.defect_type] =
+          (typeCount[det.defect_type] || 0) + 1;
+
+        if (det.status === "validated") statusCount.validated++;
+        else if (det.status === "healthy") statusCount.healthy++;
+        else statusCount.unvalidated++;
+      });
+    });
+
+    // Sort descending
+    const sortedDefects = Object.entries(typeCount)
+      .map(([name, value]) => ({ name, value }))
+      .sort((a, b) => b.value - a.value);
+
+    const sortedStatus = Object.entries(statusCount)
+      .map(([name, value]) => ({
+        name: name.charAt(0).toUpperCase() + name.slice(1),
+        value,
+      }))
+      .sort((a, b) => b.value - a.value);
+
+    setDefectCounts(sortedDefects);
+    setValidationStatus(sortedStatus);
+  };
+
+  const loadMetadata = () => {
+    // Only the fields the charts use
+    fetch("http://localhost:8000/metadata?fields=uploaded_img,detections&detection_fields=id,defect_type,status", { cache: "no-cache" })
+      .then(async (res) => {
+        const data = await res.json();
+        byImageRef.current = new Map(
+          (Array.isArray(data) ? data : []).map((item: any): [string, any[]] => [item.uploaded_img, item.detections ?? []])
+        );
+        updateCounts();
+        setChangeSeq(changeSeqOf(res));
       });
+  };
+
+  useEffect(() => {
+    loadMetadata();
   }, []);
 
+  useChangeFeed(changeSeq, (event) => {
+    const result = applyChangeToDetections(byImageRef.current, event);
+    if (result === "reload") loadMetadata();
+    else if (result === "changed") updateCounts();
+  });
+
   const chartData = selectedData === "defect" ? defectCounts : validationStatus;
 
   return (
@@ -1,6 +1,7 @@
 // src/pages/SummaryPage.tsx
-import React, { useEffect, useState, useMemo } from "react";
+import React, { useEffect, useRef, useState, useMemo } from "react";
 import { Detection, DEFECT_CLASSES } from "../types";
+import { applyChangeToDetections, changeSeqOf, useChangeFeed } from "../hooks/useChangeFeed";
 import { Palette, Eye, EyeOff } from "lucide-react";
 import DashboardPage from "./DashboardPage";
 import { motion, AnimatePresence } from "framer-motion";
@@ -11,30 +12,53 @@ const SummaryPage: React.FC = () => {
   const [showConfidence, setShowConfidence] = useState(false);
   const [showDashboard, setShowDashboard] = useState(false); //toggle for dashboard overlay
 
-  useEffect(() => {
-    fetch("http://localhost:8000/metadata")
-      .then((res) => res.json())
-      .then((data) => {
-        const groups: Record<string, { src: string; confidence: number }[]> = {};
+  // Detections per image, kept current from the change feed
+  const byImageRef = useRef(new Map<string, any[]>());
+  const [changeSeq, setChangeSeq] = useState<number | null>(null);
+
+  const updateGroups = () => {
+    const groups: Record<string, { src: string; confidence: number }[]> = {};
 
-        data.forEach((item: any) => {
-          item.detections.forEach((det: Detection) => {
-            const type = det.defect_type.replace(/\s+/g, "");
-            if (!groups[type]) groups[type] = [];
-            if (det.crop_path) {
-              groups[type].push({
-                src: "/" + det.crop_path.replace(/\\/g, "/"),
-                confidence: det.confidence,
-              });
-            }
+    byImageRef.current.forEach((detections) => {
+      detections.forEach((det: Detection) => {
+        const type = det.defect_type.replace(/\s+/g, "");
+        if (!groups[type]) groups[type] = [];
+        if (det.crop_path) {
+          groups[type].push({
+            src: `http://localhost:8000/${det.crop_path.replace(/\\/g, "/")}?size=256`,
+            confidence: det.confidence,
           });
-        });
+        }
+      });
+    });
+
+    setGroupedCrops(groups);
+  };
 
-        setGroupedCrops(groups);
+  const loadMetadata = () => {
+    // Only the fields the crop gallery uses
+    fetch("http://localhost:8000/metadata?fields=uploaded_img,detections&detection_fields=id,defect_type,confidence,crop_path", { cache: "no-cache" })
+      .then(async (res) => {
+        const data = await res.json();
+        byImageRef.current = new Map(
+          (Array.isArray(data) ? data : []).map((item: any): [string, any[]] => [item.uploaded_img, item.detections ?? []])
+        );
+        updateGroups();
+        setChangeSeq(changeSeqOf(res));
       })
       .catch((err) => console.error("Failed to fetch metadata", err));
+  };
+
+  useEffect(() => {
+    loadMetadata();
   }, []);
 
+  useChangeFeed(changeSeq, (event) => {
+    const result = applyChangeToDetections(byImageRef.current, event);
+    if (result === "reload") loadMetadata();
+    else if (result === "changed") updateGroups();
+  });
+
   // Sort DEFECT_CLASSES by count in groupedCrops
   const sortedClasses = useMemo(() => {
     return [...DEFECT_CLASSES].sort((a, b) => {
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import { ImageViewer } from '../components/ImageViewer';
 import { ValidationControls } from '../components/ValidationControls';
 import { ProgressBar } from '../components/ProgressBar';
@@ -20,30 +20,25 @@ export const ValidationPage: React.FC = () => {
     moveToNextImage,
     moveToPrevImage,
     goToImage,
+    goToMostUncertain,
     getImageCount,
     currentImageIndex,
     windowData
   } = useDetectionData();
 
-  const [cacheBust, setCacheBust] = useState(Date.now());
   const [jumpIndex, setJumpIndex] = useState<number | ''>('');
   const [showAltView, setShowAltView] = useState(false);
 
   // Placeholder handling
   const PLACEHOLDER_IMAGE = { name: "placeholder.jpg", path: "https://i.pinimg.com/736x/d4/71/c4/d471c4befa7ec4053d9eaf8e1034b870.jpg"};
-  const PLACEHOLDER_DETECTION: Detection = { defect_id: 0, defect_type: "x", confidence: 0, bbox: [0, 0, 0, 0], status: "placeholder", crop_path: PLACEHOLDER_IMAGE.path };
+  const PLACEHOLDER_DETECTION: Detection = { id: 0, defect_id: 0, defect_type: "x", confidence: 0, bbox: [0, 0, 0, 0], status: "placeholder", crop_path: PLACEHOLDER_IMAGE.path };
   const isUsingPlaceholder = windowData.length === 0;
 
-  // regenerate cacheBust whenever dataset or index changes
-  useEffect(() => {
-    setCacheBust(Date.now());
-  }, [windowData, currentImageIndex]);
-
-  // Current image + cache bust
+  // Current image + size-bucketed previews (the server revalidates them by ETag, so no cache busting)
   const currentImage = getCurrentImage();
-  const imageSrc = (currentImage?.processed_img || PLACEHOLDER_IMAGE.path) + `?t=${cacheBust}`;
+  const imageSrc = currentImage?.processed_img ? `${currentImage.processed_img}?size=1280` : PLACEHOLDER_IMAGE.path;
   const cropPath = getCurrentCropPath();
-  const cropSrc = (cropPath || PLACEHOLDER_IMAGE.path) + `?t=${cacheBust}`;
+  const cropSrc = cropPath ? `${cropPath}?size=640` : PLACEHOLDER_IMAGE.path;
   const currentDetection = isUsingPlaceholder ? PLACEHOLDER_DETECTION : getCurrentDetection();
 
   const AltMainContent: React.FC = () => {
@@ -94,6 +89,15 @@ export const ValidationPage: React.FC = () => {
               <SkipForward size={16} />
             </button>
 
+            {/* Most uncertain (server-ranked) */}
+            <button
+              onClick={goToMostUncertain}
+              className="flex items-center gap-1 bg-amber-500 hover:bg-amber-600 text-white px-3 py-2 rounded-lg text-sm font-medium shadow-md hover:shadow-lg"
+              title="Jump to the detection the model is least sure about"
+            >
+              Most Uncertain
+            </button>
+
             {/* Jump to Image */}
             <div className="flex items-center gap-2">
               <input
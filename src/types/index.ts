@@ -6,6 +6,7 @@ export interface ImageData {
 }
 
 export interface Detection {
+  id: number; // server-side row id, stable across edits
   defect_id: number;
   defect_type: string;
   confidence: number; 
@@ -1,4 +1,9 @@
+import importlib.util
+import logging
 import os
+import queue
+import shutil
+import threading
 import cv2
 import tkinter as tk
 from tkinter import ttk
@@ -6,6 +11,21 @@ from ultralytics import YOLO
 from PIL import Image, ImageTk
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+
+def _load_backend_module(name):
+    # Box utilities are shared with the backend; loaded from its file so sys.path is left alone
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend", f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+box_ops = _load_backend_module("box_ops")
+confidence_band, nms, pad_boxes = box_ops.confidence_band, box_ops.nms, box_ops.pad_boxes
+
 # ----------------------------
 # CONFIG
 # ----------------------------
@@ -13,6 +33,10 @@ MODEL_PATH = "best0331.pt"
 TEST_IMAGES_DIR = "test_images"
 OUTPUT_DATA_DIR = "defect_data/train"
 CONF_LOW, CONF_HIGH = 0.1, 0.5
+NMS_IOU = 0.3      # overlapping detections (any class) are reviewed once
+CROP_PADDING = 50  # px around the box in the review crop
+PREFETCH_IMAGES = 3  # images inferred and prepared ahead of the reviewer
+DISPLAY_SIZE = (500, 500)
 CLASSES = ['BrownSpot', 'Browning', 'BurnedTip', 'Curling', 'Purpling', 'Wilting', 'Yellowing']
 
 # Ensure output dirs exist
@@ -22,91 +46,14 @@ os.makedirs(os.path.join(OUTPUT_DATA_DIR, "labels"), exist_ok=True)
 # Load YOLO model
 model = YOLO(MODEL_PATH)
 
-# ----------------------------
-# Global GUI State
-# ----------------------------
-current_img = None
-current_bbox = None
-current_label = None   # detected label + confidence
-current_cls_id = None
-
-root = None
-panel = None
-dropdown = None
-save_labels = []       # list of YOLO formatted labels for current image
-save_img_path = None
-label_file_path = None
-orig_h, orig_w = 0, 0
-
-
-def save_decision(label_text):
-    """Save validated bbox into label list for current image"""
-    global current_img, current_bbox, save_labels, root, orig_h, orig_w, current_cls_id
-
-    if current_img is None or current_bbox is None:
-        return
-
-    # If user marks as healthy, skip writing a label entirely.
-    if label_text == "healthy":
-        root.destroy()   # keep your existing behavior
-        return
-
-    # Determine class_id
-    if label_text == "correct defect":
-        # Use the original predicted class id
-        class_id = current_cls_id if current_cls_id is not None else 0
-    else:
-        # "Other defect" selected from dropdown -> map name to id
-        try:
-            class_id = CLASSES.index(label_text)
-        except ValueError:
-            # Fallback: if not found, skip to avoid corrupt labels
-            root.destroy()
-            return
-
-    # Compute normalized YOLO bbox (relative to the ORIGINAL image)
-    x1, y1, x2, y2 = current_bbox
-    xc = ((x1 + x2) / 2) / orig_w
-    yc = ((y1 + y2) / 2) / orig_h
-    bw = (x2 - x1) / orig_w
-    bh = (y2 - y1) / orig_h
-
-    save_labels.append(f"{class_id} {xc:.6f} {yc:.6f} {bw:.6f} {bh:.6f}\n")
-
-    # Keep your current flow (close window after each decision)
-    root.destroy()
-
-
-def decision_correct():
-    save_decision("correct defect")
+_DONE = object()  # end-of-stream marker for both queues
 
 
-def decision_healthy():
-    save_decision("healthy")
-
-
-def decision_other():
-    global dropdown
-    save_decision(dropdown.get())
-
-
-def show_image(orig_img, crop_img, bbox, label_info, progress_text, conf, cls_id):
-    """Show overall image (with bbox) + crop in Tkinter with detection label + decision buttons"""
-    global root, panel, dropdown, current_img, current_bbox, current_label, current_cls_id, content_frame, dropdown
-
-    current_img = orig_img
-    current_bbox = bbox
-    current_label = label_info
-    current_cls_id = cls_id
-
-    root = tk.Tk()
-    root.title("Human-in-the-Loop Validation")
-    root.geometry("1320x750")  # enough for 2x640 images side by side
-
-    # Show header (progress + file info)
-    tk.Label(root, text=progress_text, font=("Arial", 12, "bold")).pack(pady=5)
-
-    # --- Left: overall image with bbox ---
+# ----------------------------
+# Producer: inference + display preparation, K images ahead
+# ----------------------------
+def render_overlay(orig_img, bbox, label_info, conf):
+    """Overall image with the bbox and its label drawn above it, resized for display (RGB)"""
     overall = orig_img.copy()
     x1, y1, x2, y2 = bbox
     # Draw thicker rectangle (bbox) - thickness = 6 for bolder lines
@@ -118,7 +65,7 @@ def show_image(orig_img, crop_img, bbox, label_info, progress_text, conf, cls_id
     font_scale = 1
     font_thickness = 3
     (text_w, text_h), baseline = cv2.getTextSize(label_text, font, font_scale, font_thickness)
-    
+
     # Draw background rectangle for text (above bbox)
     cv2.rectangle(
         overall,
@@ -138,119 +85,243 @@ def show_image(orig_img, crop_img, bbox, label_info, progress_text, conf, cls_id
         font_thickness,
         lineType=cv2.LINE_AA
     )
-    
-    # Resize for display
-    overall = cv2.resize(overall, (500, 500))
-    overall = cv2.cvtColor(overall, cv2.COLOR_BGR2RGB)
-    overall_imgtk = ImageTk.PhotoImage(image=Image.fromarray(overall))
-
-    # --- Right: cropped region only ---
-    disp_img = cv2.resize(crop_img, (500, 500))
-    disp_img = cv2.cvtColor(disp_img, cv2.COLOR_BGR2RGB)
-    disp_imgtk = ImageTk.PhotoImage(image=Image.fromarray(disp_img))
-
-    # Frame for side-by-side display
-    img_frame = tk.Frame(root)
-    img_frame.pack()
-
-    panel_left = tk.Label(img_frame, image=overall_imgtk)
-    panel_left.image = overall_imgtk
-    panel_left.pack(side="left", padx=10, pady=10)
-
-    panel_right = tk.Label(img_frame, image=disp_imgtk)
-    panel_right.image = disp_imgtk
-    panel_right.pack(side="right", padx=10, pady=10)
-
-    # Show detection label
-    tk.Label(root, text=f"Detected: {label_info}", font=("Arial", 12)).pack(pady=5)
-
-    # Buttons
-    btn_frame = tk.Frame(root)
-    btn_frame.pack(pady=10)
-
-    tk.Button(btn_frame, text="Correct Defect", command=decision_correct, width=20).grid(row=0, column=0, padx=5)
-    tk.Button(btn_frame, text="Healthy", command=decision_healthy, width=20).grid(row=0, column=1, padx=5)
-
-    tk.Label(root, text="Other Defect:").pack()
-    dropdown = ttk.Combobox(root, values=CLASSES, state="readonly")
-    dropdown.pack()
-    dropdown.set(CLASSES[0])
-    tk.Button(root, text="Confirm Other Defect", command=decision_other, width=25).pack(pady=5)
-
-    root.mainloop()
-
-
-def process_images():
-    global save_labels, save_img_path, label_file_path, orig_h, orig_w
 
+    overall = cv2.resize(overall, DISPLAY_SIZE)
+    return Image.fromarray(cv2.cvtColor(overall, cv2.COLOR_BGR2RGB))
+
+
+def prepare_image(img_path, image_name, progress_text):
+    """Runs the model on one image and prepares everything the reviewer will see for it.
+    Returns None if no detection falls in the review band."""
+    results = model(img_path, conf=CONF_LOW)  # run detection
+    orig_img = cv2.imread(img_path)
+    orig_h, orig_w = orig_img.shape[:2]
+
+    boxes = np.concatenate([r.boxes.xyxy.cpu().numpy() for r in results]).astype(int)
+    confs = np.concatenate([r.boxes.conf.cpu().numpy() for r in results])
+    cls_ids = np.concatenate([r.boxes.cls.cpu().numpy() for r in results]).astype(int)
+
+    # Only the uncertain band goes to review, then overlaps are suppressed (highest conf kept)
+    band = confidence_band(confs, CONF_LOW, CONF_HIGH)
+    boxes, confs, cls_ids = boxes[band], confs[band], cls_ids[band]
+    keep = nms(boxes, confs, NMS_IOU)
+    if len(keep) == 0:
+        return None
+    crop_boxes = pad_boxes(boxes[keep], CROP_PADDING, orig_w, orig_h).astype(int)
+
+    detections = []
+    for bbox, (x1, y1, x2, y2), conf, cls_id in zip(boxes[keep], crop_boxes, confs[keep], cls_ids[keep]):
+        label_name = CLASSES[cls_id] if cls_id < len(CLASSES) else "Unknown"
+        label_info = f"{label_name} ({conf:.2f})"
+        crop = cv2.resize(orig_img[y1:y2, x1:x2], DISPLAY_SIZE)
+        detections.append({
+            "bbox": tuple(int(v) for v in bbox),
+            "cls_id": int(cls_id),
+            "label_info": label_info,
+            "overlay": render_overlay(orig_img, tuple(int(v) for v in bbox), label_info, float(conf)),
+            "crop": Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)),
+        })
+
+    return {
+        "image_name": image_name,
+        "img_path": img_path,
+        "size": (orig_w, orig_h),
+        "progress_text": progress_text,
+        "detections": detections,
+    }
+
+
+def produce(review_queue):
+    """Background thread: fills review_queue (bounded, so at most PREFETCH_IMAGES ahead)"""
     all_files = [f for f in os.listdir(TEST_IMAGES_DIR) if f.lower().endswith((".jpg", ".jpeg", ".png"))]
     total_images = len(all_files)
 
-    for idx, image_name in enumerate(all_files, start=1):
-        img_path = os.path.join(TEST_IMAGES_DIR, image_name)
+    try:
+        for idx, image_name in enumerate(all_files, start=1):
+            img_path = os.path.join(TEST_IMAGES_DIR, image_name)
+            try:
+                item = prepare_image(img_path, image_name, f"Image {idx}/{total_images} - {image_name}")
+            except Exception as e:
+                logger.warning(f"Skipping {image_name}: {e}")
+                continue
+            if item is not None:
+                review_queue.put(item)
+    finally:
+        review_queue.put(_DONE)
+
+
+# ----------------------------
+# Writer: label files and image copies, off the GUI thread
+# ----------------------------
+def write_labels(write_queue):
+    while True:
+        job = write_queue.get()
+        if job is _DONE:
+            return
+        img_path, image_name, labels = job
+        try:
+            # The reviewed image is unchanged, so copy the file instead of re-encoding it
+            shutil.copyfile(img_path, os.path.join(OUTPUT_DATA_DIR, "images", image_name))
+            label_file_path = os.path.join(OUTPUT_DATA_DIR, "labels", os.path.splitext(image_name)[0] + ".txt")
+            with open(label_file_path, "w") as f:
+                f.writelines(labels)
+        except Exception as e:
+            logger.error(f"Failed to save labels for {image_name}: {e}")
 
-        results = model(img_path, conf=CONF_LOW)  # run detection
-        orig_img = cv2.imread(img_path)
-        orig_h, orig_w = orig_img.shape[:2]
 
-        # Prepare save paths
-        save_img_path = os.path.join(OUTPUT_DATA_DIR, "images", image_name)
-        label_file_path = os.path.join(
-            OUTPUT_DATA_DIR, "labels", os.path.splitext(image_name)[0] + ".txt"
-        )
+# ----------------------------
+# Reviewer: one persistent window
+# ----------------------------
+class ReviewWindow:
+    def __init__(self, review_queue, write_queue):
+        self.review_queue = review_queue
+        self.write_queue = write_queue
+        self.item = None          # image under review
+        self.index = 0            # detection under review within self.item
+        self.save_labels = []     # list of YOLO formatted labels for current image
+
+        self.root = tk.Tk()
+        self.root.title("Human-in-the-Loop Validation")
+        self.root.geometry("1320x750")  # enough for 2x640 images side by side
+
+        # Show header (progress + file info)
+        self.header = tk.Label(self.root, text="Loading...", font=("Arial", 12, "bold"))
+        self.header.pack(pady=5)
+
+        # Frame for side-by-side display: overall image with bbox, cropped region only
+        img_frame = tk.Frame(self.root)
+        img_frame.pack()
+        self.panel_left = tk.Label(img_frame)
+        self.panel_left.pack(side="left", padx=10, pady=10)
+        self.panel_right = tk.Label(img_frame)
+        self.panel_right.pack(side="right", padx=10, pady=10)
+
+        # Show detection label
+        self.detected = tk.Label(self.root, text="", font=("Arial", 12))
+        self.detected.pack(pady=5)
+
+        # Buttons
+        btn_frame = tk.Frame(self.root)
+        btn_frame.pack(pady=10)
+        self.buttons = [
+            tk.Button(btn_frame, text="Correct Defect", command=self.decision_correct, width=20),
+            tk.Button(btn_frame, text="Healthy", command=self.decision_healthy, width=20),
+        ]
+        self.buttons[0].grid(row=0, column=0, padx=5)
+        self.buttons[1].grid(row=0, column=1, padx=5)
+
+        tk.Label(self.root, text="Other Defect:").pack()
+        self.dropdown = ttk.Combobox(self.root, values=CLASSES, state="readonly")
+        self.dropdown.pack()
+        self.dropdown.set(CLASSES[0])
+        self.buttons.append(tk.Button(self.root, text="Confirm Other Defect", command=self.decision_other, width=25))
+        self.buttons[-1].pack(pady=5)
+
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.set_enabled(False)
+
+    def set_enabled(self, enabled):
+        for button in self.buttons:
+            button.configure(state="normal" if enabled else "disabled")
+
+    def next_image(self):
+        # Normally the next image is already waiting; if the model fell behind, poll without blocking Tk
+        try:
+            item = self.review_queue.get_nowait()
+        except queue.Empty:
+            self.set_enabled(False)
+            self.detected.configure(text="Waiting for the model...")
+            self.root.after(50, self.next_image)
+            return
+        if item is _DONE:
+            self.close()
+            return
+        self.item, self.index, self.save_labels = item, 0, []
+        self.show_detection()
+
+    def show_detection(self):
+        detection = self.item["detections"][self.index]
+        # PhotoImages must be created on the Tk thread; the pixels were prepared by the producer
+        overall_imgtk = ImageTk.PhotoImage(image=detection["overlay"])
+        disp_imgtk = ImageTk.PhotoImage(image=detection["crop"])
+        self.panel_left.configure(image=overall_imgtk)
+        self.panel_left.image = overall_imgtk
+        self.panel_right.configure(image=disp_imgtk)
+        self.panel_right.image = disp_imgtk
+        self.header.configure(text=self.item["progress_text"])
+        self.detected.configure(text=f"Detected: {detection['label_info']}")
+        self.set_enabled(True)
+
+    def save_decision(self, label_text):
+        """Save validated bbox into label list for current image"""
+        if self.item is None:
+            return
+        detection = self.item["detections"][self.index]
+
+        # If user marks as healthy, skip writing a label entirely.
+        class_id = None
+        if label_text == "correct defect":
+            # Use the original predicted class id
+            class_id = detection["cls_id"]
+        elif label_text != "healthy" and label_text in CLASSES:
+            # "Other defect" selected from dropdown -> map name to id
+            class_id = CLASSES.index(label_text)
 
-        save_labels = []  # reset for this image
+        if class_id is not None:
+            # Compute normalized YOLO bbox (relative to the ORIGINAL image)
+            orig_w, orig_h = self.item["size"]
+            x1, y1, x2, y2 = detection["bbox"]
+            xc = ((x1 + x2) / 2) / orig_w
+            yc = ((y1 + y2) / 2) / orig_h
+            bw = (x2 - x1) / orig_w
+            bh = (y2 - y1) / orig_h
+            self.save_labels.append(f"{class_id} {xc:.6f} {yc:.6f} {bw:.6f} {bh:.6f}\n")
+
+        self.index += 1
+        if self.index < len(self.item["detections"]):
+            self.show_detection()
+            return
 
-        detections = []  # store detections first
+        # Save only if at least one validated bbox
+        if self.save_labels:
+            self.write_queue.put((self.item["img_path"], self.item["image_name"], self.save_labels))
+        self.item = None
+        self.next_image()
 
-        for r in results:
-            for box in r.boxes:
-                conf = float(box.conf[0])
-                if CONF_LOW < conf < CONF_HIGH:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    cls_id = int(box.cls[0])
-                    label_name = CLASSES[cls_id] if cls_id < len(CLASSES) else "Unknown"
-                    detections.append([x1, y1, x2, y2, conf, cls_id, label_name])
+    def decision_correct(self):
+        self.save_decision("correct defect")
 
-        # --- Apply custom NMS (IoU > 0.8 suppression) ---
-        detections = sorted(detections, key=lambda x: x[4], reverse=True)  # sort by confidence
-        final_detections = []
+    def decision_healthy(self):
+        self.save_decision("healthy")
 
-        def iou(box1, box2):
-            x1 = max(box1[0], box2[0])
-            y1 = max(box1[1], box2[1])
-            x2 = min(box1[2], box2[2])
-            y2 = min(box1[3], box2[3])
+    def decision_other(self):
+        self.save_decision(self.dropdown.get())
 
-            inter_area = max(0, x2 - x1) * max(0, y2 - y1)
-            box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
-            box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
-            union_area = box1_area + box2_area - inter_area
+    def close(self):
+        self.root.destroy()
 
-            return inter_area / union_area if union_area > 0 else 0
+    def run(self):
+        self.next_image()
+        self.root.mainloop()
 
-        while detections:
-            best = detections.pop(0)  # take highest conf
-            final_detections.append(best)
-            detections = [d for d in detections if iou(best, d) < 0.3]  # suppress overlaps > 80%
 
-        # --- Process final detections ---
-        for x1, y1, x2, y2, conf, cls_id, label_name in final_detections:
-            label_info = f"{label_name} ({conf:.2f})"
+def process_images():
+    review_queue = queue.Queue(maxsize=PREFETCH_IMAGES)
+    write_queue = queue.Queue()
 
-            # Add 50px padding
-            x1, y1 = max(0, x1 - 50), max(0, y1 - 50)
-            x2, y2 = min(orig_img.shape[1], x2 + 50), min(orig_img.shape[0], y2 + 50)
-            crop = orig_img[y1:y2, x1:x2]
+    # Daemon producer: closing the window mid-review shouldn't wait for the rest of the folder
+    threading.Thread(target=produce, args=(review_queue,), daemon=True).start()
+    writer = threading.Thread(target=write_labels, args=(write_queue,))
+    writer.start()
 
-            progress_text = f"Image {idx}/{total_images} - {image_name}"
-            show_image(orig_img, crop, (x1, y1, x2, y2), label_info, progress_text, conf, cls_id)
+    try:
+        ReviewWindow(review_queue, write_queue).run()
+    finally:
+        # Every decided image gets written before exiting
+        write_queue.put(_DONE)
+        writer.join()
 
-        # Save only if at least one validated bbox
-        if save_labels:
-            cv2.imwrite(save_img_path, orig_img)
-            with open(label_file_path, "w") as f:
-                f.writelines(save_labels)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     process_images()